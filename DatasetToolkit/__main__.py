@@ -0,0 +1,219 @@
+# DatasetToolkit/__main__.py
+"""
+Headless entry point for the DatasetToolkit pipelines.
+
+Usage (from the repository root):
+    python -m DatasetToolkit run pipeline.yaml
+    python -m DatasetToolkit run pipeline.json --workers 8 --stats-file stats.json
+    python -m DatasetToolkit steps
+
+The tools' progress output goes to stderr. stdout only receives one JSON
+object with the run's timing and throughput stats, so the command can be
+used from cron or a cluster scheduler and its output parsed directly.
+
+Config keys (YAML needs PyYAML; JSON always works). Relative paths are
+resolved against the config file's folder.
+
+    pipeline: processing          # or "pretraining"
+    input: data/chats.json        # a file, or a folder of .txt for pretraining
+    steps: [1, 2, 3, "Deslop Tool"]   # numbers or step names
+    output_prefix: cleaned_       # processing: prefix of the final file
+    output_name: corpus           # pretraining: base name of the output files
+    deslop:
+      filter_file: f.txt
+      threshold: 1.5              # optional
+      report_file: slop_report.csv   # optional per-phrase statistics (.json or .csv)
+      normalize: true             # ignore case, apostrophe style and whitespace
+    trim:                         # step 12, needs transformers
+      model_path: meta-llama/Llama-3.3-70B-Instruct   # a local folder or a hub name
+      max_length: 8192
+      report_file: lengths.json   # optional token-length histogram (.json or .csv)
+    execution:
+      fused: true
+      workers: 8
+      keep_intermediate: false
+      cache: true
+      cache_dir: /scratch/stage_cache   # optional
+      resume: true
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from pathlib import Path
+
+# The tools import each other as "tools.X", like they do when gui_app.py runs.
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from tools.pipeline import PROCESSING_STEPS, PRETRAINING_STEPS, run_processing_pipeline, run_pretraining_pipeline
+
+CONFIG_KEYS = {"pipeline", "input", "steps", "output_prefix", "output_name", "deslop", "trim", "execution"}
+EXECUTION_KEYS = {"fused", "workers", "keep_intermediate", "cache", "cache_dir", "resume"}
+DESLOP_KEYS = {"filter_file", "threshold", "report_file", "normalize"}
+TRIM_KEYS = {"model_path", "max_length", "report_file"}
+
+
+def load_config(config_path):
+    """Reads a YAML or JSON pipeline config and checks its keys."""
+    config_path = Path(config_path)
+    with open(config_path, 'r', encoding='utf-8') as f:
+        if config_path.suffix.lower() in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("Reading a YAML config requires PyYAML (pip install pyyaml), or use a .json config.")
+            config = yaml.safe_load(f)
+        else:
+            config = json.load(f)
+
+    if not isinstance(config, dict):
+        raise ValueError(f"'{config_path}' must contain a mapping of config keys.")
+    for section, allowed in ((config, CONFIG_KEYS), (config.get("execution") or {}, EXECUTION_KEYS),
+                             (config.get("deslop") or {}, DESLOP_KEYS), (config.get("trim") or {}, TRIM_KEYS)):
+        unknown = set(section) - allowed
+        if unknown:
+            raise ValueError(f"Unknown config key(s): {', '.join(sorted(unknown))}")
+    if "input" not in config:
+        raise ValueError("The config needs an 'input' path.")
+    return config
+
+
+def resolve_steps(steps, step_definitions):
+    """Turns a list of step numbers and/or step names into step numbers."""
+    by_name = {info["name"].lower(): num for num, info in step_definitions.items()}
+    step_nums = []
+    for step in steps:
+        if isinstance(step, int):
+            num = step
+        elif isinstance(step, str) and step.strip().isdigit():
+            num = int(step)
+        elif isinstance(step, str) and step.strip().lower() in by_name:
+            num = by_name[step.strip().lower()]
+        else:
+            raise ValueError(f"Unknown pipeline step: {step!r}")
+        if num not in step_definitions:
+            raise ValueError(f"Unknown pipeline step: {step!r}")
+        step_nums.append(num)
+    return step_nums
+
+
+def _resolve_path(value, base_dir):
+    if value is None:
+        return None
+    path = Path(os.path.expanduser(str(value)))
+    return str(path if path.is_absolute() else base_dir / path)
+
+
+def _resolve_model_path(value, base_dir):
+    # A model is either a local folder or a hub name like "org/model", which must be kept as it is.
+    if value is None:
+        return None
+    local_path = _resolve_path(value, base_dir)
+    return local_path if Path(local_path).exists() else str(value)
+
+
+def run_from_config(config_path, overrides):
+    """Runs the pipeline described by a config file. Returns the stats dict."""
+    config = load_config(config_path)
+    base_dir = Path(config_path).resolve().parent
+    execution = dict(config.get("execution") or {})
+    execution.update({key: value for key, value in overrides.items() if value is not None})
+    deslop = config.get("deslop") or {}
+    trim = config.get("trim") or {}
+    pipeline_name = config.get("pipeline", "processing")
+    input_path = _resolve_path(config["input"], base_dir)
+
+    stage_stats = []
+    stats = {"config": str(Path(config_path).resolve()), "pipeline": pipeline_name, "input": input_path,
+             "stages": stage_stats}
+    start = time.perf_counter()
+    if pipeline_name == "processing":
+        # Without a model, "all steps" means all steps but Trim Long Samples.
+        default_steps = [n for n in PROCESSING_STEPS if n != 12 or trim.get("model_path")]
+        steps = resolve_steps(config.get("steps") or default_steps, PROCESSING_STEPS)
+        workers = int(execution.get("workers", 1))
+        stats["execution"] = {"fused": bool(execution.get("fused", False)), "workers": workers,
+                              "cache": bool(execution.get("cache", False)), "resume": bool(execution.get("resume", False))}
+        stats["final_output"] = run_processing_pipeline(
+            initial_input_file=input_path,
+            steps_to_run=steps,
+            deslop_filter_file=_resolve_path(deslop.get("filter_file"), base_dir),
+            deslop_threshold=deslop.get("threshold"),
+            deslop_report_file=_resolve_path(deslop.get("report_file"), base_dir),
+            deslop_normalize=bool(deslop.get("normalize", False)),
+            trim_model_path=_resolve_model_path(trim.get("model_path"), base_dir),
+            trim_max_length=int(trim.get("max_length", 8192)),
+            trim_report_file=_resolve_path(trim.get("report_file"), base_dir),
+            output_prefix=config.get("output_prefix", ""),
+            fused=bool(execution.get("fused", False)),
+            keep_intermediate=bool(execution.get("keep_intermediate", False)),
+            workers=workers,
+            use_cache=bool(execution.get("cache", False)),
+            cache_dir=_resolve_path(execution.get("cache_dir"), base_dir),
+            resume=bool(execution.get("resume", False)),
+            stage_stats=stage_stats,
+        )
+    elif pipeline_name == "pretraining":
+        steps = resolve_steps(config.get("steps") or list(PRETRAINING_STEPS), PRETRAINING_STEPS)
+        stats["final_output"] = run_pretraining_pipeline(
+            initial_input_folder=input_path,
+            steps_to_run=steps,
+            output_filename_base=config.get("output_name", Path(input_path).name),
+            stage_stats=stage_stats,
+        )
+    else:
+        raise ValueError(f"Unknown pipeline '{pipeline_name}' (expected 'processing' or 'pretraining').")
+
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    if stage_stats and stage_stats[0].get("input_bytes") and stats["seconds"] > 0:
+        stats["input_mb_per_second"] = round(stage_stats[0]["input_bytes"] / stats["seconds"] / 1024 ** 2, 2)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m DatasetToolkit", description="Run DatasetToolkit pipelines without the GUI.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the pipeline described by a YAML/JSON config file.")
+    run_parser.add_argument("config", help="Path to the pipeline config file.")
+    run_parser.add_argument("--workers", type=int, default=None, help="Override execution.workers.")
+    run_parser.add_argument("--fused", action=argparse.BooleanOptionalAction, default=None, help="Override execution.fused.")
+    run_parser.add_argument("--cache", action=argparse.BooleanOptionalAction, default=None, help="Override execution.cache.")
+    run_parser.add_argument("--resume", action=argparse.BooleanOptionalAction, default=None, help="Override execution.resume.")
+    run_parser.add_argument("--stats-file", default=None, help="Also write the JSON stats to this file.")
+
+    subparsers.add_parser("steps", help="List the available pipeline steps.")
+    args = parser.parse_args()
+
+    if args.command == "steps":
+        for title, definitions in (("processing", PROCESSING_STEPS), ("pretraining", PRETRAINING_STEPS)):
+            print(f"{title}:")
+            for num, info in definitions.items():
+                print(f"  {num:>2}  {info['name']}")
+        return 0
+
+    overrides = {"workers": args.workers, "fused": args.fused, "cache": args.cache, "resume": args.resume}
+    exit_code = 0
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            stats = run_from_config(args.config, overrides)
+        stats["status"] = "ok"
+    except Exception as e:
+        print(f"--- PIPELINE FAILED: {e} ---", file=sys.stderr)
+        stats = {"config": args.config, "status": "failed", "error": str(e)}
+        exit_code = 1
+
+    output = json.dumps(stats, ensure_ascii=False)
+    print(output)
+    if args.stats_file:
+        with open(args.stats_file, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    return exit_code
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,105 @@
+# benchmarks/bench_cleanup_text.py
+"""
+Checks the fused cleanup_text kernel against the original rule-by-rule implementation and times both.
+
+The golden check runs both implementations on randomly assembled strings made
+of the fragments the rules care about (dividers, scene markers, asterisks,
+whitespace and line breaks) and on synthetic roleplay turns, and fails on the
+first difference.
+
+Usage (from the DatasetToolkit folder):
+    python benchmarks/bench_cleanup_text.py --cases 200000 --turns 100000
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from tools.cleanup_text import cleanup_turn_text
+
+
+def reference_cleanup_turn_text(value):
+    """The original cleanup_text_in_jsonl rules, applied one after the other."""
+    if re.compile(r"^[\s\n]*[\w\s]+:[\s\n]*$", re.IGNORECASE).match(value):
+        return None
+    value = re.sub(r"(\n\s*)*(\*\*Scene:\*\*|'Scene:')\s*(\n\s*)*", '\n\n', value, flags=re.IGNORECASE)
+    value = re.sub(r'(\n\s*)*-- end character info --\s*(\n\s*)*', '\n\n', value, flags=re.IGNORECASE)
+    value = re.sub(r'(\n\s*)*-{2,}\s*(\n\s*)*', '\n\n', value)
+    value = re.sub(r'^\s*[\*\s]+\s*$', '', value, flags=re.MULTILINE)
+    value = re.sub(r'\*{2,}', '', value)
+    value = re.sub(r'\n(\s*\n){2,}', '\n\n', value)
+    return value.strip()
+
+
+FRAGMENTS = ["\n", "\n", " ", "\t", "\r\n", "\n  \n", "\xa0", " ", "-", "--", "---", "**Scene:**", "**SCENE:**",
+             "'scene:'", "Scene:", "-- END character info --", "-- end character info --", " end character info --",
+             "*", "**", "***", "word", "x", ":", "'", "Firestorm:"]
+WORDS = ["the", "storm", "she", "whispered", "softly", "and", "a", "of", "*smiles*", "\"Hello,\"", "ozone", "light",
+         "through", "window", "her", "his", "voice", "was", "to", "in", "that", "it", "with", "eyes"]
+
+
+def fuzz_cases(num_cases, seed=0):
+    rng = random.Random(seed)
+    for _ in range(num_cases):
+        yield "".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 14)))
+
+
+def synthetic_turns(num_turns, seed=0):
+    """Roleplay-like turns: mostly prose, sometimes with the markup the rules remove."""
+    rng = random.Random(seed)
+    turns = []
+    for _ in range(num_turns):
+        paragraphs = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 120)))
+                      for _ in range(rng.randint(1, 6))]
+        roll = rng.random()
+        if roll < 0.05:
+            paragraphs.insert(rng.randrange(len(paragraphs) + 1), "**Scene:**")
+        elif roll < 0.10:
+            paragraphs.append("-- end character info --\n\n---")
+        elif roll < 0.15:
+            paragraphs[0] = "***" + paragraphs[0] + "***"
+        elif roll < 0.17:
+            paragraphs = ["Firestorm:"]
+        turns.append(rng.choice(["\n\n", "\n", "\n\n\n"]).join(paragraphs))
+    return turns
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--cases", type=int, default=200000, help="Number of random fragment strings to compare.")
+    parser.add_argument("--turns", type=int, default=50000, help="Number of synthetic turns to compare and time.")
+    args = parser.parse_args()
+
+    for case in fuzz_cases(args.cases):
+        expected = reference_cleanup_turn_text(case)
+        actual = cleanup_turn_text(case)
+        if actual != expected:
+            raise SystemExit(f"Mismatch on {case!r}: expected {expected!r}, got {actual!r}")
+    print(f"Golden check: {args.cases:,} fragment strings identical.")
+
+    turns = synthetic_turns(args.turns)
+    reference_seconds, expected = timed(lambda: [reference_cleanup_turn_text(t) for t in turns])
+    fused_seconds, actual = timed(lambda: [cleanup_turn_text(t) for t in turns])
+    if actual != expected:
+        raise SystemExit("Fused kernel output differs from the reference on the synthetic turns.")
+    print(f"Golden check: {args.turns:,} synthetic turns identical.\n")
+
+    size_mb = sum(len(t) for t in turns) / 1024 ** 2
+    print(f"{'implementation':<16}{'seconds':>10}{'MB/s':>10}")
+    print(f"{'reference':<16}{reference_seconds:>10.2f}{size_mb / reference_seconds:>10.1f}")
+    print(f"{'fused':<16}{fused_seconds:>10.2f}{size_mb / fused_seconds:>10.1f}")
+    print(f"\nSpeedup: {reference_seconds / fused_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
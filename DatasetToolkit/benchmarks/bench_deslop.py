@@ -0,0 +1,81 @@
+# benchmarks/bench_deslop.py
+"""
+Compares the Deslop tool's phrase matching with the per-phrase substring scan it replaced.
+
+Builds synthetic gpt turns with filter phrases sprinkled in, then times the
+any-match and per-turn count used by both filtering modes, and checks that
+the PhraseMatcher gives the same answers as the reference scan.
+
+Usage (from the DatasetToolkit folder):
+    python benchmarks/bench_deslop.py --filter-file f.txt --turns 20000
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from tools.DeslopTool import build_matcher, load_filter_criteria
+
+WORDS = ["the", "storm", "she", "whispered", "softly", "and", "a", "of", "*smiles*", "\"Hello,\"", "light",
+         "through", "window", "her", "his", "voice", "was", "to", "in", "that", "it", "with", "eyes"]
+
+
+def reference_contains(text, filter_criteria):
+    return any(phrase in text for phrase in filter_criteria)
+
+
+def reference_count(text, filter_criteria):
+    return sum(1 for phrase in filter_criteria if phrase in text)
+
+
+def synthetic_turns(filter_criteria, num_turns, seed=0):
+    rng = random.Random(seed)
+    turns = []
+    for _ in range(num_turns):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(50, 600))]
+        # Roughly a third of the turns contain at least one filter phrase.
+        for _ in range(rng.choice((0, 0, 1, 3))):
+            words.insert(rng.randrange(len(words) + 1), rng.choice(filter_criteria))
+        turns.append(" ".join(words))
+    return turns
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--filter-file", default="f.txt", help="Phrase list to match (one phrase per line).")
+    parser.add_argument("--turns", type=int, default=20000, help="Number of synthetic gpt turns.")
+    parser.add_argument("--scale", type=int, default=1,
+                        help="Multiply the phrase list with numbered variants to simulate a larger filter list.")
+    args = parser.parse_args()
+
+    filter_criteria = load_filter_criteria([args.filter_file])
+    turns = synthetic_turns(filter_criteria, args.turns)
+    filter_criteria += [f"{phrase} {n}" for n in range(1, args.scale) for phrase in filter_criteria]
+
+    seconds, matcher = timed(lambda: build_matcher(filter_criteria))
+    print(f"{len(filter_criteria):,} phrases, {len(turns):,} turns, matcher backend: {matcher.backend} "
+          f"(built in {seconds:.2f} s)\n")
+
+    print(f"{'task':<14}{'reference s':>14}{'matcher s':>12}{'speedup':>10}")
+    for task, reference, fast in (
+            ("any-match", lambda t: reference_contains(t, filter_criteria), matcher.contains_any),
+            ("count", lambda t: reference_count(t, filter_criteria), matcher.count)):
+        ref_seconds, expected = timed(lambda: [reference(t) for t in turns])
+        fast_seconds, actual = timed(lambda: [fast(t) for t in turns])
+        if actual != expected:
+            raise SystemExit(f"PhraseMatcher {task} results differ from the reference scan.")
+        print(f"{task:<14}{ref_seconds:>14.2f}{fast_seconds:>12.2f}{ref_seconds / fast_seconds:>9.1f}x")
+    print("\nPhraseMatcher results match the reference scan.")
+
+
+if __name__ == "__main__":
+    main()
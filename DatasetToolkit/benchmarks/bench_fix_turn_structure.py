@@ -0,0 +1,127 @@
+# benchmarks/bench_fix_turn_structure.py
+"""
+Checks the single-pass turn segmenter of fix_turn_structure against the original split-and-match pass and times both.
+
+The golden check runs both pass 1 implementations on randomly assembled turns
+made of the markers the segmenter looks for ({user}:, {narrator}:, ooc:,
+"Name:", "Name (Emotion): "...") with blank lines and prose in between, and
+on synthetic roleplay conversations, and fails on the first difference in the
+segments, their roles or the fix count.
+
+Usage (from the DatasetToolkit folder):
+    python benchmarks/bench_fix_turn_structure.py --cases 100000 --conversations 20000
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from tools.fix_turn_structure import pass_1_split_and_normalize
+
+USER_TAG_PATTERN = re.compile(r'^\s*{user}:\s*', re.IGNORECASE)
+NARRATOR_TAG_PATTERN = re.compile(r'^\s*{narrator}:\s*', re.IGNORECASE)
+NAME_DELIMITER_PATTERN = re.compile(r'^\s*[A-Za-z][A-Za-z\s]+:\s*', re.MULTILINE)
+DIALOGUE_PATTERN = re.compile(r'^\s*[A-Za-z\s]+\s*\([^)]+\):\s*".*', re.MULTILINE)
+
+
+def reference_pass_1(conversations):
+    """The original pass 1: one re.split per turn, then up to four matches per segment."""
+    processed_turns = []
+    fixes_made = 0
+    for turn in conversations:
+        original_value = turn.get('value', '').strip()
+        if not original_value:
+            continue
+        split_pattern = (r'\n{2,}(?=(?:{user}:|{narrator}:|ooc:|' + NAME_DELIMITER_PATTERN.pattern + r'|'
+                         + DIALOGUE_PATTERN.pattern + r'))')
+        segments = re.split(split_pattern, original_value, flags=re.IGNORECASE | re.MULTILINE)
+        if len(segments) > 1:
+            fixes_made += len(segments) - 1
+        for segment_text in segments:
+            segment_text = segment_text.strip()
+            if not segment_text:
+                continue
+            role = turn['from']
+            if USER_TAG_PATTERN.match(segment_text):
+                role = 'human'
+                segment_text = USER_TAG_PATTERN.sub('', segment_text).strip()
+            elif (NAME_DELIMITER_PATTERN.match(segment_text) or
+                  DIALOGUE_PATTERN.match(segment_text) or
+                  NARRATOR_TAG_PATTERN.match(segment_text)):
+                role = 'gpt'
+            if segment_text:
+                processed_turns.append({'from': role, 'value': segment_text})
+    return processed_turns, fixes_made
+
+
+FRAGMENTS = ["\n", "\n\n", "\n\n\n", " ", "\t", "\n \n", "{user}:", "{USER}:", "{narrator}:", "{Narrator}: ",
+             "ooc:", "OOC: ", "Firestorm:", "Lady Ash:", " Bob :", "A:", "Firestorm (angry): \"", "Kai (sad):",
+             "(", ")", ":", "\"", "word", "x", "1", "ſ", "K", "\xa0", ".", "*waves*"]
+WORDS = ["the", "storm", "she", "whispered", "softly", "and", "a", "of", "*smiles*", "\"Hello,\"", "ozone", "light",
+         "through", "window", "her", "his", "voice", "was", "to", "in", "that", "it", "with", "eyes"]
+SPEAKERS = ["{user}: ", "{narrator}: ", "OOC: ", "Firestorm: ", "Lady Ash:\n", "Firestorm (grinning): \"", ""]
+
+
+def fuzz_cases(num_cases, seed=0):
+    rng = random.Random(seed)
+    for _ in range(num_cases):
+        value = "".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 16)))
+        yield [{'from': rng.choice(('human', 'gpt')), 'value': value}]
+
+
+def synthetic_conversations(num_conversations, seed=0):
+    """Roleplay-like conversations whose turns sometimes hold several speakers."""
+    rng = random.Random(seed)
+    conversations = []
+    for _ in range(num_conversations):
+        turns = []
+        for index in range(rng.randint(2, 20)):
+            paragraphs = []
+            for _ in range(rng.choice((1, 1, 1, 2, 4))):
+                prose = " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 150)))
+                paragraphs.append(rng.choice(SPEAKERS) + prose)
+            turns.append({'from': 'human' if index % 2 else 'gpt', 'value': "\n\n".join(paragraphs)})
+        conversations.append(turns)
+    return conversations
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--cases", type=int, default=100000, help="Number of random marker turns to compare.")
+    parser.add_argument("--conversations", type=int, default=20000,
+                        help="Number of synthetic conversations to compare and time.")
+    args = parser.parse_args()
+
+    for case in fuzz_cases(args.cases):
+        expected = reference_pass_1(case)
+        actual = pass_1_split_and_normalize(case)
+        if actual != expected:
+            raise SystemExit(f"Mismatch on {case!r}: expected {expected!r}, got {actual!r}")
+    print(f"Golden check: {args.cases:,} marker turns identical.")
+
+    conversations = synthetic_conversations(args.conversations)
+    reference_seconds, expected = timed(lambda: [reference_pass_1(c) for c in conversations])
+    segmenter_seconds, actual = timed(lambda: [pass_1_split_and_normalize(c) for c in conversations])
+    if actual != expected:
+        raise SystemExit("Segmenter output differs from the reference on the synthetic conversations.")
+    print(f"Golden check: {args.conversations:,} synthetic conversations identical.\n")
+
+    size_mb = sum(len(t['value']) for c in conversations for t in c) / 1024 ** 2
+    print(f"{'implementation':<16}{'seconds':>10}{'MB/s':>10}")
+    print(f"{'reference':<16}{reference_seconds:>10.2f}{size_mb / reference_seconds:>10.1f}")
+    print(f"{'segmenter':<16}{segmenter_seconds:>10.2f}{size_mb / segmenter_seconds:>10.1f}")
+    print(f"\nSpeedup: {reference_seconds / segmenter_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# benchmarks/bench_jsonio.py
+"""
+Compares the JSON backends of tools.jsonio on a synthetic ShareGPT file.
+
+For every backend that is installed it measures the raw loads+dumps round
+trip and three simple file-level tools, and checks that every backend
+produces the same records.
+
+Usage (from the DatasetToolkit folder):
+    python benchmarks/bench_jsonio.py --records 200000
+"""
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from tools import jsonio
+from tools.fix_choices_turns import fix_choices_tags_in_jsonl
+from tools.remove_failed_scenes import remove_failed_scenes_main
+from tools.remove_system_prompt import remove_system_prompt_from_jsonl
+
+WORDS = ["the", "storm", "she", "whispered", "softly", "and", "a", "of", "*smiles*", "\"Hello,\"", "ozone", "light",
+         "through", "window", "her", "his", "voice", "was", "to", "in", "that", "it", "with", "eyes"]
+# English roleplay data is mostly ASCII with some typographic punctuation.
+RARE_WORDS = ["café", "—", "…", "’s", "naïve", "日本語"]
+
+
+def write_synthetic_sharegpt(path, num_records, seed=0):
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(num_records):
+            conversations = [{"from": "system", "value": "You are a creative roleplay partner."}]
+            for turn in range(rng.randint(2, 12)):
+                text = " ".join(rng.choice(RARE_WORDS if rng.random() < 0.02 else WORDS)
+                                for _ in range(rng.randint(20, 300)))
+                if turn % 5 == 3:
+                    text += "\n<choices>\n1. Go left\n2. Go right"
+                conversations.append({"from": "human" if turn % 2 == 0 else "gpt", "value": text})
+            f.write(json.dumps({"id": i, "conversations": conversations}, ensure_ascii=rng.random() < 0.5) + '\n')
+
+
+def available_backends():
+    backends = ["json"]
+    for name in ("orjson", "msgspec"):
+        try:
+            importlib.import_module(name)
+            backends.append(name)
+        except ImportError:
+            pass
+    return backends
+
+
+def use_backend(name):
+    os.environ["DATASET_TOOLKIT_JSON_BACKEND"] = name
+    # The tools call jsonio.loads/dumps through the module, so reloading it switches them too.
+    importlib.reload(jsonio)
+    assert jsonio.BACKEND == name
+
+
+def read_records(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def best_time(func, repeat):
+    """Best wall time of repeat runs, with the tools' progress output silenced."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=50000, help="Number of synthetic conversations.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the best one is reported.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, "synthetic.jsonl")
+        write_synthetic_sharegpt(input_path, args.records)
+        with open(input_path, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+        size_mb = os.path.getsize(input_path) / 1024 ** 2
+        print(f"Synthetic ShareGPT file: {args.records:,} records, {size_mb:.1f} MB\n")
+
+        tools = {
+            "remove_system_prompt": lambda out: remove_system_prompt_from_jsonl(input_path, out, "system"),
+            "fix_choices_turns": lambda out: fix_choices_tags_in_jsonl(input_path, out),
+            "remove_failed_scenes": lambda out: remove_failed_scenes_main(input_path, out),
+        }
+        reference = {}
+        print(f"{'backend':<10}{'task':<24}{'seconds':>10}{'records/s':>14}")
+        for backend in available_backends():
+            use_backend(backend)
+
+            seconds = best_time(lambda: [jsonio.dumps(jsonio.loads(line)) for line in lines], args.repeat)
+            print(f"{backend:<10}{'loads+dumps':<24}{seconds:>10.2f}{args.records / seconds:>14,.0f}")
+
+            for task, run in tools.items():
+                output_path = os.path.join(tmp, f"{task}.{backend}.jsonl")
+                seconds = best_time(lambda: run(output_path), args.repeat)
+                print(f"{backend:<10}{task:<24}{seconds:>10.2f}{args.records / seconds:>14,.0f}")
+                records = read_records(output_path)
+                if task not in reference:
+                    reference[task] = records
+                elif records != reference[task]:
+                    raise SystemExit(f"{backend} output of {task} differs from the json backend.")
+        print("\nAll backends produced identical records.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# benchmarks/bench_pack_sequences.py
+"""
+Checks the best-fit-decreasing packing planner against a plain first-fit-decreasing packer and times it on millions of samples.
+
+Every plan is checked for validity: each packable sample appears in exactly
+one pack, no pack holds more than max_seq_length tokens and the stored pack
+token counts are right. On a smaller set the number of packs is compared with
+the plain packer, which scans all open packs for every sample. A few edge
+cases (empty samples, nothing packable) must give exactly the expected
+number of packs.
+
+Usage (from the DatasetToolkit folder):
+    python benchmarks/bench_pack_sequences.py --samples 2000000 --reference-samples 20000
+"""
+import argparse
+import random
+import sys
+import time
+from array import array
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from tools.pack_sequences import plan_packs
+
+
+def reference_ffd(lengths, max_seq_length):
+    """First-fit decreasing that scans every open pack: returns the number of packs."""
+    rooms = []
+    for length in sorted((l for l in lengths if l <= max_seq_length), reverse=True):
+        for pack, room in enumerate(rooms):
+            if room >= length:
+                rooms[pack] -= length
+                break
+        else:
+            rooms.append(max_seq_length - length)
+    return len(rooms)
+
+
+def synthetic_lengths(num_samples, max_seq_length, seed=0):
+    """A long-tailed mix of short chats, long roleplay sessions and a few samples over the limit."""
+    rng = random.Random(seed)
+    lengths = array('I')
+    for _ in range(num_samples):
+        roll = rng.random()
+        if roll < 0.6:
+            length = int(rng.lognormvariate(6.5, 0.7))
+        elif roll < 0.98:
+            length = int(rng.uniform(0.2, 1.0) * max_seq_length)
+        else:
+            length = int(rng.uniform(1.0, 1.5) * max_seq_length)
+        lengths.append(max(1, length))
+    return lengths
+
+
+def check_plan(plan, lengths, max_seq_length):
+    seen = array('b', bytes(len(lengths)))
+    for tokens, samples in plan.packs():
+        if sum(lengths[i] for i in samples) != tokens:
+            raise SystemExit("A pack's stored token count is wrong.")
+        if tokens > max_seq_length:
+            raise SystemExit(f"A pack holds {tokens} tokens, more than {max_seq_length}.")
+        for i in samples:
+            if seen[i]:
+                raise SystemExit(f"Sample {i} is in more than one pack.")
+            seen[i] = 1
+    for i in plan.too_long:
+        seen[i] += 1
+    if any(flag != 1 for flag in seen):
+        raise SystemExit("Some samples are missing from the plan.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--samples", type=int, default=2000000, help="Number of synthetic samples to plan and time.")
+    parser.add_argument("--reference-samples", type=int, default=20000,
+                        help="Number of samples for the comparison with the plain packer.")
+    parser.add_argument("--max-seq-length", type=int, default=8192, help="Length of a packed sequence.")
+    args = parser.parse_args()
+
+    # (lengths, max_seq_length, packs): empty samples join an existing pack instead of opening an empty one.
+    for lengths, max_seq_length, expected in (([3, 0, 0], 3, 1), ([0, 0], 3, 1), ([], 3, 0), ([5, 4], 3, 0),
+                                              ([2, 0, 2, 1, 0], 3, 2), ([3, 3, 0], 3, 2)):
+        plan = plan_packs(lengths, max_seq_length)
+        check_plan(plan, lengths, max_seq_length)
+        if len(plan) != expected:
+            raise SystemExit(f"plan_packs({lengths}, {max_seq_length}) made {len(plan)} packs instead of {expected}.")
+
+    lengths = synthetic_lengths(args.reference_samples, args.max_seq_length, seed=1)
+    plan = plan_packs(lengths, args.max_seq_length)
+    check_plan(plan, lengths, args.max_seq_length)
+    reference_seconds = time.perf_counter()
+    reference_packs = reference_ffd(lengths, args.max_seq_length)
+    reference_seconds = time.perf_counter() - reference_seconds
+    print(f"{args.reference_samples:,} samples: {len(plan):,} packs (plain first-fit decreasing: {reference_packs:,} "
+          f"in {reference_seconds:.2f} s, lower bound {plan.stats()['min_packs']:,}).")
+
+    lengths = synthetic_lengths(args.samples, args.max_seq_length)
+    start = time.perf_counter()
+    plan = plan_packs(lengths, args.max_seq_length)
+    seconds = time.perf_counter() - start
+    check_plan(plan, lengths, args.max_seq_length)
+    stats = plan.stats()
+    print(f"{args.samples:,} samples planned in {seconds:.2f} s ({args.samples / seconds / 1e6:.2f} M samples/s).")
+    print(f"Packs: {stats['packs']:,} (lower bound {stats['min_packs']:,}), efficiency {stats['efficiency']:.2%} "
+          f"vs {stats['unpacked_efficiency']:.2%} unpacked.")
+    print("All plans are valid.")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import sys
 import os
+import multiprocessing
 from pathlib import Path
 import ttkbootstrap as bstrap
 from ttkbootstrap.constants import *
@@ -9,23 +10,14 @@ from ttkbootstrap.constants import *
 try:
     # --- Tool Imports ---
     from tools.combinejsonl import combine_jsonl_files
-    from tools.cleanup_text import cleanup_text_in_jsonl
-    from tools.cleanasterisks import process_jsonl_file as clean_asterisks_in_jsonl
-    from tools.cleanupjsonl_last_user_turn import main as remove_last_user_turn
-    from tools.DeslopTool import filter_dataset as deslop_dataset
-    from tools.convert_json_to_jsonl import convert_json_to_jsonl
     from tools.convert_txt_to_jsonl import convert_multiple_txt_to_jsonl
-    from tools.convert_unicode_to_characters import normalize_unicode_in_jsonl
     from tools.validate_dataset import validate_and_clean_jsonl
     from tools.remove_system_prompt import remove_system_prompt_from_jsonl
     from tools.convert_pretraining_json_to_jsonl import convert_pretraining_json_to_jsonl
     from tools.character_counter import count_characters_in_jsonl
-    from tools.remove_standalone_names import remove_standalone_names_main
     from tools.find_unused_chunks_tool import find_unused_text_chunks
-    from tools.fix_choices_turns import fix_choices_tags_in_jsonl
-    from tools.fix_thinking_turns import process_jsonl_file as fix_thinking_and_collapsed_turns
-    from tools.remove_failed_scenes import remove_failed_scenes_main
-    from tools.fix_turn_structure import fix_turn_structure
+    from tools.pack_sequences import pack_sequences
+    from tools.pipeline import run_processing_pipeline, run_pretraining_pipeline
 
 except ImportError as e:
     messagebox.showerror("Fatal Error", f"Could not import a tool script. Please ensure the 'tools' subfolder exists and contains all required scripts (including fix_turn_structure.py).\n\nError: {e}")
@@ -64,6 +56,7 @@ class DatasetToolkit(bstrap.Window):
             "CharCounterTab": (CharCounterTab, "Character Counter"),
             "CombineTab": (CombineTab, "Combine JSONL"),
             "FindUnusedTab": (FindUnusedTab, "Find Unused Chunks"),
+            "PackSequencesTab": (PackSequencesTab, "Packing Planner"),
             "PretrainConvertTab": (PretrainConvertTab, "Pre-train Convert"),
             "RemovePromptTab": (RemovePromptTab, "Remove Sys Prompt"),
             "TxtToJsonTab": (TxtToJsonTab, "TXT -> JSONL"),
@@ -160,7 +153,7 @@ class DatasetToolkit(bstrap.Window):
             print(f"\n--- ERROR: {error_message} ---")
             messagebox.showerror("Error", error_message)
 
-    def run_pipeline(self, initial_input_file, steps_to_run, deslop_filter_file, deslop_threshold, output_prefix):
+    def run_pipeline(self, initial_input_file, steps_to_run, deslop_filter_file, deslop_threshold, output_prefix, fused=False, keep_intermediate=False, workers=1, use_cache=False, resume=False, deslop_report_file=None, deslop_normalize=False, trim_model_path=None, trim_max_length=8192, trim_report_file=None):
         self.log_text.configure(state='normal')
         self.log_text.delete('1.0', 'end')
         self.log_text.configure(state='disabled')
@@ -169,75 +162,25 @@ class DatasetToolkit(bstrap.Window):
             messagebox.showerror("Error", "Please select a valid initial input file.")
             return
 
-        # --- MODIFIED: The pipeline is now shorter and more robust ---
-        pipeline_definition = {
-            1: {"name": "Convert JSON to JSONL", "func": convert_json_to_jsonl, "args": lambda i, o: {"input_path": i, "output_path": o}},
-            2: {"name": "Remove Failed Scenes", "func": remove_failed_scenes_main, "args": lambda i, o: {"input_file": i, "output_file": o}},
-            3: {"name": "Normalize Unicode", "func": normalize_unicode_in_jsonl, "args": lambda i, o: {"input_file": i, "output_file": o}},
-            4: {"name": "Cleanup Separators", "func": cleanup_text_in_jsonl, "args": lambda i, o: {"input_file": i, "output_file": o}},
-            5: {"name": "Fix Turn Structure (OOC, Consecutive)", "func": fix_turn_structure, "args": lambda i, o: {"input_file": i, "output_file": o}},
-            6: {"name": "Remove Standalone Names", "func": remove_standalone_names_main, "args": lambda i, o: {"input_file": i, "output_file": o}},
-            7: {"name": "Clean Enclosing Asterisks", "func": clean_asterisks_in_jsonl, "args": lambda i, o: {"input_file": i, "output_file": o}},
-            8: {"name": "Trim Last User Turn", "func": remove_last_user_turn, "args": lambda i, o: type('Args', (), {'input_file': i, 'output_file': o, 'conversation_key': 'conversations', 'role_key': 'from', 'user_role': 'human'})},
-            9: {"name": "Fix Unclosed Choices Tags", "func": fix_choices_tags_in_jsonl, "args": lambda i, o: {"input_file": i, "output_file": o}},
-            10: {"name": "Fix Thinking/Collapsed Turns", "func": fix_thinking_and_collapsed_turns, "args": lambda i, o: {"input_path": i, "output_path": o}},
-            11: {"name": "Deslop Tool", "func": deslop_dataset, "args": lambda i, o: {"dataset_file": i, "output_file": o, "filter_files": [deslop_filter_file], "threshold": deslop_threshold}}
-        }
-        
         try:
-            last_step_to_run = 0
-            # --- MODIFIED: Updated range to account for 11 steps ---
-            for i in range(11, 0, -1):
-                if steps_to_run.get(i).get():
-                    last_step_to_run = i
-                    break
-            
-            p = Path(initial_input_file)
-            current_input_path = str(p.resolve())
-            input_dir = p.parent
-
-            print(f"--- Starting Processing Pipeline for: {p.name} ---\n")
-            final_output_file = ""
-
-            # --- MODIFIED: Updated range to account for 11 steps ---
-            for step_num in range(1, 12):
-                if steps_to_run.get(step_num).get():
-                    step_info = pipeline_definition[step_num]
-                    step_name = step_info["name"]
-                    
-                    is_final_step = (step_num == last_step_to_run)
-                    if is_final_step and output_prefix:
-                        safe_prefix = "".join(c for c in output_prefix if c.isalnum() or c in ('_','-')).strip()
-                        output_path = str(input_dir / f"{safe_prefix}{p.stem}.jsonl")
-                    else:
-                        output_path = str(input_dir / f"{p.stem}_step{step_num}.jsonl")
-                    
-                    final_output_file = output_path
-
-                    print(f"--- Running Step {step_num}: {step_name} ---")
-                    print(f"Input: {Path(current_input_path).name}")
-                    print(f"Output: {Path(output_path).name}")
-                    
-                    # --- MODIFIED: Updated step number for this special case ---
-                    if step_num == 8:
-                        args_obj = step_info["args"](current_input_path, output_path)
-                        remove_last_user_turn(args=args_obj)
-                    else:
-                        # --- MODIFIED: Updated step number for this special case ---
-                        if step_num == 11 and (not deslop_filter_file or not Path(deslop_filter_file).exists()):
-                            raise ValueError("Deslop filter file is not specified or does not exist.")
-                        kwargs = step_info["args"](current_input_path, output_path)
-                        step_info["func"](**kwargs)
-                    
-                    print(f"--- Step {step_num} Complete ---\n")
-                    current_input_path = output_path
-                else:
-                    if step_num in pipeline_definition:
-                        print(f"--- Skipping Step {step_num}: {pipeline_definition[step_num]['name']} ---\n")
-            
-            print(f"--- Pipeline Finished ---")
+            final_output_file = run_processing_pipeline(
+                initial_input_file=initial_input_file,
+                steps_to_run=[step_num for step_num, var in steps_to_run.items() if var.get()],
+                deslop_filter_file=deslop_filter_file,
+                deslop_threshold=deslop_threshold,
+                output_prefix=output_prefix,
+                fused=fused,
+                keep_intermediate=keep_intermediate,
+                workers=workers,
+                use_cache=use_cache,
+                resume=resume,
+                deslop_report_file=deslop_report_file,
+                deslop_normalize=deslop_normalize,
+                trim_model_path=trim_model_path,
+                trim_max_length=trim_max_length,
+                trim_report_file=trim_report_file,
+            )
             if final_output_file:
-                 print(f"Final output file: {final_output_file}")
                  messagebox.showinfo("Success", f"Pipeline completed successfully!\n\nFinal output: {Path(final_output_file).name}")
             else:
                  messagebox.showinfo("Finished", "Pipeline finished, but no steps were selected to run.")
@@ -252,74 +195,13 @@ class DatasetToolkit(bstrap.Window):
         self.log_text.delete('1.0', 'end')
         self.log_text.configure(state='disabled')
 
-        if not initial_input_folder or not Path(initial_input_folder).is_dir():
-            messagebox.showerror("Error", "Please select a valid initial input folder.")
-            return
-        
-        safe_filename_base = "".join(c for c in output_filename_base if c.isalnum() or c in ('_','-')).strip()
-        if not safe_filename_base:
-            messagebox.showerror("Error", "Please provide a valid base name for the final output file.")
-            return
-        
-        if not steps_to_run.get(1).get():
-            messagebox.showerror("Pipeline Error", "Step 1 (Convert TXT to JSONL) must be selected for the pre-training pipeline.")
-            return
-
-        pipeline_definition = {
-            1: {"name": "Convert TXT to JSONL", "func": convert_multiple_txt_to_jsonl, "args": lambda i, o: {"input_directory": i, "output_file_path": o}},
-            2: {"name": "Normalize Unicode", "func": normalize_unicode_in_jsonl, "args": lambda i, o: {"input_file": i, "output_file": o}},
-            3: {"name": "Validate and Clean JSONL", "func": validate_and_clean_jsonl, "args": lambda i, o: {"input_file": i, "output_file": o}},
-        }
-        
         try:
-            last_step_to_run = 0
-            for i in range(3, 0, -1):
-                if steps_to_run.get(i).get():
-                    last_step_to_run = i
-                    break
-            
-            p_folder = Path(initial_input_folder)
-            current_input = str(p_folder.resolve())
-            
-            print(f"--- Starting Pre-training Pipeline for folder: {p_folder.name} ---\n")
-            final_output_file = ""
-
-            for step_num in range(1, 4):
-                if steps_to_run.get(step_num).get():
-                    step_info = pipeline_definition[step_num]
-                    step_name = step_info["name"]
-                    
-                    is_final_step = (step_num == last_step_to_run)
-                    if is_final_step:
-                        output_path = str(p_folder / f"{safe_filename_base}.jsonl")
-                    else:
-                        output_path = str(p_folder / f"{safe_filename_base}_step{step_num}.jsonl")
-                    
-                    final_output_file = output_path
-
-                    print(f"--- Running Step {step_num}: {step_name} ---")
-                    input_name = Path(current_input).name
-                    if step_num == 1:
-                        print(f"Input: {input_name} (folder)")
-                    else:
-                        print(f"Input: {input_name}")
-                    print(f"Output: {Path(output_path).name}")
-                    
-                    kwargs = step_info["args"](current_input, output_path)
-                    step_info["func"](**kwargs)
-                    
-                    print(f"--- Step {step_num} Complete ---\n")
-                    current_input = output_path
-                else:
-                    if step_num in pipeline_definition:
-                        print(f"--- Skipping Step {step_num}: {pipeline_definition[step_num]['name']} ---\n")
-            
-            print(f"--- Pipeline Finished ---")
-            if final_output_file:
-                print(f"Final output file: {final_output_file}")
-                messagebox.showinfo("Success", f"Pipeline completed successfully!\n\nFinal output: {Path(final_output_file).name}")
-            else:
-                messagebox.showinfo("Finished", "Pipeline finished, but no steps were selected to run.")
+            final_output_file = run_pretraining_pipeline(
+                initial_input_folder=initial_input_folder,
+                steps_to_run=[step_num for step_num, var in steps_to_run.items() if var.get()],
+                output_filename_base=output_filename_base,
+            )
+            messagebox.showinfo("Success", f"Pipeline completed successfully!\n\nFinal output: {Path(final_output_file).name}")
 
         except Exception as e:
             error_message = f"An error occurred during the pre-training pipeline:\n\n{e}"
@@ -336,7 +218,7 @@ class ProcessingPipelineTab(BaseTab):
         super().__init__(parent, controller)
         
         ttk.Label(self, text="Dataset Processing Pipeline", font=("-size 14 -weight bold")).pack(pady=10)
-        ttk.Label(self, text="Run a sequence of tools on a dataset. Each step creates a new file.", bootstyle="primary", wraplength=500).pack(fill=X, pady=10)
+        ttk.Label(self, text="Run a sequence of tools on a dataset. Each step creates a new file unless fused mode is enabled.", bootstyle="primary", wraplength=500).pack(fill=X, pady=10)
 
         self.in_file_var = self.controller.create_io_widgets(self, 'file', "Initial Input File:", [("JSON files", "*.json"), ("JSONL files", "*.jsonl")])
 
@@ -356,11 +238,12 @@ class ProcessingPipelineTab(BaseTab):
             "Step 8: Trim Last User Turn",
             "Step 9: Fix Unclosed <choices> Tags (Rare)",
             "Step 10: Fix Thinking/Collapsed Turns (Rare)",
-            "Step 11: Deslop Tool (Filter Content)"
+            "Step 11: Deslop Tool (Filter Content)",
+            "Step 12: Trim Long Samples (Token Limit)"
         ]
 
         for i, text in enumerate(steps_info, 1):
-            default_state = False if i in [5, 9, 10] else True
+            default_state = False if i in [5, 9, 10, 12] else True
             var = tk.BooleanVar(value=default_state)
             self.steps_vars[i] = var
             chk = ttk.Checkbutton(steps_frame, text=text, variable=var, bootstyle="primary")
@@ -389,6 +272,38 @@ class ProcessingPipelineTab(BaseTab):
         threshold_check = ttk.Checkbutton(threshold_frame, text="Use statistical threshold filtering", variable=self.use_threshold_var, command=toggle_spinbox, bootstyle="info")
         threshold_check.pack(side=LEFT, padx=5)
         self.threshold_spinbox.pack(side=LEFT, padx=5)
+        self.normalize_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(threshold_frame, text="Ignore case, apostrophe style and whitespace", variable=self.normalize_var, bootstyle="info").pack(side=LEFT, padx=15)
+
+        self.report_file_var = self.controller.create_io_widgets(deslop_frame, 'save_file', "Phrase Report:", [("CSV files", "*.csv"), ("JSON files", "*.json")])
+
+        trim_frame = ttk.LabelFrame(self, text="Step 12: Trim Options", padding=10)
+        trim_frame.pack(fill=X, pady=10, padx=5)
+        model_frame = ttk.Frame(trim_frame)
+        model_frame.pack(fill=X, pady=5)
+        ttk.Label(model_frame, text="Tokenizer Model (path or hub name):").pack(side=LEFT, padx=5)
+        self.trim_model_var = tk.StringVar(value="meta-llama/Llama-3.3-70B-Instruct")
+        ttk.Entry(model_frame, textvariable=self.trim_model_var).pack(side=LEFT, fill=X, expand=True, padx=5)
+        ttk.Label(model_frame, text="Max tokens:").pack(side=LEFT, padx=(15,5))
+        self.trim_max_length_spinbox = ttk.Spinbox(model_frame, from_=256, to=1048576, increment=1024, width=8)
+        self.trim_max_length_spinbox.set(8192)
+        self.trim_max_length_spinbox.pack(side=LEFT, padx=5)
+        self.trim_report_file_var = self.controller.create_io_widgets(trim_frame, 'save_file', "Length Report:", [("JSON files", "*.json"), ("CSV files", "*.csv")])
+
+        mode_frame = ttk.LabelFrame(self, text="Execution Mode", padding=10)
+        mode_frame.pack(fill=X, pady=10, padx=5)
+        self.fused_var = tk.BooleanVar(value=False)
+        self.keep_intermediate_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(mode_frame, text="Fused single pass (parse each record once, write only the final file)", variable=self.fused_var, bootstyle="info").pack(side=LEFT, padx=5)
+        ttk.Checkbutton(mode_frame, text="Also write intermediate step files (debug)", variable=self.keep_intermediate_var, bootstyle="info").pack(side=LEFT, padx=5)
+        self.use_cache_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(mode_frame, text="Reuse cached stage outputs", variable=self.use_cache_var, bootstyle="info").pack(side=LEFT, padx=5)
+        self.resume_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(mode_frame, text="Resume interrupted run", variable=self.resume_var, bootstyle="info").pack(side=LEFT, padx=5)
+        ttk.Label(mode_frame, text="Worker processes:").pack(side=LEFT, padx=(15,5))
+        self.workers_spinbox = ttk.Spinbox(mode_frame, from_=1, to=os.cpu_count() or 1, increment=1, width=5)
+        self.workers_spinbox.set(1)
+        self.workers_spinbox.pack(side=LEFT, padx=5)
 
         prefix_frame = ttk.LabelFrame(self, text="Final Output Naming", padding=10)
         prefix_frame.pack(fill=X, pady=(10,5), padx=5)
@@ -407,13 +322,35 @@ class ProcessingPipelineTab(BaseTab):
             except ValueError:
                 messagebox.showerror("Invalid Input", "Threshold must be a valid number.")
                 return
+
+        try:
+            workers = int(self.workers_spinbox.get())
+        except ValueError:
+            messagebox.showerror("Invalid Input", "Worker processes must be a whole number.")
+            return
+
+        try:
+            trim_max_length = int(self.trim_max_length_spinbox.get())
+        except ValueError:
+            messagebox.showerror("Invalid Input", "Max tokens must be a whole number.")
+            return
         
         self.controller.run_pipeline(
             initial_input_file=self.in_file_var.get(),
             steps_to_run=self.steps_vars,
             deslop_filter_file=self.filter_file_var.get(),
             deslop_threshold=threshold_value,
-            output_prefix=self.prefix_var.get()
+            output_prefix=self.prefix_var.get(),
+            fused=self.fused_var.get(),
+            keep_intermediate=self.keep_intermediate_var.get(),
+            workers=workers,
+            use_cache=self.use_cache_var.get(),
+            resume=self.resume_var.get(),
+            deslop_report_file=self.report_file_var.get() or None,
+            deslop_normalize=self.normalize_var.get(),
+            trim_model_path=self.trim_model_var.get().strip() or None,
+            trim_max_length=trim_max_length,
+            trim_report_file=self.trim_report_file_var.get() or None
         )
 
 class PretrainingPipelineTab(BaseTab):
@@ -545,7 +482,41 @@ class CharCounterTab(BaseTab):
         run_btn = ttk.Button(self, text="Run Analysis", command=lambda: self.controller.execute_tool(count_characters_in_jsonl, "Character Count", input_file=in_file_var.get()), bootstyle="success")
         run_btn.pack(pady=20)
 
+class PackSequencesTab(BaseTab):
+    def __init__(self, parent, controller):
+        super().__init__(parent, controller)
+        ttk.Label(self, text="Sequence Packing Planner", font=("-size 12 -weight bold")).pack(pady=10)
+        ttk.Label(self, text="Measures every sample with the model's tokenizer, packs them into sequences of the max length and reports how much of each sequence would be padding.",
+                  wraplength=550, bootstyle="primary").pack(fill=X, pady=10)
+        in_file_var = self.controller.create_io_widgets(self, 'file', "Input File:", [("JSONL files", "*.jsonl")])
+        index_file_var = self.controller.create_io_widgets(self, 'save_file', "Packing Index:", [("JSONL files", "*.jsonl")])
+        stats_file_var = self.controller.create_io_widgets(self, 'save_file', "Stats File:", [("JSON files", "*.json")])
+        options_frame = ttk.LabelFrame(self, text="Options", padding=10)
+        options_frame.pack(fill=X, pady=10)
+        ttk.Label(options_frame, text="Tokenizer Model (path or hub name):").pack(side=LEFT, padx=5)
+        model_var = tk.StringVar(value="meta-llama/Llama-3.3-70B-Instruct")
+        ttk.Entry(options_frame, textvariable=model_var).pack(side=LEFT, fill=X, expand=True, padx=5)
+        ttk.Label(options_frame, text="Max sequence length:").pack(side=LEFT, padx=(15,5))
+        max_length_spinbox = ttk.Spinbox(options_frame, from_=256, to=1048576, increment=1024, width=8)
+        max_length_spinbox.set(8192)
+        max_length_spinbox.pack(side=LEFT, padx=5)
+
+        def run():
+            try:
+                max_seq_length = int(max_length_spinbox.get())
+            except ValueError:
+                messagebox.showerror("Invalid Input", "Max sequence length must be a whole number.")
+                return
+            self.controller.execute_tool(pack_sequences, "Packing Planner", input_file=in_file_var.get(), model_path=model_var.get().strip(),
+                                         max_seq_length=max_seq_length, index_file=index_file_var.get() or None,
+                                         stats_file=stats_file_var.get() or None)
+
+        run_btn = ttk.Button(self, text="Plan Packing", command=run, bootstyle="success")
+        run_btn.pack(pady=20)
+
 
 if __name__ == '__main__':
+    # Needed for the pipeline's worker processes in the frozen (PyInstaller) build.
+    multiprocessing.freeze_support()
     app = DatasetToolkit()
     app.mainloop()
\ No newline at end of file
@@ -1,16 +1,30 @@
-import json
+import argparse
+import csv
+import re
+import sys
+from array import array
+from collections import Counter
+from itertools import combinations
 from pathlib import Path
+try:
+    from tools import jsonio
+    from tools.phrase_matcher import PhraseMatcher, normalize_phrase
+except ImportError:  # run as a standalone script from the tools folder
+    import jsonio
+    from phrase_matcher import PhraseMatcher, normalize_phrase
+
+def iter_conversations(file_path, warn=True):
+    """Streams (raw_line, record) pairs from a JSONL file, skipping invalid lines."""
+    for _, raw, record in jsonio.iter_jsonl(file_path):
+        if record is None:
+            if warn:
+                print(f"Skipping invalid JSON line: {jsonio.decode_line(raw).strip()}.")
+        else:
+            yield raw, record
 
 def load_jsonl(file_path):
     """Loads data from a JSONL file."""
-    data = []
-    with open(file_path, 'r', encoding='utf-8', errors='replace') as file:
-        for line in file:
-            try:
-                data.append(json.loads(line))
-            except json.JSONDecodeError as e:
-                print(f"Skipping invalid JSON line: {line.strip()}. Error: {e}")
-    return data
+    return [record for _, record in iter_conversations(file_path)]
 
 def load_filter_criteria(filter_files):
     """Loads filter phrases from a list of text files."""
@@ -23,6 +37,43 @@ def load_filter_criteria(filter_files):
                     filter_criteria.add(stripped_line)
     return list(filter_criteria)
 
+def build_matcher(filter_criteria, normalize=False):
+    """
+    Compiles the filter phrases into a PhraseMatcher; build it once and reuse
+    it. normalize makes matching ignore case, apostrophe style and whitespace.
+    """
+    return PhraseMatcher(filter_criteria, normalize=normalize)
+
+def contains_slop(conv, matcher):
+    """Returns True if any gpt turn of a conversation contains a filter phrase."""
+    if not isinstance(conv, dict):
+        return False
+    for msg in conv.get("conversations", []):
+        if msg.get("from") == "gpt" and isinstance(msg.get("value"), str):
+            if matcher.contains_any(msg["value"]):
+                return True
+    return False
+
+def count_slop(conv, matcher):
+    """Number of filter phrases found in a conversation, counted once per gpt turn they appear in."""
+    phrases_in_conv = 0
+    if not isinstance(conv, dict):
+        return phrases_in_conv
+    for msg in conv.get("conversations", []):
+        if msg.get("from") == "gpt" and isinstance(msg.get("value"), str):
+            phrases_in_conv += matcher.count(msg["value"])
+    return phrases_in_conv
+
+def deslop_record(data, stats, matcher):
+    """
+    Per-record form of the default (non-threshold) mode: drops the record if
+    any gpt turn contains a filter phrase. Returns (record, changed).
+    """
+    if isinstance(data, dict) and contains_slop(data, matcher):
+        stats['removed'] += 1
+        return None, True
+    return data, False
+
 def filter_conversations(conversations, filter_criteria, threshold=None):
     """
     Filters conversations based on one of two modes:
@@ -34,19 +85,14 @@ def filter_conversations(conversations, filter_criteria, threshold=None):
         print("Warning: Filter criteria is empty. No conversations will be removed.")
         return conversations, 0
 
+    matcher = build_matcher(filter_criteria)
     clean_conversations = []
     removed_count = 0
 
     if threshold is None:
         print("[*] Filtering mode: Remove any conversation with a matched phrase.")
         for conv in conversations:
-            found_slop = False
-            for msg in conv.get("conversations", []):
-                if msg.get("from") == "gpt" and isinstance(msg.get("value"), str):
-                    if any(phrase in msg["value"] for phrase in filter_criteria):
-                        found_slop = True
-                        break
-            if found_slop:
+            if contains_slop(conv, matcher):
                 removed_count += 1
             else:
                 clean_conversations.append(conv)
@@ -57,10 +103,7 @@ def filter_conversations(conversations, filter_criteria, threshold=None):
         matched_counts = []
         total_matched_phrases = 0
         for conv in conversations:
-            phrases_in_conv = 0
-            for msg in conv.get("conversations", []):
-                if msg.get("from") == "gpt" and isinstance(msg.get("value"), str):
-                    phrases_in_conv += sum(1 for phrase in filter_criteria if phrase in msg["value"])
+            phrases_in_conv = count_slop(conv, matcher)
             matched_counts.append(phrases_in_conv)
             total_matched_phrases += phrases_in_conv
             
@@ -85,27 +128,428 @@ def write_filtered_jsonl(filtered_data, output_file_path):
     """Writes the filtered data to a new JSONL file."""
     # Ensure the parent directory exists, without creating the tool's own sub-folder
     Path(output_file_path).parent.mkdir(parents=True, exist_ok=True)
-    with open(output_file_path, 'w', encoding='utf-8') as file:
+    with jsonio.JsonlWriter(output_file_path) as file:
         for conversation in filtered_data:
-            json.dump(conversation, file, ensure_ascii=False)
-            file.write('\n')
+            file.write(conversation)
+
+class SlopStats:
+    """
+    Per-phrase statistics gathered while a conversation is matched: total hits,
+    the number of gpt turns and conversations a phrase appears in, the phrases
+    it co-occurs with and a few example spans.
+
+    To tell how many removals a phrase alone causes, it keeps a histogram of
+    (conversation count, the phrase's share of it) pairs, so the answer can be
+    computed once the removal threshold is known (after pass 1).
+    """
+    EXAMPLES_PER_PHRASE = 3
+    EXAMPLE_CONTEXT_CHARS = 40
+    TOP_COOCCURRING = 5
+
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self.conversations = 0
+        self.hits = Counter()
+        self.turns = Counter()
+        self.documents = Counter()
+        self.pairs = Counter()
+        self.share_histogram = Counter()
+        self.examples = {}
+
+    def add(self, conv):
+        """Matches one conversation, records its statistics and returns its slop count (see count_slop)."""
+        record_index = self.conversations
+        self.conversations += 1
+        if not isinstance(conv, dict):
+            return 0
+        shares = Counter()
+        for turn_index, msg in enumerate(conv.get("conversations", [])):
+            if msg.get("from") != "gpt" or not isinstance(msg.get("value"), str):
+                continue
+            text = msg["value"]
+            in_turn = set()
+            for end, index in self.matcher.iter_matches(text):
+                self.hits[index] += 1
+                in_turn.add(index)
+                examples = self.examples.setdefault(index, [])
+                if len(examples) < self.EXAMPLES_PER_PHRASE:
+                    start = self.matcher.match_start(text, end, index)
+                    examples.append({"record": record_index, "turn": turn_index, "start": start, "end": end,
+                                     "context": text[max(0, start - self.EXAMPLE_CONTEXT_CHARS):
+                                                     end + self.EXAMPLE_CONTEXT_CHARS]})
+            shares.update(in_turn)
 
-# --- CHANGE: Simplified function signature and logic ---
-def filter_dataset(dataset_file, output_file, filter_files, threshold=None):
-    """Main function to orchestrate the deslopping process."""
+        count = sum(shares.values())
+        self.turns.update(shares)
+        self.documents.update(shares.keys())
+        self.pairs.update(combinations(sorted(shares), 2))
+        for index, share in shares.items():
+            self.share_histogram[index, count, share] += 1
+        return count
+
+    def report(self, removal_threshold=None):
+        """
+        One row per phrase, most hits first. removal_threshold is the slop
+        count at which a conversation is removed (None if nothing is).
+        """
+        removed = Counter()
+        sole_removals = Counter()
+        if removal_threshold is not None:
+            for (index, count, share), conversations in self.share_histogram.items():
+                if count >= removal_threshold:
+                    removed[index] += conversations
+                    if count - share < removal_threshold:
+                        sole_removals[index] += conversations
+
+        cooccurring = {}
+        for (a, b), conversations in self.pairs.items():
+            cooccurring.setdefault(a, []).append((conversations, b))
+            cooccurring.setdefault(b, []).append((conversations, a))
+
+        phrases = self.matcher.phrases
+        rows = []
+        for index, phrase in enumerate(phrases):
+            partners = sorted(cooccurring.get(index, []), key=lambda item: (-item[0], phrases[item[1]]))
+            rows.append({
+                "phrase": phrase,
+                "hits": self.hits[index],
+                "turns": self.turns[index],
+                "conversations": self.documents[index],
+                "document_frequency": round(self.documents[index] / self.conversations, 6) if self.conversations else 0.0,
+                "removed_conversations": removed[index],
+                "sole_removals": sole_removals[index],
+                "cooccurring": [{"phrase": phrases[other], "conversations": conversations}
+                                for conversations, other in partners[:self.TOP_COOCCURRING]],
+                "examples": self.examples.get(index, []),
+            })
+        rows.sort(key=lambda row: (-row["hits"], -row["conversations"], row["phrase"]))
+        return rows
+
+    def write_report(self, report_file, removal_threshold=None):
+        """Writes the report as CSV if report_file ends in .csv, as JSON otherwise."""
+        rows = self.report(removal_threshold)
+        Path(report_file).parent.mkdir(parents=True, exist_ok=True)
+        if str(report_file).lower().endswith(".csv"):
+            with open(report_file, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(["phrase", "hits", "turns", "conversations", "document_frequency",
+                                 "removed_conversations", "sole_removals", "cooccurring", "example"])
+                for row in rows:
+                    writer.writerow([row["phrase"], row["hits"], row["turns"], row["conversations"],
+                                     row["document_frequency"], row["removed_conversations"], row["sole_removals"],
+                                     "; ".join(f"{c['phrase']} ({c['conversations']})" for c in row["cooccurring"]),
+                                     row["examples"][0]["context"] if row["examples"] else ""])
+        else:
+            with open(report_file, 'w', encoding='utf-8') as f:
+                jsonio.dump({"conversations": self.conversations, "removal_threshold": removal_threshold,
+                             "phrases": rows}, f, indent=2)
+
+def count_slop_per_conversation(dataset_file, matcher, stats=None):
+    """
+    Pass 1 of the threshold mode: the slop phrase count of every conversation
+    in file order, as a compact unsigned int array (4 bytes per conversation).
+    With a SlopStats, the per-phrase statistics are collected in the same pass.
+    """
+    count = stats.add if stats is not None else lambda conv: count_slop(conv, matcher)
+    matched_counts = array('I')
+    for _, conv in iter_conversations(dataset_file):
+        matched_counts.append(count(conv))
+    return matched_counts
+
+def filter_dataset(dataset_file, output_file, filter_files, threshold=None, report_file=None, normalize=False):
+    """
+    Main function to orchestrate the deslopping process. Streams the dataset,
+    so memory use doesn't grow with its size: the default mode is a single
+    pass, the threshold mode counts matches in a first pass and writes the
+    surviving conversations in a second one. Kept lines are copied unchanged.
+
+    If report_file is given, per-phrase statistics (see SlopStats) are
+    written to it as JSON, or as CSV when it ends in .csv. normalize matches
+    phrases regardless of case, apostrophe style and whitespace.
+    """
     if not dataset_file or not output_file or not filter_files or not filter_files[0]:
         raise ValueError("Input dataset, output file, and filter file must all be specified.")
 
     filter_criteria = load_filter_criteria(filter_files)
-    original_data = load_jsonl(dataset_file)
-    
-    filtered_data, removed_count = filter_conversations(original_data, filter_criteria, threshold=threshold)
+    matcher = build_matcher(filter_criteria, normalize=normalize)
+    if normalize:
+        print(f"[*] Normalized matching: {len(filter_criteria)} filter phrases, {len(matcher)} after normalization.")
+    # Ensure the parent directory exists, without creating the tool's own sub-folder
+    Path(output_file).parent.mkdir(parents=True, exist_ok=True)
 
-    # Directly write to the specified output file
-    write_filtered_jsonl(filtered_data, output_file)
+    stats = SlopStats(matcher) if report_file else None
+    matched_counts = None
+    removal_threshold_count = None
+    if not matcher:
+        print("Warning: Filter criteria is empty. No conversations will be removed.")
+    elif threshold is None:
+        print("[*] Filtering mode: Remove any conversation with a matched phrase.")
+    else:
+        print(f"[*] Filtering mode: Threshold-based removal (threshold = {threshold}).")
+        matched_counts = count_slop_per_conversation(dataset_file, matcher, stats)
+        total_matched_phrases = sum(matched_counts)
+        if not matched_counts or total_matched_phrases == 0:
+            print("No filter phrases were found in the dataset. No conversations removed.")
+        else:
+            avg_phrases = total_matched_phrases / len(matched_counts)
+            removal_threshold_count = avg_phrases * threshold
+            print(f"    - Average matched phrases per entry: {avg_phrases:.2f}")
+            print(f"    - Removal threshold (count >=): {removal_threshold_count:.2f}")
+
+    original_count = 0
+    removed_count = 0
+    with jsonio.JsonlWriter(output_file) as outfile:
+        # The threshold mode already reported invalid lines in pass 1.
+        for raw, conv in iter_conversations(dataset_file, warn=matched_counts is None):
+            if removal_threshold_count is not None:
+                remove = matched_counts[original_count] >= removal_threshold_count
+            elif matched_counts is not None or not matcher:
+                remove = False
+            elif stats is not None:
+                # The report needs every match, so it can't stop at the first one.
+                remove = stats.add(conv) > 0
+            else:
+                remove = contains_slop(conv, matcher)
+            original_count += 1
+            if remove:
+                removed_count += 1
+            else:
+                outfile.write_raw(raw)
 
     print("\n[+] Deslopping Complete!")
-    print(f"    Original conversations: {len(original_data)}")
+    print(f"    Original conversations: {original_count}")
     print(f"    Conversations removed: {removed_count}")
-    print(f"    Remaining conversations: {len(filtered_data)}")
-    print(f"    Filtered output written to: {output_file}")
\ No newline at end of file
+    print(f"    Remaining conversations: {original_count - removed_count}")
+    print(f"    Filtered output written to: {output_file}")
+
+    if stats is not None:
+        if threshold is None:
+            # The default mode removes any conversation with a slop count of 1 or more.
+            removal_threshold_count = 1 if matcher else None
+        stats.write_report(report_file, removal_threshold_count)
+        print(f"    Phrase report written to: {report_file}")
+
+
+# --- Slop n-gram discovery ---
+
+# N-grams never span punctuation, so every candidate is a run of words that
+# appears verbatim (single-spaced) in the text.
+_SEGMENT_SPLIT_RE = re.compile(r'[.!?,;:"“”()\[\]{}*…—\n]+')
+
+class SpaceSaving:
+    """
+    Space-saving heavy-hitters counter (Metwally et al.) with batched
+    eviction: it tracks up to 2 x capacity items and, when that fills up,
+    keeps at most the capacity most frequent ones. A newly tracked item starts at
+    the highest count evicted so far plus one, so a reported count
+    overestimates the true one by at most errors[item] (0 if absent) and
+    memory stays bounded however long the stream is.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+        self._floor = 0
+
+    def add(self, item):
+        self.total += 1
+        counts = self.counts
+        count = counts.get(item)
+        if count is not None:
+            counts[item] = count + 1
+            return
+        counts[item] = self._floor + 1
+        if self._floor:
+            self.errors[item] = self._floor
+        if len(counts) > 2 * self.capacity:
+            self._evict()
+
+    def _evict(self):
+        # Everything at or below the (capacity + 1)-th largest count goes, ties included.
+        cutoff = sorted(self.counts.values(), reverse=True)[self.capacity]
+        self._floor = max(self._floor, cutoff)
+        self.counts = {item: count for item, count in self.counts.items() if count > cutoff}
+        self.errors = {item: error for item, error in self.errors.items() if item in self.counts}
+
+    def most_common(self, n=None):
+        return sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))[:n]
+
+def iter_ngrams(text, min_n, max_n):
+    """Lowercased word n-grams of text, min_n to max_n words long."""
+    for segment in _SEGMENT_SPLIT_RE.split(text.lower()):
+        words = segment.split()
+        for start in range(len(words) - min_n + 1):
+            for n in range(min_n, min(max_n, len(words) - start) + 1):
+                yield " ".join(words[start:start + n])
+
+def _iter_gpt_texts(dataset_file):
+    for _, conv in iter_conversations(dataset_file):
+        if isinstance(conv, dict):
+            for msg in conv.get("conversations", []):
+                if msg.get("from") == "gpt" and isinstance(msg.get("value"), str):
+                    yield msg["value"]
+
+def _iter_reference_texts(reference_file):
+    """Every text of a reference corpus: lines of a .txt file, or the "text" and turn values of a JSONL file."""
+    if str(reference_file).lower().endswith(".txt"):
+        with open(reference_file, 'r', encoding='utf-8', errors='replace') as f:
+            yield from f
+        return
+    for _, record in iter_conversations(reference_file, warn=False):
+        if not isinstance(record, dict):
+            continue
+        if isinstance(record.get("text"), str):
+            yield record["text"]
+        for msg in record.get("conversations", []):
+            if isinstance(msg, dict) and isinstance(msg.get("value"), str):
+                yield msg["value"]
+
+def discover_slop_ngrams(dataset_file, reference_file=None, output_file=None, filter_files=None,
+                         min_n=3, max_n=8, capacity=200000, top=200, min_count=20, min_ratio=5.0):
+    """
+    Proposes new filter phrases: word n-grams that are frequent in the gpt
+    turns of dataset_file and over-represented compared to reference_file.
+
+    Pass 1 streams the dataset through a SpaceSaving counter, so memory is
+    bounded by capacity however large the dataset is. Filtering and ranking
+    use each n-gram's guaranteed count (count - error): once the counter has
+    evicted, a newly tracked n-gram inherits the evicted counts, so its
+    reported count alone can clear min_count after a single sighting. If a reference corpus
+    is given, pass 2 streams it and counts only the surviving candidates;
+    the over-representation ratio is the add-one smoothed relative frequency
+    in the dataset divided by the one in the reference. Candidates that
+    contain an existing filter phrase or a shorter accepted candidate are
+    dropped, since the filter would already catch them.
+
+    Writes the candidates to output_file: a plain phrase list (ready to
+    append to f.txt) for .txt, otherwise a CSV or JSON report with counts.
+    Returns the candidate rows.
+    """
+    if not dataset_file:
+        raise ValueError("An input dataset must be specified.")
+    if not 1 <= min_n <= max_n:
+        raise ValueError("N-gram sizes must satisfy 1 <= min_n <= max_n.")
+
+    print(f"[*] Counting {min_n}-{max_n} word n-grams in gpt turns of {dataset_file} "
+          f"(tracking at most {capacity:,} n-grams)...")
+    counter = SpaceSaving(capacity)
+    for text in _iter_gpt_texts(dataset_file):
+        for ngram in iter_ngrams(text, min_n, max_n):
+            counter.add(ngram)
+    candidates = {}
+    for ngram, count in counter.counts.items():
+        guaranteed = count - counter.errors.get(ngram, 0)
+        if guaranteed >= min_count:
+            candidates[ngram] = guaranteed
+    print(f"    - {counter.total:,} n-grams counted, {len(candidates):,} seen at least {min_count} times.")
+
+    reference_counts = None
+    reference_total = 0
+    if reference_file and candidates:
+        print(f"[*] Counting candidate n-grams in reference corpus {reference_file}...")
+        reference_counts = Counter()
+        for text in _iter_reference_texts(reference_file):
+            for ngram in iter_ngrams(text, min_n, max_n):
+                reference_total += 1
+                if ngram in candidates:
+                    reference_counts[ngram] += 1
+        print(f"    - {reference_total:,} reference n-grams counted.")
+
+    rows = []
+    for ngram, guaranteed in candidates.items():
+        row = {"phrase": ngram, "words": ngram.count(" ") + 1, "count": counter.counts[ngram],
+               "error": counter.errors.get(ngram, 0), "guaranteed": guaranteed}
+        if reference_counts is not None:
+            row["reference_count"] = reference_counts[ngram]
+            row["ratio"] = round(((guaranteed + 1) / (counter.total + 1)) /
+                                 ((reference_counts[ngram] + 1) / (reference_total + 1)), 3)
+            if row["ratio"] < min_ratio:
+                continue
+        rows.append(row)
+
+    known = [normalize_phrase(phrase) for phrase in load_filter_criteria(filter_files)] if filter_files else []
+    accepted = []
+    # Shortest first, so a longer n-gram is dropped when a shorter candidate already covers it.
+    for row in sorted(rows, key=lambda row: (row["words"], -row["guaranteed"], row["phrase"])):
+        padded = f" {row['phrase']} "
+        if any(phrase in row["phrase"] for phrase in known):
+            continue
+        if any(f" {shorter['phrase']} " in padded for shorter in accepted):
+            continue
+        accepted.append(row)
+    sort_key = "ratio" if reference_counts is not None else "guaranteed"
+    accepted.sort(key=lambda row: (-row[sort_key], -row["guaranteed"], row["phrase"]))
+    accepted = accepted[:top]
+
+    if output_file:
+        Path(output_file).parent.mkdir(parents=True, exist_ok=True)
+        suffix = Path(output_file).suffix.lower()
+        if suffix == ".txt":
+            with open(output_file, 'w', encoding='utf-8') as f:
+                f.writelines(row["phrase"] + "\n" for row in accepted)
+        elif suffix == ".csv":
+            fields = ["phrase", "words", "count", "error", "guaranteed"] + (["reference_count", "ratio"] if reference_counts is not None else [])
+            with open(output_file, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=fields)
+                writer.writeheader()
+                writer.writerows(accepted)
+        else:
+            with open(output_file, 'w', encoding='utf-8') as f:
+                jsonio.dump({"dataset_ngrams": counter.total, "reference_ngrams": reference_total,
+                             "candidates": accepted}, f, indent=2)
+
+    print(f"\n[+] Discovery Complete! {len(accepted)} candidate phrases.")
+    if accepted:
+        print(f"    {'seen':>8} {'(upper)':>9}")
+    for row in accepted[:20]:
+        ratio = f"  x{row['ratio']}" if "ratio" in row else ""
+        print(f"    {row['guaranteed']:>8,} {'(' + format(row['count'], ',') + ')':>9}{ratio}  {row['phrase']}")
+    if output_file:
+        print(f"    Candidates written to: {output_file}")
+    return accepted
+
+
+def main():
+    """Command-line interface: filter a dataset or discover new slop phrases."""
+    parser = argparse.ArgumentParser(description="Filter slop phrases out of a ShareGPT dataset, or discover new ones.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    filter_parser = subparsers.add_parser("filter", help="Remove conversations whose gpt turns contain filter phrases.")
+    filter_parser.add_argument("dataset", help="Input .jsonl file.")
+    filter_parser.add_argument("output", help="Output .jsonl file.")
+    filter_parser.add_argument("--filter-file", action="append", required=True, help="Phrase list, one per line (repeatable).")
+    filter_parser.add_argument("--threshold", type=float, default=None,
+                               help="Remove conversations with at least threshold x the average phrase count.")
+    filter_parser.add_argument("--report", default=None, help="Write per-phrase statistics to this .json or .csv file.")
+    filter_parser.add_argument("--normalize", action="store_true",
+                               help="Match regardless of case, apostrophe style and whitespace.")
+
+    discover_parser = subparsers.add_parser("discover", help="Propose new filter phrases from over-represented n-grams.")
+    discover_parser.add_argument("dataset", help="Input .jsonl file.")
+    discover_parser.add_argument("--reference", default=None,
+                                 help="Reference corpus (.jsonl or .txt) the n-gram frequencies are compared against.")
+    discover_parser.add_argument("--output", default=None, help="Write candidates to this .txt, .csv or .json file.")
+    discover_parser.add_argument("--filter-file", action="append", default=None, help="Skip phrases these lists already catch.")
+    discover_parser.add_argument("--min-n", type=int, default=3, help="Shortest n-gram in words.")
+    discover_parser.add_argument("--max-n", type=int, default=8, help="Longest n-gram in words.")
+    discover_parser.add_argument("--capacity", type=int, default=200000, help="Maximum number of n-grams tracked in memory.")
+    discover_parser.add_argument("--top", type=int, default=200, help="Number of candidates to report.")
+    discover_parser.add_argument("--min-count", type=int, default=20, help="Minimum count in the dataset.")
+    discover_parser.add_argument("--min-ratio", type=float, default=5.0,
+                                 help="Minimum over-representation compared to the reference corpus.")
+    args = parser.parse_args()
+
+    if args.command == "filter":
+        filter_dataset(args.dataset, args.output, args.filter_file, threshold=args.threshold, report_file=args.report,
+                       normalize=args.normalize)
+    elif args.command == "discover":
+        discover_slop_ngrams(args.dataset, reference_file=args.reference, output_file=args.output,
+                             filter_files=args.filter_file, min_n=args.min_n, max_n=args.max_n,
+                             capacity=args.capacity, top=args.top, min_count=args.min_count,
+                             min_ratio=args.min_ratio)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
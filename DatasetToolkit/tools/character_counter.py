@@ -1,4 +1,7 @@
-import json
+try:
+    from tools import jsonio
+except ImportError:  # run as a standalone script from the tools folder
+    import jsonio
 
 def count_characters_in_jsonl(input_file: str):
     """
@@ -20,42 +23,41 @@ def count_characters_in_jsonl(input_file: str):
     max_chars = 0
     
     try:
-        with open(input_file, 'r', encoding='utf-8') as infile:
-            for i, line in enumerate(infile, 1):
-                line = line.strip()
-                if not line:
-                    continue
+        for i, (_, raw, data) in enumerate(jsonio.iter_jsonl(input_file), 1):
+            if not raw.strip():
+                continue
 
-                try:
-                    data = json.loads(line)
-                    char_count = 0
-                    
-                    # Case 1: Simple {"text": "..."} format
-                    if 'text' in data and isinstance(data.get('text'), str):
-                        char_count = len(data['text'])
+            try:
+                if data is None:
+                    raise jsonio.JSONDecodeError("Invalid JSON", jsonio.decode_line(raw), 0)
+                char_count = 0
+                
+                # Case 1: Simple {"text": "..."} format
+                if 'text' in data and isinstance(data.get('text'), str):
+                    char_count = len(data['text'])
+                
+                # Case 2: {"conversations": [...]} format
+                elif 'conversations' in data and isinstance(data.get('conversations'), list):
+                    # Sum characters from all 'value' fields in the conversation
+                    char_count = sum(
+                        len(turn.get('value', '')) 
+                        for turn in data['conversations'] 
+                        if isinstance(turn.get('value'), str)
+                    )
+                else:
+                    print(f"Warning: Skipping line {i} with unrecognized format.")
+                    skipped_entries += 1
+                    continue
                     
-                    # Case 2: {"conversations": [...]} format
-                    elif 'conversations' in data and isinstance(data.get('conversations'), list):
-                        # Sum characters from all 'value' fields in the conversation
-                        char_count = sum(
-                            len(turn.get('value', '')) 
-                            for turn in data['conversations'] 
-                            if isinstance(turn.get('value'), str)
-                        )
-                    else:
-                        print(f"Warning: Skipping line {i} with unrecognized format.")
-                        skipped_entries += 1
-                        continue
-                        
-                    # Update statistics
-                    total_entries += 1
-                    total_chars += char_count
-                    min_chars = min(min_chars, char_count)
-                    max_chars = max(max_chars, char_count)
+                # Update statistics
+                total_entries += 1
+                total_chars += char_count
+                min_chars = min(min_chars, char_count)
+                max_chars = max(max_chars, char_count)
 
-                except json.JSONDecodeError:
-                    print(f"Warning: Skipping malformed JSON on line {i}.")
-                    skipped_entries += 1
+            except jsonio.JSONDecodeError:
+                print(f"Warning: Skipping malformed JSON on line {i}.")
+                skipped_entries += 1
                     
     except FileNotFoundError:
         raise FileNotFoundError(f"Input file not found: {input_file}")
@@ -0,0 +1,157 @@
+# tools/checkpoint.py
+"""
+Checkpoint/resume support for long Processing Pipeline runs.
+
+Two files make a run resumable:
+- The run manifest (<input stem>_pipeline_manifest.json next to the input)
+  records every completed stage: the SHA-256 and record count of its input
+  and output, the step versions and the parameters. A resumed run skips the
+  stages whose entry still matches the files on disk.
+- A progress file (<output>.progress.json) is committed while a per-record
+  stage runs. It holds the input byte offset up to which every record has been
+  processed, the matching output sizes and the counters so far. A resumed run
+  truncates the outputs to those sizes and continues from that offset.
+"""
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+from tools import stage_cache
+
+MANIFEST_VERSION = 1
+
+
+def manifest_path_for(input_file):
+    p = Path(input_file)
+    return p.parent / f"{p.stem}_pipeline_manifest.json"
+
+
+def progress_path_for(output_file):
+    return f"{output_file}.progress.json"
+
+
+def _load_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _write_json_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def digest_and_count(path, cache_dir=None):
+    """Returns (sha256, line_count) of a file in one read, remembering the digest for stage_cache.file_digest."""
+    h = hashlib.sha256()
+    lines = 0
+    last_byte = b'\n'
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(stage_cache.HASH_BUFFER_SIZE), b''):
+            h.update(block)
+            lines += block.count(b'\n')
+            last_byte = block[-1:]
+    if last_byte != b'\n':
+        lines += 1
+    digest = h.hexdigest()
+    stage_cache.remember_digest(path, digest, cache_dir)
+    return digest, lines
+
+
+def stage_label(step_nums):
+    return ",".join(str(n) for n in step_nums)
+
+
+def record_stage(manifest_path, step_nums, signature, input_path, output_path, cache_dir=None):
+    """
+    Adds (or replaces) the manifest entry of a completed stage and returns it.
+    signature is a JSON-serializable dict of the step names, versions and parameters.
+    """
+    manifest = _load_json(manifest_path) or {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        manifest = {"version": MANIFEST_VERSION, "stages": {}}
+
+    output_digest, output_records = digest_and_count(output_path, cache_dir)
+    entry = {
+        "steps": list(step_nums),
+        "signature": signature,
+        "input_file": str(Path(input_path).resolve()),
+        "input_sha256": stage_cache.file_digest(input_path, cache_dir),
+        "output_file": str(Path(output_path).resolve()),
+        "output_sha256": output_digest,
+        "output_records": output_records,
+        "completed": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    manifest["stages"][stage_label(step_nums)] = entry
+    _write_json_atomic(manifest_path, manifest)
+    return entry
+
+
+def completed_stage(manifest_path, step_nums, signature, input_path, output_path, cache_dir=None):
+    """
+    Returns the manifest entry of this stage if it has the same signature and
+    its input and output files are still unchanged on disk, otherwise None.
+    """
+    manifest = _load_json(manifest_path)
+    if not manifest or manifest.get("version") != MANIFEST_VERSION:
+        return None
+    entry = manifest["stages"].get(stage_label(step_nums))
+    if entry is None or entry["signature"] != signature:
+        return None
+    if entry["output_file"] != str(Path(output_path).resolve()) or not os.path.isfile(output_path):
+        return None
+    if (stage_cache.file_digest(input_path, cache_dir) != entry["input_sha256"]
+            or stage_cache.file_digest(output_path, cache_dir) != entry["output_sha256"]):
+        return None
+    return entry
+
+
+def input_signature(input_path):
+    """Identifies the input of an interrupted stage without rehashing it."""
+    st = os.stat(input_path)
+    return {"input_file": str(Path(input_path).resolve()), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def load_progress(progress_path, expected):
+    """
+    Returns the committed progress state if it belongs to the same stage
+    (expected is compared with the state's "stage" field), otherwise None.
+    """
+    state = _load_json(progress_path)
+    if state is None or state.get("stage") != expected:
+        return None
+    return state
+
+
+def save_progress(progress_path, state):
+    _write_json_atomic(progress_path, state)
+
+
+def clear_progress(progress_path):
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+
+
+def counters_to_json(counters):
+    return {str(key): dict(counter) for key, counter in counters.items()}
+
+
+def counters_from_json(data, counters):
+    """Adds the saved counts back into a fresh counters dict from pipeline._new_counters."""
+    for key, counter in counters.items():
+        counter.update(data.get(str(key), {}))
+    return counters
+
+
+def truncate_file(path, size):
+    """Cuts a partially written output back to the last committed size."""
+    with open(path, 'r+b') as f:
+        f.truncate(size)
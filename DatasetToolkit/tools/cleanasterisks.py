@@ -1,7 +1,11 @@
-import json
 import re
 import argparse
 import sys
+from collections import Counter
+try:
+    from tools import jsonio
+except ImportError:  # run as a standalone script from the tools folder
+    import jsonio
 
 # --- Your Cleaning Logic (Preserved from your script) ---
 # This part is excellent and doesn't need to change.
@@ -10,6 +14,7 @@ import sys
 # 1. The regex using lookarounds to be extremely precise.
 find_pattern = r'(?<!\w)\*(\w+)\*(?!\w)'
 replace_pattern = r'\1'
+_compiled_find_pattern = re.compile(find_pattern)
 
 def clean_json_recursively(data):
     """
@@ -21,10 +26,21 @@ def clean_json_recursively(data):
     elif isinstance(data, list):
         return [clean_json_recursively(item) for item in data]
     elif isinstance(data, str):
-        return re.sub(find_pattern, replace_pattern, data)
+        return _compiled_find_pattern.sub(replace_pattern, data)
     else:
         return data
 
+def clean_asterisks_record(data, stats):
+    """
+    Cleans enclosing asterisks in every string of one parsed record.
+    Returns (record, changed).
+    """
+    cleaned_object = clean_json_recursively(data)
+    changed = cleaned_object != data
+    if changed:
+        stats['lines_changed'] += 1
+    return cleaned_object, changed
+
 # --- Main Script Execution (Modified for JSONL) ---
 
 def process_jsonl_file(input_file, output_file):
@@ -33,35 +49,31 @@ def process_jsonl_file(input_file, output_file):
     """
     lines_processed = 0
     lines_skipped = 0
+    stats = Counter()
     
     print(f"[*] Starting to clean {input_file}...")
     
     try:
-        with open(input_file, 'r', encoding='utf-8') as infile, \
-             open(output_file, 'w', encoding='utf-8') as outfile:
+        with jsonio.JsonlWriter(output_file) as outfile:
             
             # Process the file one line at a time
-            for i, line in enumerate(infile, 1):
+            for i, (_, raw, data_object) in enumerate(jsonio.iter_jsonl(input_file), 1):
                 # Skip empty or whitespace-only lines
-                if not line.strip():
+                if not raw.strip():
                     continue
                 
-                try:
-                    # 1. Load the JSON object from the current line
-                    data_object = json.loads(line)
-                    
-                    # 2. Apply your recursive cleaning function to this object
-                    cleaned_object = clean_json_recursively(data_object)
-                    
-                    # 3. Write the cleaned object back as a compact JSON string, followed by a newline
-                    #    ensure_ascii=False is important for non-English characters.
-                    outfile.write(json.dumps(cleaned_object, ensure_ascii=False) + '\n')
-                    lines_processed += 1
-                    
-                except json.JSONDecodeError:
+                if data_object is None:
                     # If a line is not valid JSON, print a warning and skip it
-                    print(f"Warning: Skipping malformed JSON on line {i}. Content: {line.strip()}", file=sys.stderr)
+                    print(f"Warning: Skipping malformed JSON on line {i}. Content: {jsonio.decode_line(raw).strip()}", file=sys.stderr)
                     lines_skipped += 1
+                    continue
+
+                # Apply your recursive cleaning function to this object
+                cleaned_object, changed = clean_asterisks_record(data_object, stats)
+
+                # Write the cleaned object back; untouched lines keep their original bytes.
+                outfile.write_record(cleaned_object, raw, changed)
+                lines_processed += 1
 
     except FileNotFoundError:
         print(f"Error: The file '{input_file}' was not found. Please check the name.", file=sys.stderr)
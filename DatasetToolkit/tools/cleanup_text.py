@@ -1,91 +1,122 @@
-import json
 import sys
 import re
-
-def cleanup_text_in_jsonl(input_file: str, output_file: str):
+from collections import Counter
+try:
+    from tools import jsonio
+except ImportError:  # run as a standalone script from the tools folder
+    import jsonio
+
+# Regex to find a line that ONLY contains a speaker name (e.g., "Firestorm:")
+speaker_only_pattern = re.compile(r"^[\s\n]*[\w\s]+:[\s\n]*$", re.IGNORECASE)
+
+# The cleanup rules, compiled once. They give the same result as the
+# original one-rule-per-re.sub version (see benchmarks/bench_cleanup_text.py).
+# 1. Block-level dividers become a paragraph break: **Scene:** and 'Scene:'
+#    markers, "-- end character info --" and runs of two or more dashes, in
+#    a single pass. The possessive dash run never takes the dashes that begin
+#    an end-of-info marker, which the marker rule must see first. The leading
+#    lookahead gives the regex engine a first-character set to skip ahead with.
+DIVIDER_PATTERN = re.compile(
+    r"(?=[\n*'-])(?:\n\s*)*(?:\*\*Scene:\*\*|'Scene:'"
+    r"|(?:-{2,}(?=-- end character info --))?-- end character info --"
+    r"|-{2,}+(?! end character info --))\s*(?:\n\s*)*",
+    re.IGNORECASE)
+# 2. Lines made only of whitespace and asterisks are emptied.
+BLANK_LINE_PATTERN = re.compile(r'^[\*\s]+$', re.MULTILINE)
+# 3. Markdown-like formatting: removes **, ***, etc., but preserves single *
+#    for italics. (The overly broad rule for single quotes was removed to
+#    avoid damaging dialogue like 'Hello, how are you?'.)
+BOLD_PATTERN = re.compile(r'\*{2,}')
+# 4. Three or more line breaks (with only whitespace between) become two.
+EXTRA_BLANK_LINES_PATTERN = re.compile(r'\n(\s*\n){2,}')
+
+def cleanup_turn_text(value):
     """
-    Reads a JSONL file, cleans specific text patterns from the 'value' field
-    of each turn, and removes turns that become empty after cleaning.
+    Cleans one turn's text. Returns None if the turn is only a speaker name
+    and should be dropped, otherwise the cleaned (stripped) text. Rules that
+    need a ':', '--', '**' or a line break are skipped for text without one.
     """
-    if not input_file or not output_file:
-        print("Error: Input and Output file paths must be provided.")
-        return
-
-    # Regex to find a line that ONLY contains a speaker name (e.g., "Firestorm:")
-    speaker_only_pattern = re.compile(r"^[\s\n]*[\w\s]+:[\s\n]*$", re.IGNORECASE)
-
-    total_lines_read, lines_with_changes = 0, 0
-
-    try:
-        with open(input_file, 'r', encoding='utf-8') as infile, \
-             open(output_file, 'w', encoding='utf-8') as outfile:
-
-            for i, line in enumerate(infile):
-                total_lines_read += 1
-                line_num = i + 1
-                made_change_this_line = False
-
-                try:
-                    data = json.loads(line)
-                    if 'conversations' not in data or not isinstance(data.get('conversations'), list):
-                        outfile.write(line)
-                        continue
-
-                    cleaned_conversations = []
-                    for turn in data['conversations']:
-                        if 'value' in turn and isinstance(turn['value'], str):
-                            original_value = turn['value']
-                            cleaned_value = original_value
+    if ':' in value and speaker_only_pattern.match(value):
+        return None
+    if ':' in value or '--' in value:
+        value = DIVIDER_PATTERN.sub('\n\n', value)
+    value = BLANK_LINE_PATTERN.sub('', value)
+    if '**' in value:
+        value = BOLD_PATTERN.sub('', value)
+    if '\n' in value:
+        value = EXTRA_BLANK_LINES_PATTERN.sub('\n\n', value)
+    return value.strip()
+
+def cleanup_text_record(data, stats):
+    """
+    Cleans the 'value' field of every turn in one parsed record and removes
+    turns that become empty after cleaning.
+    Returns (record, changed); record is None when no turns are left.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('conversations'), list):
+        return data, False
 
-                            # 1. Check if the turn is just a speaker name and remove it.
-                            if speaker_only_pattern.match(cleaned_value):
-                                made_change_this_line = True
-                                continue
+    made_change_this_line = False
+    dropped_turn = False
+    cleaned_conversations = []
+    for turn in data['conversations']:
+        if 'value' in turn and isinstance(turn['value'], str):
+            original_value = turn['value']
+            cleaned_value = cleanup_turn_text(original_value)
 
-                            # 2. Clean up block-level dividers and specific scene markers.
-                            #    This correctly handles 'Scene:' without affecting other quoted text.
-                            cleaned_value = re.sub(r"(\n\s*)*(\*\*Scene:\*\*|'Scene:')\s*(\n\s*)*", '\n\n', cleaned_value, flags=re.IGNORECASE)
-                            cleaned_value = re.sub(r'(\n\s*)*-- end character info --\s*(\n\s*)*', '\n\n', cleaned_value, flags=re.IGNORECASE)
-                            cleaned_value = re.sub(r'(\n\s*)*-{2,}\s*(\n\s*)*', '\n\n', cleaned_value)
-                            cleaned_value = re.sub(r'^\s*[\*\s]+\s*$', '', cleaned_value, flags=re.MULTILINE)
+            # A turn that is just a speaker name is removed.
+            if cleaned_value is None:
+                made_change_this_line = True
+                dropped_turn = True
+                continue
 
-                            # 3. Remove markdown-like formatting characters.
-                            #    Removes **, ***, etc., but preserves single * for italics.
-                            cleaned_value = re.sub(r'\*{2,}', '', cleaned_value)
+            if cleaned_value != original_value:
+                made_change_this_line = True
 
-                            # --- CORRECTED LOGIC ---
-                            # The overly broad rule for single quotes has been REMOVED
-                            # to avoid damaging dialogue like 'Hello, how are you?'.
-                            # The 'Scene:' rule above is sufficient for specific cases.
-                            # --- END CORRECTION ---
+            # If cleaning made the turn empty, skip it.
+            if not cleaned_value:
+                dropped_turn = True
+                continue
 
-                            # 4. Consolidate whitespace.
-                            cleaned_value = re.sub(r'\n(\s*\n){2,}', '\n\n', cleaned_value)
+            turn['value'] = cleaned_value
 
-                            # 5. Final cleanup.
-                            cleaned_value = cleaned_value.strip()
+        cleaned_conversations.append(turn)
 
-                            if cleaned_value != original_value:
-                                made_change_this_line = True
+    if made_change_this_line:
+        stats['lines_with_changes'] += 1
 
-                            # 6. If cleaning made the turn empty, skip it.
-                            if not cleaned_value:
-                                continue
+    if not cleaned_conversations:
+        return None, True
 
-                            turn['value'] = cleaned_value
+    data['conversations'] = cleaned_conversations
+    return data, made_change_this_line or dropped_turn
 
-                        cleaned_conversations.append(turn)
+def cleanup_text_in_jsonl(input_file: str, output_file: str):
+    """
+    Reads a JSONL file, cleans specific text patterns from the 'value' field
+    of each turn, and removes turns that become empty after cleaning.
+    """
+    if not input_file or not output_file:
+        print("Error: Input and Output file paths must be provided.")
+        return
 
-                    if made_change_this_line:
-                        lines_with_changes += 1
+    stats = Counter()
+    total_lines_read = 0
 
-                    if cleaned_conversations:
-                        data['conversations'] = cleaned_conversations
-                        outfile.write(json.dumps(data, ensure_ascii=False) + '\n')
+    try:
+        with jsonio.JsonlWriter(output_file) as outfile:
+            for i, (_, raw, data) in enumerate(jsonio.iter_jsonl(input_file)):
+                total_lines_read += 1
+                line_num = i + 1
 
-                except json.JSONDecodeError:
+                if data is None:
                     print(f"Warning: Line {line_num} is not valid JSON. Copying as-is.")
-                    outfile.write(line)
+                    outfile.write_raw(raw)
+                    continue
+
+                cleaned, changed = cleanup_text_record(data, stats)
+                if cleaned is not None:
+                    outfile.write_record(cleaned, raw, changed)
 
     except FileNotFoundError:
         print(f"Error: Input file not found at '{input_file}'")
@@ -93,7 +124,7 @@ def cleanup_text_in_jsonl(input_file: str, output_file: str):
 
     print("\n--- Text Cleanup Complete ---")
     print(f"Total lines read: {total_lines_read}")
-    print(f"Lines with changes: {lines_with_changes}")
+    print(f"Lines with changes: {stats['lines_with_changes']}")
     print(f"Cleaned data written to: '{output_file}'")
 
 if __name__ == "__main__":
@@ -1,6 +1,36 @@
-import json
 import argparse
 import sys
+from collections import Counter
+try:
+    from tools import jsonio
+except ImportError:  # run as a standalone script from the tools folder
+    import jsonio
+
+def remove_last_user_turn_record(data, stats, conversation_key='conversations', role_key='from', user_role='human'):
+    """
+    Removes the last turn of one parsed record if it's from the user.
+    Returns (record, changed); record is None when the conversation is empty.
+    """
+    changed = False
+    if not isinstance(data, dict):
+        return data, False
+
+    # Check if the conversation data is valid and non-empty
+    if conversation_key in data and data[conversation_key] and isinstance(data[conversation_key], list):
+        # Check the role of the last turn
+        last_turn = data[conversation_key][-1]
+        if isinstance(last_turn, dict) and last_turn.get(role_key) == user_role:
+            # If the last turn is from the user, remove it
+            data[conversation_key] = data[conversation_key][:-1]
+            stats['cleaned'] += 1
+            changed = True
+
+    # Only keep the record if the conversation list is not empty after cleaning.
+    if not data.get(conversation_key):
+        stats['skipped_empty'] += 1
+        return None, True
+
+    return data, changed
 
 def main(args):
     """
@@ -20,46 +50,33 @@ def main(args):
     print(f"    - Output will be saved to: {output_file_path}")
 
     # Keep track of how many conversations are modified
-    cleaned_count = 0
+    stats = Counter()
     total_count = 0
-    skipped_empty_count = 0
 
     try:
         # Open the input and output files
-        with open(input_file_path, 'r', encoding='utf-8') as infile, \
-             open(output_file_path, 'w', encoding='utf-8') as outfile:
+        with jsonio.JsonlWriter(output_file_path) as outfile:
             
-            for line in infile:
+            for _, raw, data in jsonio.iter_jsonl(input_file_path):
                 total_count += 1
                 
-                # Load the JSON object from the line
-                try:
-                    data = json.loads(line)
-                except json.JSONDecodeError:
-                    print(f"Warning: Skipping malformed JSON line {total_count}: {line.strip()}", file=sys.stderr)
+                if data is None:
+                    print(f"Warning: Skipping malformed JSON line {total_count}: {jsonio.decode_line(raw).strip()}", file=sys.stderr)
                     continue
 
-                # Check if the conversation data is valid and non-empty
-                if conversation_key in data and data[conversation_key] and isinstance(data[conversation_key], list):
-                    # Check the role of the last turn
-                    last_turn = data[conversation_key][-1]
-                    if isinstance(last_turn, dict) and last_turn.get(role_key) == user_role_name:
-                        # If the last turn is from the user, remove it
-                        data[conversation_key] = data[conversation_key][:-1]
-                        cleaned_count += 1
+                cleaned, changed = remove_last_user_turn_record(data, stats, conversation_key, role_key, user_role_name)
 
                 # Write the (potentially modified) data to the new file,
                 # but only if the conversation list is not empty after cleaning.
-                if data.get(conversation_key):
-                     outfile.write(json.dumps(data, ensure_ascii=False) + '\n')
+                if cleaned is not None:
+                     outfile.write_record(cleaned, raw, changed)
                 else:
-                     skipped_empty_count += 1
                      print(f"Info: Skipping conversation from line {total_count} as it became empty after cleaning.")
 
         print("\n[+] Processing Complete")
         print(f"    Total conversations read: {total_count}")
-        print(f"    Conversations cleaned (last user turn removed): {cleaned_count}")
-        print(f"    Conversations skipped (became empty): {skipped_empty_count}")
+        print(f"    Conversations cleaned (last user turn removed): {stats['cleaned']}")
+        print(f"    Conversations skipped (became empty): {stats['skipped_empty']}")
         print(f"    Cleaned data saved to: {output_file_path}")
 
     except FileNotFoundError:
@@ -1,5 +1,8 @@
-import json
 import os
+try:
+    from tools import jsonio
+except ImportError:  # run as a standalone script from the tools folder
+    import jsonio
 
 def load_json(filepath):
     """Loads a JSON file and returns its content. Handles errors."""
@@ -8,8 +11,8 @@ def load_json(filepath):
         return None
     try:
         with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except json.JSONDecodeError:
+            return jsonio.load(f)
+    except jsonio.JSONDecodeError:
         print(f"Error: Could not decode JSON from '{filepath}'.")
         return None
     except Exception as e:
@@ -89,7 +92,7 @@ def main():
     # 4. Write the report to a file
     try:
         with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, indent=4)
+            jsonio.dump(output_data, f, ensure_ascii=True, indent=4)
         print("\n--- Comparison Report ---")
         print(f"Items with different text: {len(content_differences)}")
         print(f"Unmatched items (in longer file): {len(unmatched_items)}")
@@ -1,4 +1,7 @@
-import json
+try:
+    from tools import jsonio
+except ImportError:  # run as a standalone script from the tools folder
+    import jsonio
 
 def extract_innermost_text(data_object):
     """
@@ -22,12 +25,12 @@ def convert_pretraining_json_to_jsonl(input_file, output_file):
     print(f"[*] Starting conversion from {input_file} to {output_file}...")
     lines_written = 0
     try:
-        with open(input_file, 'r', encoding='utf-8') as infile, \
-             open(output_file, 'w', encoding='utf-8') as outfile:
+        with open(input_file, 'rb') as infile, \
+             jsonio.JsonlWriter(output_file) as outfile:
             
             try:
-                data = json.load(infile)
-            except json.JSONDecodeError:
+                data = jsonio.load(infile)
+            except jsonio.JSONDecodeError:
                 raise Exception(f"Invalid JSON in {input_file}. Please check the file format.")
 
             if not isinstance(data, list):
@@ -38,7 +41,7 @@ def convert_pretraining_json_to_jsonl(input_file, output_file):
                 text_content = extract_innermost_text(item)
                 if text_content:
                     output_record = {"text": text_content}
-                    outfile.write(json.dumps(output_record, ensure_ascii=False) + '\n')
+                    outfile.write(output_record)
                     lines_written += 1
 
     except FileNotFoundError:
@@ -1,7 +1,10 @@
 # tools/convert_txt_to_Json.py
-import json
 import os
 import glob
+try:
+    from tools import jsonio
+except ImportError:  # run as a standalone script from the tools folder
+    import jsonio
 
 def convert_multiple_txt_to_json(input_directory, output_file_path):
     all_data = []
@@ -26,7 +29,7 @@ def convert_multiple_txt_to_json(input_directory, output_file_path):
     
     try:
         with open(output_file_path, 'w', encoding='utf-8') as json_file:
-            json.dump(all_data, json_file, ensure_ascii=False, indent=2)
+            jsonio.dump(all_data, json_file, indent=2)
         print(f"\n✅ Success! All files have been combined into {output_file_path}")
     except Exception as e:
         raise Exception(f"Error writing to JSON file: {e}")
\ No newline at end of file
@@ -1,7 +1,10 @@
 # tools/convert_txt_to_jsonl.py
-import json
 import os
 import glob
+try:
+    from tools import jsonio
+except ImportError:  # run as a standalone script from the tools folder
+    import jsonio
 
 def convert_multiple_txt_to_jsonl(input_directory, output_file_path):
     all_data = []
@@ -25,9 +28,9 @@ def convert_multiple_txt_to_jsonl(input_directory, output_file_path):
             # Optional: raise e to stop the process on first error
     
     try:
-        with open(output_file_path, 'w', encoding='utf-8') as jsonl_file:
+        with jsonio.JsonlWriter(output_file_path) as jsonl_file:
             for entry in all_data:
-                jsonl_file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                jsonl_file.write(entry)
         print(f"\n✅ Success! All files have been combined into {output_file_path}")
     except Exception as e:
         raise Exception(f"Error writing to JSONL file: {e}")
\ No newline at end of file
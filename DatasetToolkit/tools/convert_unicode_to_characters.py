@@ -1,6 +1,10 @@
-import json
 import argparse
 import sys
+from collections import Counter
+try:
+    from tools import jsonio
+except ImportError:  # run as a standalone script from the tools folder
+    import jsonio
 
 def fix_mojibake(text: str) -> str:
     """
@@ -19,6 +23,29 @@ def fix_mojibake(text: str) -> str:
         # In that case, we return the original text untouched.
         return text
 
+def fix_mojibake_recursive(obj):
+    """Recursively applies fix_mojibake to every string inside a parsed JSON value."""
+    if isinstance(obj, dict):
+        return {k: fix_mojibake_recursive(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [fix_mojibake_recursive(elem) for elem in obj]
+    elif isinstance(obj, str):
+        # Apply the mojibake fix to each string value.
+        return fix_mojibake(obj)
+    else:
+        return obj
+
+def normalize_unicode_record(data, stats):
+    """
+    Fixes mojibake in every string of one parsed record.
+    Returns (record, changed).
+    """
+    fixed_data_object = fix_mojibake_recursive(data)
+    changed = fixed_data_object != data
+    if changed:
+        stats['lines_fixed'] += 1
+    return fixed_data_object, changed
+
 def normalize_unicode_in_jsonl(input_file: str, output_file: str):
     """
     Reads a JSONL file, decodes Unicode escapes, fixes common encoding
@@ -34,42 +61,25 @@ def normalize_unicode_in_jsonl(input_file: str, output_file: str):
     lines_skipped = 0
 
     try:
-        # It's still best practice to open with utf-8 and error handling.
-        with open(input_file, 'r', encoding='utf-8', errors='replace') as infile, \
-             open(output_file, 'w', encoding='utf-8') as outfile:
+        # iter_jsonl replaces invalid UTF-8 like errors='replace' does.
+        with jsonio.JsonlWriter(output_file) as outfile:
 
-            for i, line in enumerate(infile, 1):
-                if not line.strip():
+            for i, (_, raw, data_object) in enumerate(jsonio.iter_jsonl(input_file), 1):
+                if not raw.strip():
                     continue
 
-                try:
-                    # 1. Load the JSON object from the line.
-                    data_object = json.loads(line)
-
-                    # 2. Recursively traverse the JSON to find and fix all strings.
-                    def recursive_fix(obj):
-                        if isinstance(obj, dict):
-                            return {k: recursive_fix(v) for k, v in obj.items()}
-                        elif isinstance(obj, list):
-                            return [recursive_fix(elem) for elem in obj]
-                        elif isinstance(obj, str):
-                            # Apply the mojibake fix to each string value.
-                            return fix_mojibake(obj)
-                        else:
-                            return obj
-
-                    fixed_data_object = recursive_fix(data_object)
-
-                    # 3. Write the fixed object back to a string, ensuring that
-                    #    actual Unicode characters are written, not \uXXXX escapes.
-                    normalized_line = json.dumps(fixed_data_object, ensure_ascii=False)
-
-                    outfile.write(normalized_line + '\n')
-                    lines_processed += 1
-
-                except json.JSONDecodeError:
-                    print(f"Warning: Skipping malformed JSON on line {i}. Content: {line.strip()}", file=sys.stderr)
+                if data_object is None:
+                    print(f"Warning: Skipping malformed JSON on line {i}. Content: {jsonio.decode_line(raw).strip()}", file=sys.stderr)
                     lines_skipped += 1
+                    continue
+
+                # Recursively traverse the JSON to find and fix all strings.
+                fixed_data_object, changed = normalize_unicode_record(data_object, Counter())
+
+                # Records are written with actual Unicode characters, not \uXXXX
+                # escapes; only lines without escapes or mojibake keep their bytes.
+                outfile.write_record(fixed_data_object, raw, changed or b'\\u' in raw)
+                lines_processed += 1
 
     except FileNotFoundError:
         print(f"Error: Input file not found at '{input_file}'", file=sys.stderr)
@@ -1,4 +1,7 @@
-import json
+try:
+    from tools import jsonio
+except ImportError:  # run as a standalone script from the tools folder
+    import jsonio
 
 # --- Configuration ---
 # You can change these file names if needed
@@ -15,19 +18,19 @@ def find_unused_text_chunks():
         # Step 1: Load the master file
         # The master file is a list of dictionaries: [{"text": "..."}, {"text": "..."}]
         with open(MASTER_FILE, 'r', encoding='utf-8') as f:
-            master_data = json.load(f)
+            master_data = jsonio.load(f)
         print(f"Successfully loaded {len(master_data)} chunks from '{MASTER_FILE}'.")
 
         # Step 2: Load the resulting file
         # The resulting file is a dictionary of dictionaries: {"0": {"text": "..."}, "1": {"text": "..."}}
         with open(RESULTING_FILE, 'r', encoding='utf-8') as f:
-            resulting_data = json.load(f)
+            resulting_data = jsonio.load(f)
         print(f"Successfully loaded {len(resulting_data)} chunks from '{RESULTING_FILE}'.")
 
     except FileNotFoundError as e:
         print(f"Error: Could not find the file '{e.filename}'. Please ensure it's in the same directory.")
         return
-    except json.JSONDecodeError as e:
+    except jsonio.JSONDecodeError as e:
         print(f"Error: Could not parse a JSON file. Please check for syntax errors. Details: {e}")
         return
 
@@ -55,7 +58,7 @@ def find_unused_text_chunks():
     # Step 6: Write the list of unused chunks to the output file
     with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
         # Use indent=4 for a pretty, human-readable JSON output
-        json.dump(unused_chunks, f, indent=4)
+        jsonio.dump(unused_chunks, f, ensure_ascii=True, indent=4)
         
     print(f"Successfully wrote the {len(unused_chunks)} unused chunks to '{OUTPUT_FILE}'.")
     print("Job complete!")
@@ -1,4 +1,7 @@
-import json
+try:
+    from tools import jsonio
+except ImportError:  # run as a standalone script from the tools folder
+    import jsonio
 
 def find_unused_text_chunks(master_file, resulting_file, output_file):
     """
@@ -17,19 +20,19 @@ def find_unused_text_chunks(master_file, resulting_file, output_file):
         # Step 1: Load the master file
         # The master file is a list of dictionaries: [{"text": "..."}, {"text": "..."}]
         with open(master_file, 'r', encoding='utf-8') as f:
-            master_data = json.load(f)
+            master_data = jsonio.load(f)
         print(f"Successfully loaded {len(master_data)} chunks from '{master_file}'.")
 
         # Step 2: Load the resulting file
         # The resulting file is a dictionary of dictionaries: {"0": {"text": "..."}, "1": {"text": "..."}}
         with open(resulting_file, 'r', encoding='utf-8') as f:
-            resulting_data = json.load(f)
+            resulting_data = jsonio.load(f)
         print(f"Successfully loaded {len(resulting_data)} chunks from '{resulting_file}'.")
 
     except FileNotFoundError as e:
         print(f"Error: Could not find the file '{e.filename}'. Please ensure it's in the same directory.")
         raise e # Re-raise for the GUI to catch
-    except json.JSONDecodeError as e:
+    except jsonio.JSONDecodeError as e:
         print(f"Error: Could not parse a JSON file. Please check for syntax errors. Details: {e}")
         raise e # Re-raise for the GUI to catch
 
@@ -51,7 +54,7 @@ def find_unused_text_chunks(master_file, resulting_file, output_file):
     # Step 6: Write the list of unused chunks to the output file
     with open(output_file, 'w', encoding='utf-8') as f:
         # Use indent=4 for a pretty, human-readable JSON output
-        json.dump(unused_chunks, f, indent=4)
+        jsonio.dump(unused_chunks, f, ensure_ascii=True, indent=4)
         
     print(f"Successfully wrote the {len(unused_chunks)} unused chunks to '{output_file}'.")
     print("Job complete!")
\ No newline at end of file
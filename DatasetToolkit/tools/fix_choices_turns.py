@@ -1,6 +1,29 @@
-import json
 import os
 import sys
+from collections import Counter
+try:
+    from tools import jsonio
+except ImportError:  # run as a standalone script from the tools folder
+    import jsonio
+
+def fix_choices_tags_record(data, stats):
+    """
+    Appends '\n</choices>' to every GPT turn of one parsed record that opens
+    a '<choices>' tag without closing it. Returns (record, changed).
+    """
+    changed = False
+    if isinstance(data, dict) and 'conversations' in data and isinstance(data['conversations'], list):
+        for turn in data['conversations']:
+            if turn.get('from') == 'gpt' and 'value' in turn:
+                value_str = turn['value']
+                starts_with_choices = value_str.strip().startswith('<choices>')
+                ends_with_choices = value_str.strip().endswith('</choices>')
+
+                if starts_with_choices and not ends_with_choices:
+                    turn['value'] = value_str + '\n</choices>'
+                    stats['fixed_turns'] += 1
+                    changed = True
+    return data, changed
 
 def fix_choices_tags_in_jsonl(input_file, output_file):
     """
@@ -8,7 +31,7 @@ def fix_choices_tags_in_jsonl(input_file, output_file):
     but not closed by appending '\n</choices>'.
     This is intended to be called as part of a larger processing pipeline.
     """
-    fixed_turns_count = 0
+    stats = Counter()
     total_lines_count = 0
 
     if not os.path.exists(input_file):
@@ -17,31 +40,20 @@ def fix_choices_tags_in_jsonl(input_file, output_file):
 
     print(f"Starting to process '{os.path.basename(input_file)}' for unclosed <choices> tags...")
 
-    with open(input_file, 'r', encoding='utf-8') as infile, \
-         open(output_file, 'w', encoding='utf-8') as outfile:
+    with jsonio.JsonlWriter(output_file) as outfile:
 
-        for line in infile:
+        for _, raw, data in jsonio.iter_jsonl(input_file):
             total_lines_count += 1
+            if data is None:
+                print(f"Warning: Could not decode JSON on line {total_lines_count}. Copying as-is.", file=sys.stderr)
+                outfile.write_raw(raw)
+                continue
             try:
-                data = json.loads(line)
-                if 'conversations' in data and isinstance(data['conversations'], list):
-                    for turn in data['conversations']:
-                        if turn.get('from') == 'gpt' and 'value' in turn:
-                            value_str = turn['value']
-                            starts_with_choices = value_str.strip().startswith('<choices>')
-                            ends_with_choices = value_str.strip().endswith('</choices>')
+                data, changed = fix_choices_tags_record(data, stats)
+                outfile.write_record(data, raw, changed)
 
-                            if starts_with_choices and not ends_with_choices:
-                                turn['value'] = value_str + '\n</choices>'
-                                fixed_turns_count += 1
-
-                outfile.write(json.dumps(data) + '\n')
-
-            except json.JSONDecodeError:
-                print(f"Warning: Could not decode JSON on line {total_lines_count}. Copying as-is.", file=sys.stderr)
-                outfile.write(line)
             except Exception as e:
                 print(f"An unexpected error occurred on line {total_lines_count}: {e}. Skipping.", file=sys.stderr)
 
     print(f"Total lines read: {total_lines_count}")
-    print(f"Total individual GPT turns with unclosed <choices> fixed: {fixed_turns_count}")
\ No newline at end of file
+    print(f"Total individual GPT turns with unclosed <choices> fixed: {stats['fixed_turns']}")
\ No newline at end of file
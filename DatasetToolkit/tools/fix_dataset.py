@@ -1,5 +1,8 @@
-import json
 from pathlib import Path
+try:
+    from tools import jsonio
+except ImportError:  # run as a standalone script from the tools folder
+    import jsonio
 
 # --- Configuration (used for standalone execution) ---
 # 1. Set the path to your original dataset file
@@ -65,29 +68,26 @@ def fix_consecutive_turns(input_file, output_file):
     total_lines = 0
     total_merges = 0
 
-    with open(input_file_path, 'r', encoding='utf-8') as infile, \
-         open(output_file_path, 'w', encoding='utf-8') as outfile:
+    with jsonio.JsonlWriter(output_file_path) as outfile:
         
-        for line in infile:
+        for _, raw, data in jsonio.iter_jsonl(input_file_path):
             total_lines += 1
-            try:
-                data = json.loads(line)
-                
-                # The 'conversations' field holds the list of turns
-                if 'conversations' in data:
-                    original_turns = data['conversations']
-                    corrected_turns, merges = process_conversation(original_turns)
-                    
-                    data['conversations'] = corrected_turns
-                    total_merges += merges
-                
-                # Write the corrected JSON object back to the new file
-                outfile.write(json.dumps(data) + '\n')
-
-            except json.JSONDecodeError:
+            if data is None:
                 print(f"Warning: Skipping malformed JSON line at line number {total_lines}")
                 continue
 
+            merges = 0
+            # The 'conversations' field holds the list of turns
+            if 'conversations' in data:
+                original_turns = data['conversations']
+                corrected_turns, merges = process_conversation(original_turns)
+                
+                data['conversations'] = corrected_turns
+                total_merges += merges
+            
+            # Write the corrected JSON object back to the new file
+            outfile.write_record(data, raw, merges > 0)
+
     print("\nCorrection complete!")
     print(f"Processed {total_lines} conversations.")
     print(f"Performed a total of {total_merges} merges.")
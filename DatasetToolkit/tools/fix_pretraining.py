@@ -1,5 +1,8 @@
-import json
 import sys
+try:
+    from tools import jsonio
+except ImportError:  # run as a standalone script from the tools folder
+    import jsonio
 
 # Check if a filename was provided
 if len(sys.argv) < 2:
@@ -14,8 +17,8 @@ with open(filepath, 'r', encoding='utf-8') as f:
     for i, line in enumerate(f):
         try:
             # Try to parse the line as JSON
-            json.loads(line)
-        except json.JSONDecodeError as e:
+            jsonio.loads(line)
+        except jsonio.JSONDecodeError as e:
             print(f"--- ERROR FOUND ON LINE {i+1} ---")
             print(f"Error: {e}")
             # Print the first 300 characters of the problematic line
@@ -1,8 +1,12 @@
 #!/usr/bin/env python3
-import json
 import argparse
 import sys
 import re
+from collections import Counter
+try:
+    from tools import jsonio
+except ImportError:  # run as a standalone script from the tools folder
+    import jsonio
 
 def split_collapsed_turns(conversations):
     """
@@ -84,45 +88,53 @@ def merge_misplaced_thinking_blocks(conversations):
     return merged_conversations, was_merged
 
 
+def fix_thinking_turns_record(data, stats):
+    """
+    Applies the two-pass fix (split collapsed turns, then merge misplaced
+    thinking blocks) to one parsed record. Returns (record, changed).
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('conversations'), list):
+        return data, False
+
+    # --- TWO-PASS FIXING PROCESS ---
+    original_conversations = data['conversations']
+
+    # Pass 1: Split any collapsed GPT turns
+    pass1_conversations, was_split = split_collapsed_turns(original_conversations)
+
+    # Pass 2: Merge any misplaced thinking blocks
+    pass2_conversations, was_merged = merge_misplaced_thinking_blocks(pass1_conversations)
+
+    if was_split or was_merged:
+        stats['records_fixed'] += 1
+        data['conversations'] = pass2_conversations
+        return data, True
+    return data, False
+
+
 def process_jsonl_file(input_path, output_path):
     """
     Reads a JSONL file, applies a two-pass fix to the conversations,
     and writes the corrected data to a new file.
     """
     lines_processed = 0
-    records_fixed = 0
+    stats = Counter()
     
     try:
         print(f"Reading from: {input_path}")
         print(f"Writing to:   {output_path}\n")
         
-        with open(input_path, 'r', encoding='utf-8') as infile, \
-             open(output_path, 'w', encoding='utf-8') as outfile:
+        with jsonio.JsonlWriter(output_path) as outfile:
             
-            for line in infile:
+            for _, raw, data in jsonio.iter_jsonl(input_path):
                 lines_processed += 1
-                try:
-                    data = json.loads(line)
-                except json.JSONDecodeError:
-                    print(f"Warning: Skipping malformed JSON on line {lines_processed}: {line.strip()}", file=sys.stderr)
-                    outfile.write(line)
+                if data is None:
+                    print(f"Warning: Skipping malformed JSON on line {lines_processed}: {jsonio.decode_line(raw).strip()}", file=sys.stderr)
+                    outfile.write_raw(raw)
                     continue
 
-                if 'conversations' in data and isinstance(data['conversations'], list):
-                    # --- TWO-PASS FIXING PROCESS ---
-                    original_conversations = data['conversations']
-                    
-                    # Pass 1: Split any collapsed GPT turns
-                    pass1_conversations, was_split = split_collapsed_turns(original_conversations)
-                    
-                    # Pass 2: Merge any misplaced thinking blocks
-                    pass2_conversations, was_merged = merge_misplaced_thinking_blocks(pass1_conversations)
-                    
-                    if was_split or was_merged:
-                        records_fixed += 1
-                        data['conversations'] = pass2_conversations
-                
-                outfile.write(json.dumps(data, ensure_ascii=False) + '\n')
+                data, changed = fix_thinking_turns_record(data, stats)
+                outfile.write_record(data, raw, changed)
 
     except FileNotFoundError:
         print(f"Error: Input file not found at '{input_path}'", file=sys.stderr)
@@ -131,8 +143,8 @@ def process_jsonl_file(input_path, output_path):
     print("---")
     print("Processing complete.")
     print(f"Total lines (records) processed: {lines_processed}")
-    print(f"Total records fixed: {records_fixed}")
-    if records_fixed > 0:
+    print(f"Total records fixed: {stats['records_fixed']}")
+    if stats['records_fixed'] > 0:
         print("\nSuccess! The script found and corrected malformed records.")
         print("Both 'collapsed turns' and 'misplaced thinking blocks' have been fixed.")
     else:
@@ -1,17 +1,56 @@
 # fix_turn_structure_final.py
-import json
 import sys
 import re
+from collections import Counter
 from typing import List, Dict, Any, Tuple
+try:
+    from tools import jsonio
+except ImportError:  # run as a standalone script from the tools folder
+    import jsonio
 
 # --- Constants for Role Identification ---
 OOC_PATTERN = re.compile(r'^ooc:', re.IGNORECASE)
-USER_TAG_PATTERN = re.compile(r'^\s*{user}:\s*', re.IGNORECASE)
-NARRATOR_TAG_PATTERN = re.compile(r'^\s*{narrator}:\s*', re.IGNORECASE)
+USER_TAG = r'\{user\}:'
+NARRATOR_TAG = r'\{narrator\}:'
 # Matches "Name:\n" or "Name:" at the start of a line
-NAME_DELIMITER_PATTERN = re.compile(r'^\s*[A-Za-z][A-Za-z\s]+:\s*', re.MULTILINE)
+NAME_DELIMITER = r'\s*[A-Za-z][A-Za-z\s]+:'
 # Matches "Name (Emotion): "dialogue"" - a strong GPT signal
-DIALOGUE_PATTERN = re.compile(r'^\s*[A-Za-z\s]+\s*\([^)]+\):\s*".*', re.MULTILINE)
+DIALOGUE = r'[A-Za-z\s]+\([^)]+\):\s*"'
+
+# A blank line followed by one of the markers starts a new segment. Written as
+# \n\n+ rather than \n{2,} so the regex engine can skip ahead to the next
+# literal "\n\n" instead of trying the pattern at every position.
+SEGMENT_BOUNDARY_PATTERN = re.compile(
+    r'\n\n+(?=' + '|'.join((USER_TAG, NARRATOR_TAG, 'ooc:', NAME_DELIMITER, DIALOGUE)) + ')',
+    re.IGNORECASE)
+# Classifies a stripped segment in one match: the "user" group is the tag to
+# remove from a human segment, any other match makes the segment a gpt one.
+SEGMENT_ROLE_PATTERN = re.compile(
+    r'(?P<user>\s*(?i:' + USER_TAG + r')\s*)|' + NAME_DELIMITER + '|' + DIALOGUE + '|(?i:' + NARRATOR_TAG + ')')
+
+
+def iter_segments(text: str, default_role: str):
+    """
+    Walks one turn once and yields (role, segment) for each logical segment,
+    empty ones included so that the caller can count the splits.
+    """
+    start = 0
+    while True:
+        boundary = SEGMENT_BOUNDARY_PATTERN.search(text, start)
+        end = boundary.start() if boundary else len(text)
+        segment = text[start:end].strip()
+        role = default_role
+        match = SEGMENT_ROLE_PATTERN.match(segment)
+        if match:
+            if match.lastgroup == 'user':
+                role = 'human'
+                segment = segment[match.end():].strip()
+            else:
+                role = 'gpt'
+        yield role, segment
+        if boundary is None:
+            return
+        start = boundary.end()
 
 
 def pass_1_split_and_normalize(conversations: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
@@ -27,30 +66,12 @@ def pass_1_split_and_normalize(conversations: List[Dict[str, Any]]) -> Tuple[Lis
         if not original_value:
             continue
 
-        # Split by markers that indicate a new turn, keeping the marker.
-        split_pattern = r'\n{2,}(?=(?:{user}:|{narrator}:|ooc:|' + NAME_DELIMITER_PATTERN.pattern + r'|' + DIALOGUE_PATTERN.pattern + r'))'
-        segments = re.split(split_pattern, original_value, flags=re.IGNORECASE | re.MULTILINE)
-
-        if len(segments) > 1:
-            fixes_made += len(segments) - 1
-
-        for segment_text in segments:
-            segment_text = segment_text.strip()
-            if not segment_text:
-                continue
-            
-            # Assign a preliminary role based on content with priority
-            role = turn['from']
-            if USER_TAG_PATTERN.match(segment_text):
-                role = 'human'
-                segment_text = USER_TAG_PATTERN.sub('', segment_text).strip()
-            elif (NAME_DELIMITER_PATTERN.match(segment_text) or 
-                  DIALOGUE_PATTERN.match(segment_text) or
-                  NARRATOR_TAG_PATTERN.match(segment_text)):
-                role = 'gpt'
-            
+        segment_count = 0
+        for role, segment_text in iter_segments(original_value, turn['from']):
+            segment_count += 1
             if segment_text:
                 processed_turns.append({'from': role, 'value': segment_text})
+        fixes_made += segment_count - 1
 
     return processed_turns, fixes_made
 
@@ -107,47 +128,64 @@ def pass_2_reconstruct_with_state(conversations: List[Dict[str, Any]]) -> Tuple[
     return final_turns, fixes_made
 
 
+def fix_turn_structure_record(data: Dict[str, Any], stats: Counter) -> Tuple[Dict[str, Any], bool]:
+    """
+    Runs both cleaning passes on one parsed record, keeping the first turn
+    (the system prompt) untouched. Returns (record, changed).
+    """
+    if not isinstance(data, dict) or 'conversations' not in data or not data['conversations']:
+        return data, False
+
+    system_prompt = data['conversations'][0]
+    turns_to_process = data['conversations'][1:]
+
+    # --- The Cleaning Pipeline ---
+    pass1_turns, fixes1 = pass_1_split_and_normalize(turns_to_process)
+    final_turns, fixes2 = pass_2_reconstruct_with_state(pass1_turns)
+
+    total_fixes = fixes1 + fixes2
+    if total_fixes > 0:
+        stats['lines_fixed'] += 1
+        stats['fixes_applied'] += total_fixes
+
+    new_conversations = [system_prompt] + final_turns
+    changed = new_conversations != data['conversations']
+    data['conversations'] = new_conversations
+    return data, changed
+
+
 def fix_turn_structure(input_file: str, output_file: str):
     """
     Main function to process a JSONL file and fix conversation structures.
     """
-    total_lines_read, total_lines_fixed, total_fixes_applied = 0, 0, 0
+    total_lines_read = 0
+    stats = Counter()
     print(f"Starting cleanup of '{input_file}'...")
     
-    with open(input_file, 'r', encoding='utf-8') as infile, \
-         open(output_file, 'w', encoding='utf-8') as outfile:
+    with jsonio.JsonlWriter(output_file) as outfile:
         
-        for i, line in enumerate(infile):
+        for i, (_, raw, data) in enumerate(jsonio.iter_jsonl(input_file)):
             total_lines_read += 1
+            if data is None:
+                print(f"Error on line {i+1}: not valid JSON. Skipping line.", file=sys.stderr)
+                outfile.write_raw(raw)
+                continue
             try:
-                data = json.loads(line)
                 if 'conversations' not in data or not data['conversations']:
-                    outfile.write(line)
+                    outfile.write_raw(raw)
                     continue
                 
-                system_prompt = data['conversations'][0]
-                turns_to_process = data['conversations'][1:]
-                
-                # --- The Cleaning Pipeline ---
-                pass1_turns, fixes1 = pass_1_split_and_normalize(turns_to_process)
-                final_turns, fixes2 = pass_2_reconstruct_with_state(pass1_turns)
-                
-                total_fixes = fixes1 + fixes2
-                if total_fixes > 0:
-                    total_lines_fixed += 1
-                    total_fixes_applied += total_fixes
-                
-                data['conversations'] = [system_prompt] + final_turns
-                outfile.write(json.dumps(data, ensure_ascii=False) + '\n')
+                data, changed = fix_turn_structure_record(data, stats)
+                outfile.write_record(data, raw, changed)
 
-            except (json.JSONDecodeError, Exception) as e:
+            except Exception as e:
                 print(f"Error on line {i+1}: {e}. Skipping line.", file=sys.stderr)
-                outfile.write(line)
+                outfile.write_raw(raw)
 
     print("\n--- Turn Structure Correction Complete ---")
     print(f"Total lines processed: {total_lines_read}")
-    print(f"Conversations with fixes: {total_lines_fixed}")
-    print(f"Total individual fixes applied: {total_fixes_applied}")
+    print(f"Conversations with fixes: {stats['lines_fixed']}")
+    print(f"Total individual fixes applied: {stats['fixes_applied']}")
     print(f"Output written to: '{output_file}'")
 
 
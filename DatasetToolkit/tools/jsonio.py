@@ -0,0 +1,223 @@
+# tools/jsonio.py
+"""
+Shared JSON (de)serialization and streaming JSONL I/O for the JSONL tools.
+
+Uses orjson or msgspec when one is installed and the standard library json
+module otherwise. Set $DATASET_TOOLKIT_JSON_BACKEND to "orjson", "msgspec" or
+"json" to force a backend.
+
+The fast backends write compact UTF-8 JSON (no spaces after separators).
+Input they reject but the json module accepts (NaN, lone surrogate escapes) is
+handed to the json module, so what parses and what raises JSONDecodeError is
+the same on every backend. Two differences remain: NaN/Infinity are written
+as null, and orjson reads integers beyond 64 bits as floats. Output with
+ensure_ascii=True or an indent always goes through the json module, so those
+files keep their exact formatting.
+
+iter_jsonl and JsonlWriter read and write JSONL in binary with large buffers.
+The writer passes unchanged records through as their original bytes, so only
+records a tool modified are re-serialized (as UTF-8, never \\uXXXX escapes).
+"""
+import json
+import os
+
+JSONDecodeError = json.JSONDecodeError
+
+
+def _select_backend():
+    requested = os.environ.get("DATASET_TOOLKIT_JSON_BACKEND", "").strip().lower()
+    candidates = [requested] if requested else ["orjson", "msgspec"]
+    for name in candidates:
+        if name == "json":
+            return "json", None
+        try:
+            if name == "orjson":
+                import orjson
+                return "orjson", orjson
+            if name == "msgspec":
+                import msgspec
+                return "msgspec", msgspec
+        except ImportError:
+            continue
+    return "json", None
+
+
+BACKEND, _module = _select_backend()
+
+if BACKEND == "orjson":
+    _fast_loads = _module.loads
+    _fast_dumps = _module.dumps
+    _decode_errors = (_module.JSONDecodeError,)
+    _encode_errors = (TypeError, ValueError, OverflowError)
+elif BACKEND == "msgspec":
+    _decoder = _module.json.Decoder()
+    _encoder = _module.json.Encoder()
+    _fast_loads = _decoder.decode
+    _fast_dumps = _encoder.encode
+    _decode_errors = (_module.DecodeError,)
+    _encode_errors = (TypeError, ValueError, OverflowError, _module.EncodeError)
+else:
+    _fast_loads = None
+    _fast_dumps = None
+
+
+def loads(s):
+    """Parses one JSON document from str or bytes. Raises JSONDecodeError on invalid input."""
+    # A decoded non-ASCII str is parsed faster by the json module, which slices
+    # its strings out of it instead of re-decoding them from UTF-8.
+    if _fast_loads is not None and (type(s) is not str or s.isascii()):
+        try:
+            return _fast_loads(s)
+        except _decode_errors:
+            pass
+    return json.loads(s)
+
+
+def dumps(obj, ensure_ascii=False):
+    """Serializes obj to a single-line JSON str."""
+    if _fast_dumps is not None and not ensure_ascii:
+        try:
+            return _fast_dumps(obj).decode('utf-8')
+        except _encode_errors:
+            # Surrogates, non-str keys, huge ints, unknown types: the json module decides.
+            pass
+    return json.dumps(obj, ensure_ascii=ensure_ascii)
+
+
+def load(fp):
+    """Parses a whole JSON file from an open text or binary file object."""
+    return loads(fp.read())
+
+
+def dump(obj, fp, ensure_ascii=False, indent=None):
+    """Writes obj to an open text file object."""
+    if indent is not None or ensure_ascii:
+        json.dump(obj, fp, ensure_ascii=ensure_ascii, indent=indent)
+    else:
+        fp.write(dumps(obj))
+
+
+# --- Streaming JSONL I/O ---
+
+READ_BUFFER_SIZE = 16 * 1024 * 1024
+WRITE_BUFFER_SIZE = 16 * 1024 * 1024
+WRITE_BATCH_LINES = 4096
+
+if BACKEND == "orjson":
+    _fast_dumpb = _module.dumps
+elif BACKEND == "msgspec":
+    _fast_dumpb = _encoder.encode
+else:
+    _fast_dumpb = None
+
+
+def dumpb(obj):
+    """Serializes obj to single-line UTF-8 JSON bytes (ensure_ascii=False)."""
+    if _fast_dumpb is not None:
+        try:
+            return _fast_dumpb(obj)
+        except _encode_errors:
+            pass
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+def iter_jsonl(path, start=0, end=None):
+    """
+    Reads a JSONL file with a large buffer and yields (byte_offset, raw, data)
+    for every line that starts inside [start, end).
+
+    raw is the line as bytes, always ending in b'\\n' (CRLF is normalized), so it
+    can be written back unchanged. data is the parsed record, or None for a
+    line that isn't valid JSON (blank lines included). Invalid UTF-8 is
+    replaced with U+FFFD in both raw and data, like reading in text mode with
+    errors='replace'.
+    """
+    with open(path, 'rb', buffering=READ_BUFFER_SIZE) as f:
+        if start:
+            f.seek(start)
+        position = start
+        for raw in f:
+            if end is not None and position >= end:
+                break
+            offset = position
+            position += len(raw)
+            if raw.endswith(b'\r\n'):
+                raw = raw[:-2] + b'\n'
+            elif not raw.endswith(b'\n'):
+                raw += b'\n'
+            try:
+                data = loads(raw)
+            except JSONDecodeError:
+                data = None
+            except UnicodeDecodeError:
+                raw = raw.decode('utf-8', errors='replace').encode('utf-8')
+                try:
+                    data = loads(raw)
+                except JSONDecodeError:
+                    data = None
+            yield offset, raw, data
+
+
+def decode_line(raw):
+    """The text of a raw line without its newline, for warnings."""
+    return raw.decode('utf-8', errors='replace').rstrip('\n')
+
+
+class JsonlWriter:
+    """
+    Buffered JSONL writer. Lines are collected and written with writelines in
+    batches. write_record writes a record's original bytes back when it was
+    not changed, which skips serialization entirely.
+
+    Usable as a context manager; mode is 'w' or 'a'. flush(), fileno() and
+    tell() make it usable where the pipeline commits checkpoints.
+    """
+
+    def __init__(self, path, mode='w'):
+        self._file = open(path, mode + 'b', buffering=WRITE_BUFFER_SIZE)
+        self._pending = []
+
+    def write(self, obj):
+        """Serializes and writes one record."""
+        self._pending.append(dumpb(obj) + b'\n')
+        if len(self._pending) >= WRITE_BATCH_LINES:
+            self._drain()
+
+    def write_raw(self, raw):
+        """Writes a raw line (bytes ending in a newline, as yielded by iter_jsonl)."""
+        self._pending.append(raw)
+        if len(self._pending) >= WRITE_BATCH_LINES:
+            self._drain()
+
+    def write_record(self, obj, raw=None, changed=True):
+        """Writes raw back if the record is unchanged, otherwise serializes obj."""
+        if changed or raw is None:
+            self.write(obj)
+        else:
+            self.write_raw(raw)
+
+    def _drain(self):
+        self._file.writelines(self._pending)
+        self._pending.clear()
+
+    def flush(self):
+        self._drain()
+        self._file.flush()
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def tell(self):
+        self._drain()
+        return self._file.tell()
+
+    def close(self):
+        if not self._file.closed:
+            self._drain()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,298 @@
+# tools/pack_sequences.py
+"""
+Plans how a dataset packs into fixed-length training sequences.
+
+The trainer packs samples into sequences of max_seq_length tokens and pads
+what is left over. This tool measures every sample in one streaming pass
+(records are rendered and encoded in batches, with the same tokenizer setup
+as trim_long_samples), packs the lengths with best-fit decreasing and
+reports how much of each sequence would be padding.
+
+Packing runs over millions of samples in seconds:
+- The samples are sorted by length with a counting sort, since every length
+  is at most max_seq_length.
+- Open packs are grouped in buckets by the room they have left. Each sample
+  goes into a pack of the tightest bucket that can hold it, so the search
+  costs one bitmask lookup instead of a pass over all open packs. Empty
+  samples join the last pack opened rather than opening their own.
+
+ShareGPT records are measured through the chat template, like the trainer
+sees them; pre-training records ({"text": ...}) are measured as their text.
+Samples longer than max_seq_length can't be packed and are only counted.
+With a token cache (see tools.token_cache) only new or edited samples are
+encoded.
+
+Usage:
+    python pack_sequences.py dataset.jsonl --model meta-llama/Llama-3.3-70B-Instruct --max-seq-length 8192
+        [--index packs.jsonl] [--packed packed.jsonl] [--stats packing.json] [--token-cache]
+"""
+import argparse
+import math
+import sys
+from array import array
+from pathlib import Path
+try:
+    from tools import jsonio
+    from tools.token_cache import open_cache
+    from tools.trim_long_samples import BATCH_SIZE, DEFAULT_MODEL_PATH, load_tokenizer, render
+except ImportError:  # run as a standalone script from the tools folder
+    import jsonio
+    from token_cache import open_cache
+    from trim_long_samples import BATCH_SIZE, DEFAULT_MODEL_PATH, load_tokenizer, render
+
+
+def sample_text(data, tokenizer):
+    """The text the trainer sees for a record, or None if the record has no sample."""
+    if not isinstance(data, dict):
+        return None
+    if data.get("conversations"):
+        return render(data["conversations"], tokenizer)
+    if isinstance(data.get("text"), str):
+        return data["text"]
+    return None
+
+
+def iter_token_lengths(input_file, tokenizer, batch_size=BATCH_SIZE, stats=None, cache=None):
+    """
+    Streams (line number, byte offset, tokens) for every sample in input_file,
+    encoding the samples batch_size at a time, or only the ones missing from
+    cache (a TokenCountCache). Line numbers start at 1, like the toolkit's
+    warnings. Lines that aren't valid JSON or hold no sample are skipped and
+    counted in stats["skipped"].
+    """
+    batch = []
+    for line_number, (offset, _, data) in enumerate(jsonio.iter_jsonl(input_file), 1):
+        try:
+            text = sample_text(data, tokenizer) if data is not None else None
+        except (KeyError, TypeError):
+            text = None
+        if text is None:
+            if stats is not None:
+                stats["skipped"] = stats.get("skipped", 0) + 1
+            continue
+        batch.append((line_number, offset, text))
+        if len(batch) >= batch_size:
+            yield from _encode_batch(batch, tokenizer, cache)
+            batch = []
+    if batch:
+        yield from _encode_batch(batch, tokenizer, cache)
+
+
+def _encode_batch(batch, tokenizer, cache):
+    texts = [text for _, _, text in batch]
+    encode = lambda texts: [len(ids) for ids in tokenizer(texts)["input_ids"]]
+    lengths = cache.count_many(texts, encode) if cache is not None else encode(texts)
+    for (line_number, offset, _), length in zip(batch, lengths):
+        yield line_number, offset, length
+
+
+class PackingPlan:
+    """
+    The result of plan_packs. Packs are stored flat: order holds sample
+    indices pack after pack, pack i is order[pack_ends[i - 1]:pack_ends[i]]
+    and pack_tokens[i] is its token count. too_long lists the samples that
+    are longer than max_seq_length.
+    """
+
+    def __init__(self, max_seq_length, order, pack_ends, pack_tokens, too_long, total_samples):
+        self.max_seq_length = max_seq_length
+        self.order = order
+        self.pack_ends = pack_ends
+        self.pack_tokens = pack_tokens
+        self.too_long = too_long
+        self.total_samples = total_samples
+
+    def __len__(self):
+        return len(self.pack_ends)
+
+    def packs(self):
+        """Yields (tokens, sample_indices) for every pack."""
+        start = 0
+        for end, tokens in zip(self.pack_ends, self.pack_tokens):
+            yield tokens, self.order[start:end]
+            start = end
+
+    def stats(self):
+        """Padding efficiency of the plan, compared with one sample per sequence."""
+        packed_samples = len(self.order)
+        tokens = sum(self.pack_tokens)
+        capacity = len(self) * self.max_seq_length
+        return {
+            "max_seq_length": self.max_seq_length,
+            "samples": self.total_samples,
+            "packed_samples": packed_samples,
+            "too_long_samples": len(self.too_long),
+            "tokens": tokens,
+            "packs": len(self),
+            "min_packs": math.ceil(tokens / self.max_seq_length),
+            "samples_per_pack": round(packed_samples / len(self), 2) if len(self) else 0.0,
+            "padding_tokens": capacity - tokens,
+            "efficiency": round(tokens / capacity, 4) if capacity else 0.0,
+            "unpacked_efficiency": round(tokens / (packed_samples * self.max_seq_length), 4) if packed_samples else 0.0,
+        }
+
+
+def plan_packs(lengths, max_seq_length):
+    """
+    Packs samples with the given token lengths into as few sequences of
+    max_seq_length tokens as best-fit decreasing manages. Returns a
+    PackingPlan whose sample indices are positions in lengths.
+    """
+    capacity = max_seq_length
+    # Counting sort, longest first.
+    counts = [0] * (capacity + 1)
+    too_long = array('I')
+    for index, length in enumerate(lengths):
+        if length > capacity:
+            too_long.append(index)
+        else:
+            counts[length] += 1
+    starts = [0] * (capacity + 1)
+    position = 0
+    for length in range(capacity, -1, -1):
+        starts[length] = position
+        position += counts[length]
+    by_length = array('I', bytes(4 * position))
+    for index, length in enumerate(lengths):
+        if length <= capacity:
+            by_length[starts[length]] = index
+            starts[length] += 1
+
+    # rooms[r] holds the open packs with r tokens of room left; bit r of
+    # open_rooms is set while rooms[r] is non-empty.
+    rooms = [None] * (capacity + 1)
+    open_rooms = 0
+    pack_of = array('I', bytes(4 * len(lengths)))
+    pack_tokens = array('I')
+    for index in by_length:
+        length = lengths[index]
+        if not length and pack_tokens:
+            # Sorted last, so every other sample is placed; an empty one fits anywhere, even in a full pack.
+            pack_of[index] = len(pack_tokens) - 1
+            continue
+        fitting = open_rooms >> length
+        if fitting:
+            room = length + (fitting & -fitting).bit_length() - 1
+            pack = rooms[room].pop()
+            if not rooms[room]:
+                open_rooms ^= 1 << room
+        else:
+            room, pack = capacity, len(pack_tokens)
+            pack_tokens.append(0)
+        pack_of[index] = pack
+        pack_tokens[pack] += length
+        room -= length
+        if room:
+            if rooms[room]:
+                rooms[room].append(pack)
+            else:
+                rooms[room] = [pack]
+                open_rooms |= 1 << room
+
+    # Group the samples by pack (another counting sort, keeping the decreasing order inside a pack).
+    pack_ends = array('I', bytes(4 * len(pack_tokens)))
+    for index in by_length:
+        pack_ends[pack_of[index]] += 1
+    position = 0
+    for pack, size in enumerate(pack_ends):
+        pack_ends[pack] = position
+        position += size
+    order = array('I', bytes(4 * position))
+    for index in by_length:
+        pack = pack_of[index]
+        order[pack_ends[pack]] = index
+        pack_ends[pack] += 1
+    return PackingPlan(max_seq_length, order, pack_ends, pack_tokens, too_long, len(lengths))
+
+
+def write_index(index_file, plan, line_numbers, offsets):
+    """One JSON line per pack: its tokens and the 1-based line numbers and byte offsets of its samples in the dataset."""
+    with jsonio.JsonlWriter(index_file) as outfile:
+        for pack, (tokens, samples) in enumerate(plan.packs()):
+            outfile.write({"pack": pack, "tokens": tokens, "lines": [line_numbers[i] for i in samples],
+                           "offsets": [offsets[i] for i in samples]})
+
+
+def write_packed(packed_file, plan, input_file, offsets):
+    """One JSON line per pack with the pack's records themselves, read back from the dataset by offset."""
+    with open(input_file, 'rb') as infile, jsonio.JsonlWriter(packed_file) as outfile:
+        for pack, (tokens, samples) in enumerate(plan.packs()):
+            records = []
+            for sample in samples:
+                infile.seek(offsets[sample])
+                records.append(jsonio.loads(infile.readline()))
+            outfile.write({"pack": pack, "tokens": tokens, "samples": records})
+
+
+def print_packing_stats(stats):
+    print(f"\n--- Packing Plan (max_seq_length {stats['max_seq_length']}) ---")
+    print(f"Samples: {stats['samples']:,} ({stats['too_long_samples']:,} longer than max_seq_length, not packed)")
+    print(f"Tokens: {stats['tokens']:,}")
+    print(f"Packs: {stats['packs']:,} (at least {stats['min_packs']:,} needed, {stats['samples_per_pack']} samples per pack)")
+    print(f"Padding tokens: {stats['padding_tokens']:,}")
+    print(f"Efficiency: {stats['efficiency']:.2%} packed vs {stats['unpacked_efficiency']:.2%} with one sample per sequence")
+
+
+def pack_sequences(input_file, model_path=DEFAULT_MODEL_PATH, max_seq_length=8192, index_file=None, packed_file=None,
+                   stats_file=None, batch_size=BATCH_SIZE, token_cache=None):
+    """
+    Measures every sample of input_file, plans the packs and prints the
+    padding-efficiency stats. Optionally writes the packing index, the packed
+    groups and the stats (JSON). token_cache is True for the default token
+    count cache, a database path or None. Returns the stats dict.
+    """
+    print(f"Measuring samples in {input_file}...")
+    tokenizer = load_tokenizer(model_path)
+    line_numbers, offsets, lengths = array('Q'), array('Q'), array('I')
+    read_stats = {}
+    cache = open_cache(tokenizer, token_cache)
+    try:
+        for line_number, offset, tokens in iter_token_lengths(input_file, tokenizer, batch_size, read_stats, cache):
+            line_numbers.append(line_number)
+            offsets.append(offset)
+            lengths.append(tokens)
+    finally:
+        if cache is not None:
+            print(f"Token cache: {cache.hits:,} hits, {cache.misses:,} misses.")
+            cache.close()
+    if read_stats.get("skipped"):
+        print(f"Skipped {read_stats['skipped']:,} lines that aren't valid JSON or hold no sample.")
+
+    plan = plan_packs(lengths, max_seq_length)
+    stats = plan.stats()
+    stats["skipped_lines"] = read_stats.get("skipped", 0)
+    print_packing_stats(stats)
+
+    if index_file:
+        write_index(index_file, plan, line_numbers, offsets)
+        print(f"Packing index written to: {index_file}")
+    if packed_file:
+        write_packed(packed_file, plan, input_file, offsets)
+        print(f"Packed groups written to: {packed_file}")
+    if stats_file:
+        Path(stats_file).parent.mkdir(parents=True, exist_ok=True)
+        with open(stats_file, 'w', encoding='utf-8') as f:
+            jsonio.dump(stats, f, indent=2)
+        print(f"Packing stats written to: {stats_file}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan sequence packing for a dataset and report its padding efficiency.")
+    parser.add_argument("input_file", help="Input .jsonl file (ShareGPT conversations or {\"text\": ...} records).")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="Path or hub name of the model whose tokenizer and chat template are used.")
+    parser.add_argument("--max-seq-length", type=int, default=8192, help="Length of a packed training sequence.")
+    parser.add_argument("--index", default=None, help="Write the packing index (one JSON line per pack) to this file.")
+    parser.add_argument("--packed", default=None, help="Write the packed groups of records (one JSON line per pack) to this file.")
+    parser.add_argument("--stats", default=None, help="Write the padding-efficiency stats to this .json file.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Samples encoded per tokenizer call.")
+    parser.add_argument("--token-cache", nargs="?", const=True, default=None, metavar="PATH",
+                        help="Reuse token counts from the token cache (default database, or the one at PATH).")
+    args = parser.parse_args()
+
+    pack_sequences(args.input_file, model_path=args.model, max_seq_length=args.max_seq_length, index_file=args.index,
+                   packed_file=args.packed, stats_file=args.stats, batch_size=args.batch_size, token_cache=args.token_cache)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
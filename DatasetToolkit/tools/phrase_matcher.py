@@ -0,0 +1,180 @@
+# tools/phrase_matcher.py
+"""
+Multi-phrase substring matching for the Deslop tool.
+
+PhraseMatcher builds an Aho-Corasick automaton from a phrase list once, so a
+text is scanned a single time no matter how many phrases there are. It uses
+pyahocorasick when it is installed (pip install pyahocorasick) and a
+pure-Python automaton otherwise; both report exactly the same matches.
+
+With normalize=True, matching ignores case, treats curly and straight
+apostrophes alike and matches any run of whitespace against a single space.
+The phrases are normalized once and the automaton gets an edge for every
+variant of each character (upper case, each apostrophe, each whitespace
+character), so texts are scanned as they are, without a folded copy. This
+mode always uses the pure-Python automaton.
+"""
+from collections import deque
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+APOSTROPHES = "'’‘ʼ"
+# Every character str.isspace() accepts; listed, because scanning all code points costs ~85 ms per import.
+WHITESPACE = ("\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f \x85\xa0\u1680\u2000\u2001\u2002\u2003\u2004\u2005\u2006"
+              "\u2007\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000")
+
+
+def normalize_phrase(phrase):
+    """The normalized form of a phrase: lower case, straight apostrophes, single spaces."""
+    folded = []
+    for char in phrase:
+        if char in APOSTROPHES:
+            folded.append("'")
+        else:
+            lower = char.lower()
+            folded.append(lower if len(lower) == 1 else char)
+    return " ".join("".join(folded).split())
+
+
+def _char_variants(char):
+    """Every text character that matches char of a normalized phrase."""
+    if char == "'":
+        return APOSTROPHES
+    if char == " ":
+        return WHITESPACE
+    variants = {char}
+    for other in (char.upper(), char.title()):
+        if len(other) == 1 and other.lower() == char:
+            variants.add(other)
+    return variants
+
+
+class PhraseMatcher:
+    """
+    Finds every occurrence of a fixed set of phrases in a text, overlapping
+    ones included. Phrases are addressed by their index in self.phrases,
+    which holds the normalized phrases when normalize is set.
+    """
+
+    def __init__(self, phrases, normalize=False):
+        self.normalize = normalize
+        if normalize:
+            phrases = (normalize_phrase(p) for p in phrases)
+        # Duplicates and empty phrases would only produce redundant matches.
+        self.phrases = list(dict.fromkeys(p for p in phrases if p))
+        use_pyahocorasick = ahocorasick is not None and not normalize
+        self.backend = "pyahocorasick" if use_pyahocorasick else "python"
+        self._automaton = None
+        if not self.phrases:
+            return
+        if use_pyahocorasick:
+            self._automaton = ahocorasick.Automaton()
+            for index, phrase in enumerate(self.phrases):
+                self._automaton.add_word(phrase, index)
+            self._automaton.make_automaton()
+        else:
+            self._build_python_automaton()
+
+    def __len__(self):
+        return len(self.phrases)
+
+    def _build_python_automaton(self):
+        # Trie of all phrases: one transition dict and one output tuple per
+        # state. children keeps the trie edges themselves, without variants.
+        goto = [{}]
+        children = [[]]
+        outputs = [()]
+        space_states = []
+        for index, phrase in enumerate(self.phrases):
+            state = 0
+            for char in phrase:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto.append({})
+                    children.append([])
+                    outputs.append(())
+                    children[state].append((char, next_state))
+                    for variant in (_char_variants(char) if self.normalize else char):
+                        goto[state][variant] = next_state
+                    if self.normalize and char == " ":
+                        space_states.append(next_state)
+                state = next_state
+            outputs[state] += (index,)
+
+        # Failure links in breadth-first order; each state also reports the
+        # phrases of its failure state (the suffixes that end at the same spot).
+        fail = [0] * len(goto)
+        queue = deque(child for _, child in children[0])
+        while queue:
+            state = queue.popleft()
+            for char, next_state in children[state]:
+                queue.append(next_state)
+                link = fail[state]
+                while link and char not in goto[link]:
+                    link = fail[link]
+                fail[next_state] = goto[link].get(char, 0)
+                outputs[next_state] += outputs[fail[next_state]]
+
+        # A state right after a space stays put on further whitespace, so a
+        # run of whitespace in the text matches the single space of a phrase.
+        for state in space_states:
+            for variant in WHITESPACE:
+                goto[state][variant] = state
+
+        self._goto = goto
+        self._fail = fail
+        self._outputs = outputs
+
+    def iter_matches(self, text):
+        """Yields (end, phrase_index) for every occurrence; end is exclusive."""
+        if self._automaton is not None:
+            for last, index in self._automaton.iter(text):
+                yield last + 1, index
+            return
+        if not self.phrases:
+            return
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        state = 0
+        for position, char in enumerate(text, 1):
+            next_state = goto[state].get(char)
+            while next_state is None and state:
+                state = fail[state]
+                next_state = goto[state].get(char)
+            # No state transitions back to the root, so None means "restart".
+            state = next_state or 0
+            if outputs[state]:
+                for index in outputs[state]:
+                    yield position, index
+
+    def match_start(self, text, end, index):
+        """Start of the occurrence of phrase index that ends at end in text."""
+        length = len(self.phrases[index])
+        if not self.normalize:
+            return end - length
+        # Walk back over the phrase; a whitespace run counts as one character.
+        start = end
+        while length and start:
+            start -= 1
+            if text[start].isspace():
+                while start and text[start - 1].isspace():
+                    start -= 1
+            length -= 1
+        return start
+
+    def contains_any(self, text):
+        """True if at least one phrase occurs in text."""
+        for _ in self.iter_matches(text):
+            return True
+        return False
+
+    def matched_phrases(self, text):
+        """Set of the indices of the phrases that occur in text."""
+        return {index for _, index in self.iter_matches(text)}
+
+    def count(self, text):
+        """Number of distinct phrases that occur in text."""
+        return len(self.matched_phrases(text))
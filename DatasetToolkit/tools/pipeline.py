@@ -0,0 +1,745 @@
+# tools/pipeline.py
+"""
+Step definitions and runners for the Processing Pipeline.
+
+The pipeline runs in one of two modes:
+- Sequential: every selected tool reads the previous _stepN.jsonl file and
+  writes a new one, exactly like running the tools by hand.
+- Fused: every record is parsed once and handed through the per-record
+  transforms of all selected steps in memory. Only the final file is written,
+  unless intermediate files are requested for debugging.
+
+Either mode can use several worker processes: the JSONL input is split into
+byte-range shards on line boundaries, the per-record transforms run on every
+shard in parallel and the shard outputs are merged back in the original order.
+
+Every completed stage is recorded in a run manifest, and per-record stages
+commit checkpoints while they run, so an interrupted run can be resumed (see
+tools.checkpoint). A resumed sequential run runs its per-record steps through
+the same checkpointed runner.
+
+A per-record transform has the signature transform(data, stats) and returns
+(record, changed), where record is None if the step drops it and stats is a
+collections.Counter for the tool's own counters.
+"""
+import os
+import sys
+import time
+from argparse import Namespace
+from collections import Counter
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from tools.sharding import find_shard_boundaries, concatenate_files, next_line_start
+from tools import checkpoint, jsonio, stage_cache
+from tools.convert_json_to_jsonl import convert_json_to_jsonl, load_json_records
+from tools.remove_failed_scenes import remove_failed_scenes_main, remove_failed_scenes_record
+from tools.convert_unicode_to_characters import normalize_unicode_in_jsonl, normalize_unicode_record
+from tools.cleanup_text import cleanup_text_in_jsonl, cleanup_text_record
+from tools.fix_turn_structure import fix_turn_structure, fix_turn_structure_record
+from tools.remove_standalone_names import remove_standalone_names_main, remove_standalone_names_record
+from tools.cleanasterisks import process_jsonl_file as clean_asterisks_in_jsonl, clean_asterisks_record
+from tools.cleanupjsonl_last_user_turn import main as remove_last_user_turn, remove_last_user_turn_record
+from tools.fix_choices_turns import fix_choices_tags_in_jsonl, fix_choices_tags_record
+from tools.fix_thinking_turns import process_jsonl_file as fix_thinking_and_collapsed_turns, fix_thinking_turns_record
+from tools.DeslopTool import filter_dataset as deslop_dataset, deslop_record, load_filter_criteria, build_matcher
+from tools.trim_long_samples import trim_long_samples
+from tools.convert_txt_to_jsonl import convert_multiple_txt_to_jsonl
+from tools.validate_dataset import validate_and_clean_jsonl
+
+# How much input a checkpointed stage processes between two progress commits.
+CHECKPOINT_INTERVAL_BYTES = 64 * 1024 * 1024
+
+
+def _token_cache_option(opts):
+    # With the stage cache on, token counts are cached too, next to the stage outputs if a cache folder is set.
+    if not opts.get("use_cache"):
+        return None
+    return str(Path(opts["cache_dir"]) / "token_counts.sqlite") if opts.get("cache_dir") else True
+
+
+def _deslop_transform(opts):
+    # Threshold mode needs the average over the whole dataset and the phrase
+    # report is written by the file-level tool, so both run as a separate step.
+    if opts.get("deslop_threshold") is not None or opts.get("deslop_report_file"):
+        return None
+    matcher = build_matcher(load_filter_criteria([opts["deslop_filter_file"]]), normalize=bool(opts.get("deslop_normalize")))
+    return partial(deslop_record, matcher=matcher)
+
+
+# "args" builds the keyword arguments of the file-level tool, "record" returns the
+# per-record transform (or None if the step can't be fused with these options).
+# "keeps_malformed" marks tools that copy lines that aren't valid JSON as-is and
+# "labels" names the tool's counters in the run summary. "reserialize" marks steps
+# whose output never reuses the input line (Normalize Unicode writes \uXXXX
+# escapes as characters). "version" and "params" key the stage cache: bump the
+# version whenever a step's output changes.
+PROCESSING_STEPS = {
+    1: {"name": "Convert JSON to JSONL", "version": 1, "func": convert_json_to_jsonl,
+        "args": lambda i, o, opts: {"input_path": i, "output_path": o},
+        "record": None, "source": True},
+    2: {"name": "Remove Failed Scenes", "version": 1, "func": remove_failed_scenes_main,
+        "args": lambda i, o, opts: {"input_file": i, "output_file": o},
+        "record": lambda opts: remove_failed_scenes_record,
+        "labels": {"lines_removed": "Lines removed (contained phrase)"}},
+    3: {"name": "Normalize Unicode", "version": 1, "func": normalize_unicode_in_jsonl,
+        "args": lambda i, o, opts: {"input_file": i, "output_file": o},
+        "record": lambda opts: normalize_unicode_record, "reserialize": True,
+        "labels": {"lines_fixed": "Lines with encoding errors fixed"}},
+    4: {"name": "Cleanup Separators", "version": 1, "func": cleanup_text_in_jsonl,
+        "args": lambda i, o, opts: {"input_file": i, "output_file": o},
+        "record": lambda opts: cleanup_text_record, "keeps_malformed": True,
+        "labels": {"lines_with_changes": "Lines with changes"}},
+    5: {"name": "Fix Turn Structure (OOC, Consecutive)", "version": 1, "func": fix_turn_structure,
+        "args": lambda i, o, opts: {"input_file": i, "output_file": o},
+        "record": lambda opts: fix_turn_structure_record, "keeps_malformed": True,
+        "labels": {"lines_fixed": "Conversations with fixes", "fixes_applied": "Total individual fixes applied"}},
+    6: {"name": "Remove Standalone Names", "version": 1, "func": remove_standalone_names_main,
+        "args": lambda i, o, opts: {"input_file": i, "output_file": o},
+        "record": lambda opts: remove_standalone_names_record,
+        "labels": {"modified_lines": "Lines modified (had turns removed)"}},
+    7: {"name": "Clean Enclosing Asterisks", "version": 1, "func": clean_asterisks_in_jsonl,
+        "args": lambda i, o, opts: {"input_file": i, "output_file": o},
+        "record": lambda opts: clean_asterisks_record,
+        "labels": {"lines_changed": "Lines with asterisks cleaned"}},
+    8: {"name": "Trim Last User Turn", "version": 1, "func": remove_last_user_turn,
+        "args": lambda i, o, opts: {"args": Namespace(input_file=i, output_file=o, conversation_key='conversations', role_key='from', user_role='human')},
+        "record": lambda opts: remove_last_user_turn_record,
+        "labels": {"cleaned": "Conversations cleaned (last user turn removed)", "skipped_empty": "Conversations skipped (became empty)"}},
+    9: {"name": "Fix Unclosed Choices Tags", "version": 1, "func": fix_choices_tags_in_jsonl,
+        "args": lambda i, o, opts: {"input_file": i, "output_file": o},
+        "record": lambda opts: fix_choices_tags_record, "keeps_malformed": True,
+        "labels": {"fixed_turns": "Total individual GPT turns with unclosed <choices> fixed"}},
+    10: {"name": "Fix Thinking/Collapsed Turns", "version": 1, "func": fix_thinking_and_collapsed_turns,
+         "args": lambda i, o, opts: {"input_path": i, "output_path": o},
+         "record": lambda opts: fix_thinking_turns_record, "keeps_malformed": True,
+         "labels": {"records_fixed": "Total records fixed"}},
+    11: {"name": "Deslop Tool", "version": 1, "func": deslop_dataset,
+         "args": lambda i, o, opts: {"dataset_file": i, "output_file": o, "filter_files": [opts["deslop_filter_file"]], "threshold": opts["deslop_threshold"],
+                                     "report_file": opts.get("deslop_report_file"), "normalize": bool(opts.get("deslop_normalize"))},
+         "record": _deslop_transform,
+         "report": lambda opts: opts.get("deslop_report_file"),
+         "params": lambda opts: {"filter_sha256": stage_cache.file_digest(opts["deslop_filter_file"], opts.get("cache_dir")),
+                                 "threshold": opts["deslop_threshold"],
+                                 **({"report_file": opts["deslop_report_file"]} if opts.get("deslop_report_file") else {}),
+                                 **({"normalize": True} if opts.get("deslop_normalize") else {})},
+         "labels": {"removed": "Conversations removed"}},
+    # Batches records through the tokenizer and runs its own worker pool (one
+    # tokenizer per worker), so it always runs as a file-level step.
+    12: {"name": "Trim Long Samples", "version": 1, "func": trim_long_samples,
+         "args": lambda i, o, opts: {"input_file": i, "output_file": o, "model_path": opts["trim_model_path"],
+                                     "max_length": opts["trim_max_length"], "workers": opts["workers"],
+                                     "report_file": opts.get("trim_report_file"), "token_cache": _token_cache_option(opts)},
+         "record": None,
+         "report": lambda opts: opts.get("trim_report_file"),
+         "params": lambda opts: {"model_path": opts["trim_model_path"], "max_length": opts["trim_max_length"],
+                                 **({"report_file": opts["trim_report_file"]} if opts.get("trim_report_file") else {})}},
+}
+
+
+PRETRAINING_STEPS = {
+    1: {"name": "Convert TXT to JSONL", "func": convert_multiple_txt_to_jsonl, "args": lambda i, o: {"input_directory": i, "output_file_path": o}},
+    2: {"name": "Normalize Unicode", "func": normalize_unicode_in_jsonl, "args": lambda i, o: {"input_file": i, "output_file": o}},
+    3: {"name": "Validate and Clean JSONL", "func": validate_and_clean_jsonl, "args": lambda i, o: {"input_file": i, "output_file": o}},
+}
+
+def _iter_jsonl(path):
+    """Yields (line_num, raw, data) for each non-blank line; data is None for malformed JSON."""
+    for line_num, (_, raw, data) in enumerate(jsonio.iter_jsonl(path), 1):
+        if data is None and not raw.strip():
+            continue
+        yield line_num, raw, data
+
+
+def _iter_jsonl_range(path, start, end):
+    """Like _iter_jsonl for the lines in a byte range, yielding the byte offset instead of the line number."""
+    for offset, raw, data in jsonio.iter_jsonl(path, start, end):
+        if data is None and not raw.strip():
+            continue
+        yield offset, raw, data
+
+
+def _iter_json_array(path):
+    """Yields (record_num, None, data) for each object of a JSON file."""
+    for record_num, data in enumerate(load_json_records(path), 1):
+        yield record_num, None, data
+
+
+def _run_chain(records, steps, outfile, debug_files, counters, location="line"):
+    """
+    Feeds parsed records through the transform chain and writes the survivors
+    to jsonio.JsonlWriter outputs; a record no step changed is written back as
+    its original line. counters["totals"] collects read/written/malformed
+    counts, counters[step_num] the per-step counters. location names what the
+    records' first field is in warnings.
+    """
+    totals = counters["totals"]
+    keep_malformed = all(step["keeps_malformed"] for step in steps)
+
+    for line_num, line, data in records:
+        totals["read"] += 1
+        if data is None:
+            totals["malformed"] += 1
+            if keep_malformed:
+                outfile.write_raw(line)
+                for debug_file in debug_files.values():
+                    debug_file.write_raw(line)
+                totals["written"] += 1
+            else:
+                print(f"Warning: Skipping malformed JSON on {location} {line_num}.", file=sys.stderr)
+            continue
+
+        record_changed = False
+        for step in steps:
+            step_num = step["num"]
+            step_stats = counters[step_num]
+            if step["transform"] is not None:
+                try:
+                    result, changed = step["transform"](data, step_stats)
+                except Exception as e:
+                    print(f"Warning: Step {step_num} failed on {location} {line_num}: {e}. Keeping record unchanged for this step.", file=sys.stderr)
+                    result, changed = data, False
+                if changed:
+                    step_stats["records_changed"] += 1
+                    record_changed = True
+                elif step.get("reserialize"):
+                    record_changed = True
+                if result is None:
+                    step_stats["records_dropped"] += 1
+                    break
+                data = result
+            if step_num in debug_files:
+                debug_files[step_num].write_record(data, line, record_changed)
+        else:
+            outfile.write_record(data, line, record_changed)
+            totals["written"] += 1
+
+
+def _print_fused_summary(steps, counters, output_file):
+    totals = counters["totals"]
+    step_list = ", ".join(str(step["num"]) for step in steps)
+    print(f"--- Fused Steps {step_list} Complete ---")
+    print(f"Records read: {totals['read']}")
+    print(f"Records written: {totals['written']}")
+    if totals["malformed"]:
+        print(f"Malformed lines: {totals['malformed']}")
+    for step in steps:
+        step_stats = counters[step["num"]]
+        print(f"  Step {step['num']} ({step['name']}): {step_stats['records_changed']} changed, {step_stats['records_dropped']} removed")
+        for key, label in step.get("labels", {}).items():
+            print(f"    {label}: {step_stats[key]}")
+    print(f"Output written to: '{output_file}'")
+
+
+def _new_counters(steps):
+    counters = {"totals": Counter()}
+    for step in steps:
+        counters[step["num"]] = Counter()
+    return counters
+
+
+def _open_outputs(output_file, intermediate_files, mode):
+    debug_files = {}
+    try:
+        for step_num, path in intermediate_files.items():
+            debug_files[step_num] = jsonio.JsonlWriter(path, mode)
+        outfile = jsonio.JsonlWriter(output_file, mode)
+    except Exception:
+        for debug_file in debug_files.values():
+            debug_file.close()
+        raise
+    return outfile, debug_files
+
+
+def _commit_outputs(files):
+    """Flushes the outputs to disk and returns their sizes."""
+    sizes = []
+    for f in files:
+        f.flush()
+        os.fsync(f.fileno())
+        sizes.append(f.tell())
+    return sizes
+
+
+def run_fused_steps(input_file, steps, output_file, intermediate_files=None, source_is_json=False,
+                    progress_file=None, stage=None):
+    """
+    Runs a list of per-record steps over input_file in a single pass.
+
+    Args:
+        input_file: JSONL file (or a JSON array file if source_is_json).
+        steps: list of dicts with "num", "name", "transform", "keeps_malformed"
+               and "labels". A transform of None passes records through unchanged.
+        output_file: Where the surviving records are written.
+        intermediate_files: Optional {step_num: path} to also dump each step's output.
+        progress_file: Optional checkpoint file for JSONL input. Progress is
+                       committed every CHECKPOINT_INTERVAL_BYTES of input, and a
+                       matching checkpoint left by an interrupted run is resumed.
+        stage: JSON-serializable description of the stage, stored in the
+               checkpoint so it is only resumed by the same stage.
+    Returns:
+        The counters dict ("totals" plus one Counter per step number).
+    """
+    counters = _new_counters(steps)
+    intermediate_files = intermediate_files or {}
+    if progress_file and not source_is_json:
+        _run_checkpointed(input_file, steps, output_file, intermediate_files, counters, progress_file, stage)
+    else:
+        records = _iter_json_array(input_file) if source_is_json else _iter_jsonl(input_file)
+        outfile, debug_files = _open_outputs(output_file, intermediate_files, 'w')
+        try:
+            _run_chain(records, steps, outfile, debug_files, counters)
+        finally:
+            outfile.close()
+            for debug_file in debug_files.values():
+                debug_file.close()
+
+    _print_fused_summary(steps, counters, output_file)
+    return counters
+
+
+def _run_checkpointed(input_file, steps, output_file, intermediate_files, counters, progress_file, stage):
+    """
+    Runs the chain over input_file in chunks that end on line boundaries and
+    commits (input offset, output sizes, counters) to progress_file after each one.
+    """
+    debug_order = sorted(intermediate_files)
+    file_size = os.path.getsize(input_file)
+    state = checkpoint.load_progress(progress_file, stage)
+    position, mode = 0, 'w'
+    if state is not None:
+        paths = [output_file] + [intermediate_files[n] for n in debug_order]
+        if all(os.path.isfile(path) and os.path.getsize(path) >= size for path, size in zip(paths, state["output_sizes"])):
+            for path, size in zip(paths, state["output_sizes"]):
+                checkpoint.truncate_file(path, size)
+            checkpoint.counters_from_json(state["counters"], counters)
+            position, mode = state["input_offset"], 'a'
+            print(f"Resuming from byte {position:,} of {file_size:,} ({position / max(file_size, 1):.0%} done).")
+
+    outfile, debug_files = _open_outputs(output_file, intermediate_files, mode)
+    try:
+        with open(input_file, 'rb') as boundary_reader:
+            while position < file_size:
+                chunk_end = min(next_line_start(boundary_reader, position + CHECKPOINT_INTERVAL_BYTES), file_size)
+                _run_chain(_iter_jsonl_range(input_file, position, chunk_end), steps, outfile, debug_files,
+                           counters, location="byte offset")
+                sizes = _commit_outputs([outfile] + [debug_files[n] for n in debug_order])
+                position = chunk_end
+                checkpoint.save_progress(progress_file, {"stage": stage, "input_offset": position, "output_sizes": sizes,
+                                                         "counters": checkpoint.counters_to_json(counters)})
+    finally:
+        outfile.close()
+        for debug_file in debug_files.values():
+            debug_file.close()
+    checkpoint.clear_progress(progress_file)
+
+
+def _run_shard(input_file, start, end, steps, output_file, intermediate_files):
+    """Worker: runs the transform chain over one byte range and returns its counters."""
+    counters = _new_counters(steps)
+    outfile, debug_files = _open_outputs(output_file, intermediate_files, 'w')
+    try:
+        _run_chain(_iter_jsonl_range(input_file, start, end), steps, outfile, debug_files, counters, location="byte offset")
+        # A committed shard must survive a crash of the parent process.
+        _commit_outputs([outfile] + list(debug_files.values()))
+    finally:
+        outfile.close()
+        for debug_file in debug_files.values():
+            debug_file.close()
+    return counters
+
+
+def run_sharded_steps(input_file, steps, output_file, workers, intermediate_files=None, shards_per_worker=4,
+                      progress_file=None, stage=None):
+    """
+    Parallel form of run_fused_steps for JSONL input: splits input_file into
+    byte-range shards on line boundaries, runs the chain on each shard in a
+    process pool and merges the shard outputs back in the original order.
+    The per-shard counters are summed into one summary. With a progress_file,
+    every finished shard is committed and a resumed run only reruns the
+    shards that had not finished.
+    """
+    intermediate_files = intermediate_files or {}
+    shards = find_shard_boundaries(input_file, workers * shards_per_worker)
+    part_paths = [f"{output_file}.part{i:05d}" for i in range(len(shards))]
+    intermediate_parts = {step_num: [f"{path}.part{i:05d}" for i in range(len(shards))]
+                          for step_num, path in intermediate_files.items()}
+
+    done = {}
+    if progress_file:
+        state = checkpoint.load_progress(progress_file, stage)
+        if state is not None and state["shards"] == [list(shard) for shard in shards]:
+            done = {int(i): shard_counters for i, shard_counters in state["done"].items()
+                    if os.path.isfile(part_paths[int(i)])
+                    and all(os.path.isfile(parts[int(i)]) for parts in intermediate_parts.values())}
+            if done:
+                print(f"Resuming: {len(done)} of {len(shards)} shard(s) already done.")
+
+    def commit():
+        if progress_file:
+            checkpoint.save_progress(progress_file, {"stage": stage, "shards": [list(shard) for shard in shards],
+                                                     "done": {str(i): c for i, c in done.items()}})
+
+    print(f"Processing {len(shards)} shard(s) with {workers} worker process(es)...")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_run_shard, input_file, start, end, steps, part_paths[i],
+                            {step_num: parts[i] for step_num, parts in intermediate_parts.items()}): i
+            for i, (start, end) in enumerate(shards) if i not in done
+        }
+        for future in as_completed(futures):
+            done[futures[future]] = checkpoint.counters_to_json(future.result())
+            commit()
+
+    counters = _new_counters(steps)
+    for i in range(len(shards)):
+        checkpoint.counters_from_json(done[i], counters)
+
+    concatenate_files(part_paths, output_file)
+    for step_num, parts in intermediate_parts.items():
+        concatenate_files(parts, intermediate_files[step_num])
+    if progress_file:
+        checkpoint.clear_progress(progress_file)
+
+    _print_fused_summary(steps, counters, output_file)
+    return counters
+
+
+def _fused_step(step_num, transform):
+    step_info = PROCESSING_STEPS[step_num]
+    return {"num": step_num, "name": step_info["name"], "transform": transform,
+            "keeps_malformed": step_info.get("keeps_malformed", False), "labels": step_info.get("labels", {}),
+            "reserialize": step_info.get("reserialize", False)}
+
+
+def _plan_segments(selected_steps, opts, fuse=True, json_source=True):
+    """
+    Groups consecutive fusable steps into segments. Returns a list of dicts with
+    "nums", "steps" (fused step dicts, or None for a file-level step) and "source_is_json".
+    With fuse=False every per-record step gets a segment of its own; with
+    json_source=False step 1 runs as a file-level step.
+    """
+    segments = []
+    current = None
+    for step_num in selected_steps:
+        step_info = PROCESSING_STEPS[step_num]
+        if step_info.get("source"):
+            if json_source:
+                current = {"nums": [step_num], "source_is_json": True, "steps": [_fused_step(step_num, None)]}
+            else:
+                current = None
+                segments.append({"nums": [step_num], "steps": None, "source_is_json": False})
+                continue
+            segments.append(current)
+            continue
+
+        transform = step_info["record"](opts) if step_info.get("record") else None
+        if transform is None:
+            segments.append({"nums": [step_num], "steps": None, "source_is_json": False})
+            current = None
+            continue
+
+        if current is None or not fuse:
+            current = {"nums": [], "steps": [], "source_is_json": False}
+            segments.append(current)
+        current["nums"].append(step_num)
+        current["steps"].append(_fused_step(step_num, transform))
+    return segments
+
+
+def _stage_signature(step_nums, opts):
+    """The step names, versions and parameters that determine a stage's output."""
+    step_infos = [PROCESSING_STEPS[n] for n in step_nums]
+    return {"steps": [info["name"] for info in step_infos],
+            "versions": [info["version"] for info in step_infos],
+            "params": [info["params"](opts) if "params" in info else {} for info in step_infos]}
+
+
+def _checkpoint_stage(step_nums, input_path, opts):
+    """Identifies a stage in its progress file, so a checkpoint is only resumed by the same stage on the same input."""
+    return {"signature": _stage_signature(step_nums, opts), "input": checkpoint.input_signature(input_path)}
+
+
+def _run_stage(step_nums, input_path, output_path, opts, run, progress_file=None):
+    """
+    Runs one stage (a single step or a fused segment) through run() and records
+    it in the run manifest. On a resumed run, a stage whose manifest entry still
+    matches its input and output is skipped, and an interrupted stage with a
+    progress_file continues from its last checkpoint. With the stage cache
+    enabled, a cached output for the same input content, steps, versions and
+    parameters is restored instead, and fresh outputs are stored. A stage
+    with a step that writes a report always runs, since neither a skip nor a
+    cache hit would write the report.
+
+    Returns a dict with "status" ("ran", "cached" or "skipped") and
+    "output_records" (None if the step wrote no output file).
+    """
+    cache_dir = opts.get("cache_dir")
+    manifest_path = opts["manifest_path"]
+    signature = _stage_signature(step_nums, opts)
+    step_list = ", ".join(map(str, step_nums))
+    writes_report = any(PROCESSING_STEPS[n].get("report", lambda opts: None)(opts) for n in step_nums)
+    if writes_report and (opts.get("resume") or opts.get("use_cache")):
+        print(f"Step(s) {step_list} write a report, so they run instead of reusing an earlier output.")
+    if opts.get("resume") and not writes_report:
+        entry = checkpoint.completed_stage(manifest_path, step_nums, signature, input_path, output_path, cache_dir)
+        if entry is not None:
+            print(f"Step(s) {step_list} already completed according to the run manifest, skipping.")
+            return {"status": "skipped", "output_records": entry["output_records"]}
+
+    resuming = bool(opts.get("resume") and progress_file and os.path.exists(progress_file))
+    if not resuming:
+        if progress_file:
+            checkpoint.clear_progress(progress_file)
+        # A fresh file leaves intact any cache entry an older version hardlinked to this output.
+        if os.path.lexists(output_path):
+            os.remove(output_path)
+
+    key = None
+    if opts.get("use_cache") and not writes_report:
+        key = stage_cache.stage_key(stage_cache.file_digest(input_path, cache_dir), " | ".join(signature["steps"]),
+                                    signature["versions"], signature["params"])
+        if stage_cache.lookup(key, output_path, cache_dir) is not None:
+            print(f"Cache hit: reusing the stored output of step(s) {step_list} (key {key[:12]}).")
+            if progress_file:
+                checkpoint.clear_progress(progress_file)
+            entry = checkpoint.record_stage(manifest_path, step_nums, signature, input_path, output_path, cache_dir)
+            return {"status": "cached", "output_records": entry["output_records"]}
+
+    run()
+    if not os.path.isfile(output_path):
+        # Some tools only print an error and return; the next step reports the missing file.
+        return {"status": "ran", "output_records": None}
+    if key is not None:
+        stage_cache.store(key, output_path, {"step": " | ".join(signature["steps"]),
+                                             "input_file": str(Path(input_path).resolve())}, cache_dir)
+    entry = checkpoint.record_stage(manifest_path, step_nums, signature, input_path, output_path, cache_dir)
+    return {"status": "ran", "output_records": entry["output_records"]}
+
+
+def _timed_stage(step_nums, input_path, output_path, opts, run, progress_file=None):
+    """Runs _run_stage and adds the wall time and throughput of the stage to its result."""
+    start = time.perf_counter()
+    result = _run_stage(step_nums, input_path, output_path, opts, run, progress_file)
+    seconds = time.perf_counter() - start
+    # The digests the stage hashed, written to the memo in one go.
+    stage_cache.flush_digests(opts.get("cache_dir"))
+    input_bytes = os.path.getsize(input_path) if os.path.isfile(input_path) else None
+    result.update({
+        "steps": list(step_nums),
+        "names": [PROCESSING_STEPS[n]["name"] for n in step_nums],
+        "input_file": input_path,
+        "output_file": output_path,
+        "seconds": round(seconds, 3),
+        "input_bytes": input_bytes,
+        "output_bytes": os.path.getsize(output_path) if os.path.isfile(output_path) else None,
+    })
+    if input_bytes is not None and seconds > 0:
+        result["input_mb_per_second"] = round(input_bytes / seconds / 1024 ** 2, 2)
+    if result["output_records"] is not None and seconds > 0:
+        result["output_records_per_second"] = round(result["output_records"] / seconds, 1)
+    return result
+
+
+def run_processing_pipeline(initial_input_file, steps_to_run, deslop_filter_file=None, deslop_threshold=None,
+                            output_prefix="", fused=False, keep_intermediate=False, workers=1,
+                            use_cache=False, cache_dir=None, resume=False, stage_stats=None,
+                            deslop_report_file=None, deslop_normalize=False, trim_model_path=None,
+                            trim_max_length=8192, trim_report_file=None):
+    """
+    Runs the selected Processing Pipeline steps on a dataset.
+
+    Args:
+        initial_input_file: The JSON/JSONL file to process.
+        steps_to_run: Iterable of step numbers from PROCESSING_STEPS.
+        deslop_filter_file: Filter phrase file, required when step 11 is selected.
+        deslop_threshold: Optional statistical threshold for step 11.
+        deslop_report_file: Optional per-phrase statistics report (.json or
+                            .csv) written by step 11.
+        deslop_normalize: Make step 11 match phrases regardless of case,
+                          apostrophe style and whitespace.
+        trim_model_path: Path or hub name of the model whose tokenizer and
+                         chat template step 12 uses, required for step 12.
+        trim_max_length: Maximum tokens per conversation for step 12.
+        trim_report_file: Optional token-length histogram (.json or .csv)
+                          written by step 12.
+        output_prefix: Prefix of the final output file name.
+        fused: Parse each record once and run all fusable steps in memory.
+        keep_intermediate: In fused mode, still write every _stepN.jsonl file.
+        workers: Number of worker processes for the per-record steps. With more
+                 than one, the input is split into shards that run in parallel.
+        use_cache: Reuse stage outputs from tools.stage_cache when the input
+                   content, steps and parameters are unchanged.
+        cache_dir: Stage cache folder (see stage_cache.get_cache_dir).
+        resume: Continue an interrupted run: skip the stages the run manifest
+                records as complete and resume per-record stages from their
+                last checkpoint (see tools.checkpoint).
+        stage_stats: Optional list that receives one dict per stage with its
+                     status, wall time, sizes, record count and throughput.
+    Returns:
+        The path of the final output file, or "" if no step was selected.
+    """
+    if not initial_input_file or not Path(initial_input_file).is_file():
+        raise ValueError("Please select a valid initial input file.")
+
+    selected_steps = sorted(set(steps_to_run))
+    unknown_steps = [n for n in selected_steps if n not in PROCESSING_STEPS]
+    if unknown_steps:
+        raise ValueError(f"Unknown pipeline step(s): {unknown_steps}")
+
+    if 11 in selected_steps and (not deslop_filter_file or not Path(deslop_filter_file).exists()):
+        raise ValueError("Deslop filter file is not specified or does not exist.")
+
+    if 12 in selected_steps and not trim_model_path:
+        raise ValueError("Trim Long Samples needs the model path of the tokenizer.")
+
+    workers = max(1, int(workers or 1))
+    opts = {"deslop_filter_file": deslop_filter_file, "deslop_threshold": deslop_threshold,
+            "deslop_report_file": deslop_report_file, "deslop_normalize": deslop_normalize,
+            "trim_model_path": trim_model_path, "trim_max_length": int(trim_max_length), "trim_report_file": trim_report_file,
+            "workers": workers,
+            "use_cache": use_cache, "cache_dir": cache_dir, "resume": resume,
+            "manifest_path": checkpoint.manifest_path_for(initial_input_file)}
+    last_step_to_run = selected_steps[-1] if selected_steps else 0
+
+    p = Path(initial_input_file)
+    current_input_path = str(p.resolve())
+    input_dir = p.parent
+
+    def output_path_for(step_num):
+        if step_num == last_step_to_run and output_prefix:
+            safe_prefix = "".join(c for c in output_prefix if c.isalnum() or c in ('_', '-')).strip()
+            return str(input_dir / f"{safe_prefix}{p.stem}.jsonl")
+        return str(input_dir / f"{p.stem}_step{step_num}.jsonl")
+
+    stats = stage_stats if stage_stats is not None else []
+    final_output_file = ""
+    if fused or workers > 1 or resume:
+        mode = "Fused" if fused else "Parallel" if workers > 1 else "Resumable"
+        print(f"--- Starting {mode} Processing Pipeline for: {p.name} ---\n")
+        for step_num, step_info in PROCESSING_STEPS.items():
+            if step_num not in selected_steps:
+                print(f"--- Skipping Step {step_num}: {step_info['name']} ---")
+        print()
+
+        for segment in _plan_segments(selected_steps, opts, fuse=fused, json_source=workers == 1):
+            output_path = output_path_for(segment["nums"][-1])
+            names = ", ".join(f"{n}: {PROCESSING_STEPS[n]['name']}" for n in segment["nums"])
+            print(f"--- Running Step(s) {names} ---")
+            print(f"Input: {Path(current_input_path).name}")
+            print(f"Output: {Path(output_path).name}")
+
+            progress_file = None
+            if segment["steps"] is None:
+                step_info = PROCESSING_STEPS[segment["nums"][0]]
+                run = partial(step_info["func"], **step_info["args"](current_input_path, output_path, opts))
+            else:
+                intermediate_files = {}
+                if keep_intermediate:
+                    intermediate_files = {n: output_path_for(n) for n in segment["nums"][:-1]}
+                if not segment["source_is_json"]:
+                    progress_file = checkpoint.progress_path_for(output_path)
+                stage = _checkpoint_stage(segment["nums"], current_input_path, opts)
+                if workers > 1:
+                    run = partial(run_sharded_steps, current_input_path, segment["steps"], output_path, workers,
+                                  intermediate_files=intermediate_files, progress_file=progress_file, stage=stage)
+                else:
+                    run = partial(run_fused_steps, current_input_path, segment["steps"], output_path,
+                                  intermediate_files=intermediate_files, source_is_json=segment["source_is_json"],
+                                  progress_file=progress_file, stage=stage)
+            stats.append(_timed_stage(segment["nums"], current_input_path, output_path, opts, run, progress_file))
+
+            print(f"--- Step(s) {', '.join(map(str, segment['nums']))} Complete ---\n")
+            current_input_path = output_path
+            final_output_file = output_path
+    else:
+        print(f"--- Starting Processing Pipeline for: {p.name} ---\n")
+        for step_num, step_info in PROCESSING_STEPS.items():
+            if step_num not in selected_steps:
+                print(f"--- Skipping Step {step_num}: {step_info['name']} ---\n")
+                continue
+            output_path = output_path_for(step_num)
+
+            print(f"--- Running Step {step_num}: {step_info['name']} ---")
+            print(f"Input: {Path(current_input_path).name}")
+            print(f"Output: {Path(output_path).name}")
+
+            run = partial(step_info["func"], **step_info["args"](current_input_path, output_path, opts))
+            stats.append(_timed_stage([step_num], current_input_path, output_path, opts, run))
+
+            print(f"--- Step {step_num} Complete ---\n")
+            current_input_path = output_path
+            final_output_file = output_path
+
+    print("--- Pipeline Finished ---")
+    if final_output_file:
+        print(f"Final output file: {final_output_file}")
+    return final_output_file
+
+
+def run_pretraining_pipeline(initial_input_folder, steps_to_run, output_filename_base, stage_stats=None):
+    """
+    Runs the selected Pre-training Pipeline steps on a folder of .txt files.
+
+    Args:
+        initial_input_folder: Folder with the .txt files to convert.
+        steps_to_run: Iterable of step numbers from PRETRAINING_STEPS; step 1 is required.
+        output_filename_base: Base name of the output files, written into the input folder.
+        stage_stats: Optional list that receives one dict per step with its wall time and sizes.
+    Returns:
+        The path of the final output file.
+    """
+    if not initial_input_folder or not Path(initial_input_folder).is_dir():
+        raise ValueError("Please select a valid initial input folder.")
+
+    safe_filename_base = "".join(c for c in output_filename_base if c.isalnum() or c in ('_','-')).strip()
+    if not safe_filename_base:
+        raise ValueError("Please provide a valid base name for the final output file.")
+
+    selected_steps = sorted(set(steps_to_run))
+    unknown_steps = [n for n in selected_steps if n not in PRETRAINING_STEPS]
+    if unknown_steps:
+        raise ValueError(f"Unknown pre-training step(s): {unknown_steps}")
+    if 1 not in selected_steps:
+        raise ValueError("Step 1 (Convert TXT to JSONL) must be selected for the pre-training pipeline.")
+
+    stats = stage_stats if stage_stats is not None else []
+    last_step_to_run = selected_steps[-1]
+    p_folder = Path(initial_input_folder)
+    current_input = str(p_folder.resolve())
+
+    print(f"--- Starting Pre-training Pipeline for folder: {p_folder.name} ---\n")
+    final_output_file = ""
+
+    for step_num, step_info in PRETRAINING_STEPS.items():
+        if step_num not in selected_steps:
+            print(f"--- Skipping Step {step_num}: {step_info['name']} ---\n")
+            continue
+
+        if step_num == last_step_to_run:
+            output_path = str(p_folder / f"{safe_filename_base}.jsonl")
+        else:
+            output_path = str(p_folder / f"{safe_filename_base}_step{step_num}.jsonl")
+
+        print(f"--- Running Step {step_num}: {step_info['name']} ---")
+        if step_num == 1:
+            print(f"Input: {Path(current_input).name} (folder)")
+        else:
+            print(f"Input: {Path(current_input).name}")
+        print(f"Output: {Path(output_path).name}")
+
+        start = time.perf_counter()
+        step_info["func"](**step_info["args"](current_input, output_path))
+        stats.append({"steps": [step_num], "names": [step_info["name"]], "status": "ran",
+                      "input_file": current_input, "output_file": output_path,
+                      "seconds": round(time.perf_counter() - start, 3),
+                      "output_bytes": os.path.getsize(output_path) if os.path.isfile(output_path) else None})
+
+        print(f"--- Step {step_num} Complete ---\n")
+        current_input = output_path
+        final_output_file = output_path
+
+    print("--- Pipeline Finished ---")
+    print(f"Final output file: {final_output_file}")
+    return final_output_file
@@ -1,48 +1,250 @@
 import argparse
+import heapq
+import math
 import pyarrow.parquet as pq
-import json
 import glob
-from transformers import AutoTokenizer
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
 from tqdm import tqdm
 import ijson
 import os
+try:
+    from tools import jsonio
+    from tools.token_cache import close_at_exit, evict_cache, open_cache
+except ImportError:  # run as a standalone script from the tools folder
+    import jsonio
+    from token_cache import close_at_exit, evict_cache, open_cache
 
-tokenizer = AutoTokenizer.from_pretrained("TheBloke/OpenHermes-2.5-Mistral-7B-GPTQ")
+try:
+    from transformers import AutoTokenizer
+except ImportError:  # only needed when the tool runs (pip install transformers)
+    AutoTokenizer = None
 
+DEFAULT_MODEL = "TheBloke/OpenHermes-2.5-Mistral-7B-GPTQ"
+BATCH_SIZE = 1024  # Messages encoded per tokenizer call
+# Report defaults: histogram bin width in tokens and number of longest records listed.
+DEFAULT_BIN_SIZE = 1024
+DEFAULT_LONGEST = 20
+PERCENTILES = (50, 75, 90, 95, 99, 99.9)
 
-def count_tokens(message):
-    return len(tokenizer.encode(message))
+# Set by load_tokenizer(), once per process; nothing is loaded at import.
+tokenizer = None
+token_cache = None  # TokenCountCache, opened with --token-cache
 
 
-def process_jsonl(file_path, count_all_turns):
+def load_tokenizer(model=DEFAULT_MODEL, cache_option=None):
+    """Loads the tokenizer (and opens the token cache) for this process."""
+    global tokenizer, token_cache
+    if AutoTokenizer is None:
+        raise ImportError("Counting tokens requires transformers (pip install transformers).")
+    tokenizer = AutoTokenizer.from_pretrained(model)
+    token_cache = open_cache(tokenizer, cache_option)
+    return tokenizer
+
+
+def encode_lengths(messages):
+    """Token counts of a list of messages, from one batch-encode call."""
+    encoding = tokenizer(messages, return_length=True, return_attention_mask=False, return_token_type_ids=False)
+    return encoding["length"]
+
+
+class QuantileSketch:
+    """
+    Streaming quantiles of record lengths in bounded memory (a DDSketch).
+    Lengths are counted in logarithmic buckets, so every quantile is within
+    relative_accuracy of the true value, a few hundred buckets cover any
+    length and sketches of different files merge exactly.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = Counter()  # k -> number of values in (gamma^(k-1), gamma^k]
+        self.zeros = 0
+        self.count = 0
+        self.min = self.max = None
+
+    def add(self, value):
+        if value <= 0:
+            self.zeros += 1
+        else:
+            self.buckets[math.ceil(math.log(value) / self._log_gamma)] += 1
+        self.count += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        self.buckets.update(other.buckets)
+        self.zeros += other.zeros
+        self.count += other.count
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """The value at quantile q (0 to 1), or None if the sketch is empty."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0
+        for k in sorted(self.buckets):
+            seen += self.buckets[k]
+            if rank < seen:
+                value = round(2 * self.gamma ** k / (self.gamma + 1))
+                return min(max(value, self.min), self.max)
+        return self.max
+
+
+class TokenStats:
+    """Per-role token totals and per-record length statistics of one file, or of several merged."""
+
+    def __init__(self, bin_size=DEFAULT_BIN_SIZE, longest_n=DEFAULT_LONGEST):
+        self.bin_size = bin_size
+        self.longest_n = longest_n
+        self.records = 0
+        self.tokens = 0
+        self.roles = Counter()
+        self.lengths = QuantileSketch()
+        self.histogram = Counter()  # tokens // bin_size -> records
+        self.longest = []  # min-heap of (tokens, file, line, offset)
+
+    def add_record(self, tokens, file_path, line, offset):
+        self.records += 1
+        self.tokens += tokens
+        self.lengths.add(tokens)
+        self.histogram[tokens // self.bin_size] += 1
+        entry = (tokens, file_path, line, offset)
+        if len(self.longest) < self.longest_n:
+            heapq.heappush(self.longest, entry)
+        elif tokens > self.longest[0][0]:
+            heapq.heapreplace(self.longest, entry)
+
+    def merge(self, other):
+        self.records += other.records
+        self.tokens += other.tokens
+        self.roles.update(other.roles)
+        self.lengths.merge(other.lengths)
+        self.histogram.update(other.histogram)
+        for entry in other.longest:
+            if len(self.longest) < self.longest_n:
+                heapq.heappush(self.longest, entry)
+            elif entry[0] > self.longest[0][0]:
+                heapq.heapreplace(self.longest, entry)
+
+    def to_dict(self, include_longest=True):
+        report = {
+            "records": self.records,
+            "tokens": self.tokens,
+            "roles": dict(self.roles.most_common()),
+            "lengths": {
+                "min": self.lengths.min,
+                "max": self.lengths.max,
+                "mean": round(self.tokens / self.records, 1) if self.records else None,
+                "percentiles": {f"p{p:g}": self.lengths.quantile(p / 100) for p in PERCENTILES},
+            },
+            "histogram": [{"from_tokens": b * self.bin_size, "to_tokens": (b + 1) * self.bin_size - 1,
+                           "records": self.histogram[b]} for b in sorted(self.histogram)],
+        }
+        if include_longest:
+            # JSONL records are located by 1-based line number and byte offset, JSON array items by 0-based index.
+            report["longest"] = [{"tokens": tokens, "file": file_path, "line": line, "offset": offset}
+                                 if offset is not None else {"tokens": tokens, "file": file_path, "item": line}
+                                 for tokens, file_path, line, offset in sorted(self.longest, reverse=True)]
+        return report
+
+
+class TokenCounter:
+    """
+    Sums the token counts of messages, encoding them BATCH_SIZE at a time.
+    With stats (a TokenStats), every message of a record is encoded, counted
+    or not, for the per-role totals and the record lengths; otherwise only
+    the counted messages are.
+    """
+
+    def __init__(self, file_path=None, stats=None, batch_size=BATCH_SIZE):
+        self.file_path = file_path
+        self.stats = stats
+        self.batch_size = batch_size
+        self.total = 0
+        self._pending = []  # (message, role, counted, record)
+        self._record = [0]  # token count of the record being read
+        self._ended = []  # (record, line, offset) of the records ended since the last flush
+
+    def add(self, message, role=None, counted=True):
+        if not counted and self.stats is None:
+            return
+        self._pending.append((message, role, counted, self._record))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def end_record(self, line, offset=None):
+        """
+        Marks the end of a record: line is its 1-based line number and offset
+        its byte offset, or line is its 0-based item index and offset None.
+        """
+        if self.stats is None:
+            return
+        self._ended.append((self._record, line, offset))
+        self._record = [0]
+
+    def flush(self):
+        if self._pending:
+            messages = [message for message, _, _, _ in self._pending]
+            if token_cache is None:
+                lengths = encode_lengths(messages)
+            else:
+                lengths = token_cache.count_many(messages, encode_lengths)
+            for (_, role, counted, record), tokens in zip(self._pending, lengths):
+                if counted:
+                    self.total += tokens
+                if self.stats is not None:
+                    self.stats.roles[role] += tokens
+                    record[0] += tokens
+            self._pending = []
+        # Every message of an ended record has been encoded by now.
+        for record, line, offset in self._ended:
+            self.stats.add_record(record[0], self.file_path, line, offset)
+        self._ended = []
+        return self.total
+
+
+def process_jsonl(file_path, count_all_turns, progress=True, stats=None):
     """Process JSONL file line by line with progress bar."""
-    total_tokens = 0
+    counter = TokenCounter(file_path, stats)
     file_size = os.path.getsize(file_path)
 
-    with open(file_path, "r") as file:
+    with open(file_path, "rb") as file:
         with tqdm(
             total=file_size,
             desc=f"Processing {os.path.basename(file_path)}",
             unit="B",
             unit_scale=True,
+            disable=not progress,
         ) as pbar:
-            for line in file:
-                obj = json.loads(line)
+            offset = 0
+            for line_number, line in enumerate(file, 1):
+                obj = jsonio.loads(line)
                 if "conversations" in obj:
                     for conversation in obj["conversations"]:
-                        if count_all_turns or conversation["from"] == "gpt":
-                            total_tokens += count_tokens(conversation["value"])
+                        counted = count_all_turns or conversation["from"] == "gpt"
+                        counter.add(conversation["value"], conversation.get("from", "unknown"), counted)
                 elif "text" in obj:
-                    total_tokens += count_tokens(obj["text"])
+                    counter.add(obj["text"], "text")
+                counter.end_record(line_number, offset)
 
-                pbar.update(len(line.encode("utf-8")))
+                offset += len(line)
+                pbar.update(len(line))
 
-    return total_tokens
+    return counter.flush()
 
 
-def process_json(file_path, count_all_turns):
+def process_json(file_path, count_all_turns, progress=True, stats=None):
     """Process JSON file using streaming parser."""
-    total_tokens = 0
+    counter = TokenCounter(file_path, stats)
     file_size = os.path.getsize(file_path)
 
     with open(file_path, "rb") as file:
@@ -51,48 +253,132 @@ def process_json(file_path, count_all_turns):
             desc=f"Processing {os.path.basename(file_path)}",
             unit="B",
             unit_scale=True,
+            disable=not progress,
         ) as pbar:
             prev_position = file.tell()
-            for obj in ijson.items(file, "item"):  # Stream each top-level array item
+            for index, obj in enumerate(ijson.items(file, "item")):  # Stream each top-level array item
                 # Process the object like in JSONL
                 if "conversations" in obj:
                     for conversation in obj["conversations"]:
-                        if count_all_turns or conversation.get("from") == "gpt":
-                            total_tokens += count_tokens(conversation["value"])
+                        counted = count_all_turns or conversation.get("from") == "gpt"
+                        counter.add(conversation["value"], conversation.get("from", "unknown"), counted)
                 if "full_input" in obj:
                     for item in obj["full_input"]:
-                        total_tokens += count_tokens(item["content"])
+                        counter.add(item["content"], item.get("role", "full_input"))
                 elif "text" in obj:
-                    total_tokens += count_tokens(obj["text"])
+                    counter.add(obj["text"], "text")
+                # ijson reads ahead, so items are located by their index in the array.
+                counter.end_record(index)
 
                 # Estimate progress by file position (may not be perfectly accurate)
                 current_position = file.tell()
                 pbar.update(current_position - prev_position)
                 prev_position = current_position
 
-    return total_tokens
+    return counter.flush()
 
 
-def process_parquet(file_path, count_all_turns):
-    """Process parquet file in chunks."""
-    total_tokens = 0
+def process_parquet(file_path, count_all_turns, progress=True, stats=None):
+    """Process parquet file in chunks, reading only the text column."""
+    counter = TokenCounter(file_path, stats)
     parquet_file = pq.ParquetFile(file_path)
+    if "text" not in parquet_file.schema_arrow.names:
+        return 0
     total_rows = parquet_file.metadata.num_rows
-    chunk_size = 1000  # Adjust based on your memory constraints
 
     with tqdm(
-        total=total_rows, desc=f"Processing {os.path.basename(file_path)}"
+        total=total_rows, desc=f"Processing {os.path.basename(file_path)}", disable=not progress
     ) as pbar:
-        for batch in parquet_file.iter_batches(batch_size=chunk_size):
-            df_chunk = batch.to_pandas()
+        row = 0
+        for batch in parquet_file.iter_batches(batch_size=BATCH_SIZE, columns=["text"]):
+            # The Arrow string column goes straight to Python strings, without a pandas frame.
+            for text in batch.column(0).to_pylist():
+                if text is not None:
+                    counter.add(text, "text")
+                counter.end_record(row)
+                row += 1
+            pbar.update(batch.num_rows)
+
+    return counter.flush()
+
+
+def count_file_tokens(file_path, count_all_turns, progress=True, stats=None):
+    """Token count of one dataset file, or None if its format isn't supported. Fills stats if given."""
+    if file_path.endswith(".parquet"):
+        return process_parquet(file_path, count_all_turns, progress, stats)
+    if file_path.endswith(".json"):
+        return process_json(file_path, count_all_turns, progress, stats)
+    if file_path.endswith(".jsonl"):
+        return process_jsonl(file_path, count_all_turns, progress, stats)
+    return None
+
+
+def _init_worker(model, cache_option):
+    # The pool already keeps every core busy; the Rust tokenizer's own threads would only compete with it.
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    load_tokenizer(model, cache_option)
+    close_at_exit(token_cache)
 
-            if "text" in df_chunk.columns:
-                chunk_tokens = df_chunk["text"].apply(count_tokens).sum()
-                total_tokens += chunk_tokens
 
-            pbar.update(len(df_chunk))
+def _count_file(file_path, count_all_turns, report_options=None, progress=False):
+    """
+    Counts one file: returns (tokens or None, error message or None, stats,
+    cache hits, cache misses). report_options is (bin_size, longest_n) to
+    collect a TokenStats, or None.
+    """
+    stats = TokenStats(*report_options) if report_options else None
+    try:
+        tokens, error = count_file_tokens(file_path, count_all_turns, progress, stats), None
+    except Exception as e:
+        tokens, error = None, str(e)
+    hits = misses = 0
+    if token_cache is not None:
+        hits, misses = token_cache.hits, token_cache.misses
+        token_cache.hits = token_cache.misses = 0
+    return tokens, error, stats, hits, misses
 
-    return total_tokens
+
+def _file_message(file_path, tokens, error):
+    if error is not None:
+        return f"Error processing {file_path}: {error}"
+    if tokens is None:
+        return f"Skipping unsupported file format: {file_path}"
+    return f"Tokens in {os.path.basename(file_path)}: {tokens:,}"
+
+
+def write_token_report(report_file, file_results, model, count_all_turns, bin_size, longest_n):
+    """
+    Writes the JSON report: the merged statistics of all files (with the
+    longest records) and each file's own. file_results maps a file path to
+    its (counted tokens, TokenStats). Returns the merged TokenStats.
+    """
+    total = TokenStats(bin_size, longest_n)
+    files = {}
+    for file_path, (tokens, stats) in file_results.items():
+        total.merge(stats)
+        files[file_path] = {"counted_tokens": tokens, **stats.to_dict(include_longest=False)}
+    report = {
+        "model": model,
+        "counted_turns": "all" if count_all_turns else "gpt",
+        "bin_size": bin_size,
+        "counted_tokens": sum(tokens for tokens, _ in file_results.values()),
+        "total": total.to_dict(),
+        "files": files,
+    }
+    Path(report_file).parent.mkdir(parents=True, exist_ok=True)
+    with open(report_file, "w", encoding="utf-8") as f:
+        jsonio.dump(report, f, indent=2)
+    return total
+
+
+def print_token_stats(stats):
+    lengths = stats.to_dict(include_longest=False)["lengths"]
+    print(f"Records: {stats.records:,} ({stats.tokens:,} tokens in all turns)")
+    for role, tokens in stats.roles.most_common():
+        print(f"  {role}: {tokens:,} tokens")
+    if stats.records:
+        percentiles = ", ".join(f"{name} {value:,}" for name, value in lengths["percentiles"].items())
+        print(f"Record length: min {lengths['min']:,}, mean {lengths['mean']:,}, {percentiles}, max {lengths['max']:,}")
 
 
 def main():
@@ -107,6 +393,42 @@ def main():
         action="store_true",
         help="Count tokens from all conversation turns, not just GPT turns",
     )
+    parser.add_argument(
+        "--model",
+        default=DEFAULT_MODEL,
+        help=f"Path or hub name of the model whose tokenizer is used (default: {DEFAULT_MODEL})",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Files counted in parallel; each worker process loads its own tokenizer",
+    )
+    parser.add_argument(
+        "--token-cache",
+        nargs="?",
+        const=True,
+        default=None,
+        metavar="PATH",
+        help="Reuse token counts from the token cache (default database, or the one at PATH)",
+    )
+    parser.add_argument(
+        "--report",
+        default=None,
+        help="Write a JSON report (per-role totals, record length percentiles, histogram, longest records) to this file",
+    )
+    parser.add_argument(
+        "--bin-size",
+        type=int,
+        default=DEFAULT_BIN_SIZE,
+        help=f"Report histogram bin width in tokens (default: {DEFAULT_BIN_SIZE})",
+    )
+    parser.add_argument(
+        "--longest",
+        type=int,
+        default=DEFAULT_LONGEST,
+        help=f"Number of longest records listed in the report (default: {DEFAULT_LONGEST})",
+    )
     args = parser.parse_args()
 
     total_tokens = 0
@@ -115,7 +437,8 @@ def main():
         matched_files = glob.glob(pattern)
         all_files.update(matched_files)
 
-    files = list(all_files)
+    # Largest files first, so a big file doesn't start last and keep one worker busy on its own.
+    files = sorted(all_files, key=os.path.getsize, reverse=True)
     print("Files being processed:")
     for f in files:
         print(f"- {f}")
@@ -125,26 +448,50 @@ def main():
         print(f"No files found matching the patterns: {args.patterns}")
         return
 
-    for file_path in files:
-        try:
-            if file_path.endswith(".parquet"):
-                file_tokens = process_parquet(file_path, args.all_turns)
-            elif file_path.endswith(".json"):
-                file_tokens = process_json(file_path, args.all_turns)
-            elif file_path.endswith(".jsonl"):
-                file_tokens = process_jsonl(file_path, args.all_turns)
-            else:
-                print(f"Skipping unsupported file format: {file_path}")
-                continue
+    report_options = (args.bin_size, args.longest) if args.report else None
+    file_results = {}  # file -> (tokens, stats) of the files counted for the report
+    hits = misses = 0
 
+    def collect(file_path, result, write):
+        nonlocal total_tokens, hits, misses
+        file_tokens, error, stats, file_hits, file_misses = result
+        hits += file_hits
+        misses += file_misses
+        write(_file_message(file_path, file_tokens, error))
+        if file_tokens is not None and error is None:
             total_tokens += file_tokens
-            print(f"Tokens in {os.path.basename(file_path)}: {file_tokens:,}")
+            if stats is not None:
+                file_results[file_path] = (file_tokens, stats)
 
-        except Exception as e:
-            print(f"Error processing {file_path}: {e}")
-            continue
+    if args.workers <= 1:
+        load_tokenizer(args.model, args.token_cache)
+        for file_path in files:
+            collect(file_path, _count_file(file_path, args.all_turns, report_options, progress=True), print)
+        if token_cache is not None:
+            token_cache.close()
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                 initargs=(args.model, args.token_cache)) as executor:
+            futures = {executor.submit(_count_file, file_path, args.all_turns, report_options): file_path
+                       for file_path in files}
+            with tqdm(total=sum(os.path.getsize(f) for f in files), desc="Counting tokens", unit="B",
+                      unit_scale=True) as pbar:
+                for future in as_completed(futures):
+                    file_path = futures[future]
+                    collect(file_path, future.result(), pbar.write)
+                    pbar.update(os.path.getsize(file_path))
+        # The workers have closed their sessions by now; this applies the limit to everything they added together.
+        evict_cache(args.token_cache)
 
     print(f"\nTotal tokens across {len(files)} files: {total_tokens:,}")
+    if args.token_cache:
+        print(f"Token cache: {hits:,} hits, {misses:,} misses")
+    if args.report:
+        # In the order of files, so the report doesn't depend on which worker finished first.
+        ordered = {f: file_results[f] for f in files if f in file_results}
+        stats = write_token_report(args.report, ordered, args.model, args.all_turns, args.bin_size, args.longest)
+        print_token_stats(stats)
+        print(f"Token report written to: {args.report}")
 
 
 if __name__ == "__main__":
@@ -1,10 +1,34 @@
-import json
 import argparse
 import sys
 from pathlib import Path
+try:
+    from tools import jsonio
+except ImportError:  # run as a standalone script from the tools folder
+    import jsonio
 
 # The specific phrase to detect for removing a JSONL entry.
 FAILED_SCENE_PHRASE = "[Scene description generation failed due to API errors.]"
+FAILED_SCENE_PHRASE_BYTES = FAILED_SCENE_PHRASE.encode('utf-8')
+
+def _contains_phrase(obj, phrase):
+    """Recursively checks whether any string inside a parsed JSON value contains phrase."""
+    if isinstance(obj, str):
+        return phrase in obj
+    if isinstance(obj, dict):
+        return any(_contains_phrase(value, phrase) for value in obj.values())
+    if isinstance(obj, list):
+        return any(_contains_phrase(item, phrase) for item in obj)
+    return False
+
+def remove_failed_scenes_record(data, stats):
+    """
+    Per-record form of the failed scene filter: drops the record if any of its
+    strings contains FAILED_SCENE_PHRASE. Returns (record, changed).
+    """
+    if _contains_phrase(data, FAILED_SCENE_PHRASE):
+        stats['lines_removed'] += 1
+        return None, True
+    return data, False
 
 def remove_failed_scenes_main(input_file: str, output_file: str):
     """
@@ -34,26 +58,23 @@ def remove_failed_scenes_main(input_file: str, output_file: str):
     print(f"Searching for and removing lines containing: '{FAILED_SCENE_PHRASE}'")
 
     try:
-        with open(input_path, 'r', encoding='utf-8') as infile, \
-             open(output_path, 'w', encoding='utf-8') as outfile:
+        with jsonio.JsonlWriter(output_path) as outfile:
             
-            for i, line in enumerate(infile, 1):
+            for i, (_, raw, data) in enumerate(jsonio.iter_jsonl(input_path), 1):
                 lines_read = i
-                # Check for the phrase in the raw line for efficiency.
-                # This avoids unnecessary JSON parsing if the phrase is present.
-                if FAILED_SCENE_PHRASE in line:
+                # Check for the phrase in the raw line, like the original text
+                # filter (the phrase has no characters JSON would escape).
+                if FAILED_SCENE_PHRASE_BYTES in raw:
                     lines_removed += 1
                     continue  # Skip this line and move to the next
 
-                # Optional but recommended: Validate if the line is valid JSON before writing.
-                try:
-                    json.loads(line)
-                except json.JSONDecodeError:
-                    print(f"Warning: Skipping malformed JSON on line {lines_read}: {line.strip()}", file=sys.stderr)
+                # Only valid JSON lines are written.
+                if data is None:
+                    print(f"Warning: Skipping malformed JSON on line {lines_read}: {jsonio.decode_line(raw).strip()}", file=sys.stderr)
                     lines_removed += 1
                     continue
 
-                outfile.write(line)
+                outfile.write_raw(raw)
                 lines_written += 1
 
     except Exception as e:
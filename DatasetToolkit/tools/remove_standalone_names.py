@@ -1,6 +1,10 @@
-import json
 import re
 import os
+from collections import Counter
+try:
+    from tools import jsonio
+except ImportError:  # run as a standalone script from the tools folder
+    import jsonio
 
 # Regex to find standalone names/roles at the beginning of a string.
 pattern_to_remove = re.compile(
@@ -24,6 +28,39 @@ def clean_conversation_value(text):
     cleaned_text = pattern_to_remove.sub("", text, count=1)
     return cleaned_text
 
+def remove_standalone_names_record(data, stats):
+    """
+    Removes standalone names/roles from the 'value' fields of one parsed record,
+    dropping turns that become empty. Returns (record, changed).
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('conversations'), list):
+        return data, False
+
+    changed = False
+    cleaned_conversations = []
+    original_turn_count = len(data['conversations'])
+
+    for turn in data['conversations']:
+        if 'value' in turn and isinstance(turn['value'], str):
+            cleaned_value = clean_conversation_value(turn['value'])
+            
+            # Only keep the turn if the value is not empty after cleaning.
+            # This is the critical fix.
+            if cleaned_value.strip():
+                if cleaned_value != turn['value']:
+                    changed = True
+                turn['value'] = cleaned_value
+                cleaned_conversations.append(turn)
+        else:
+            cleaned_conversations.append(turn)
+
+    if len(cleaned_conversations) != original_turn_count:
+        stats['modified_lines'] += 1
+        changed = True
+
+    data['conversations'] = cleaned_conversations
+    return data, changed
+
 def remove_standalone_names_main(input_file: str, output_file: str):
     """
     Processes a JSONL file to remove standalone names/roles from 'value' fields.
@@ -41,46 +78,25 @@ def remove_standalone_names_main(input_file: str, output_file: str):
     print(f"Writing to: {output_file}")
 
     processed_lines = 0
-    modified_lines = 0
     skipped_lines = 0
+    stats = Counter()
 
     try:
-        with open(input_file, 'r', encoding='utf-8') as infile, \
-             open(output_file, 'w', encoding='utf-8') as outfile:
-            for line_num, line in enumerate(infile, 1):
-                try:
-                    data = json.loads(line)
-                    
-                    if 'conversations' in data and isinstance(data['conversations'], list):
-                        cleaned_conversations = []
-                        original_turn_count = len(data['conversations'])
-
-                        for turn in data['conversations']:
-                            if 'value' in turn and isinstance(turn['value'], str):
-                                cleaned_value = clean_conversation_value(turn['value'])
-                                
-                                # Only keep the turn if the value is not empty after cleaning.
-                                # This is the critical fix.
-                                if cleaned_value.strip():
-                                    turn['value'] = cleaned_value
-                                    cleaned_conversations.append(turn)
-                            else:
-                                cleaned_conversations.append(turn)
-
-                        if len(cleaned_conversations) != original_turn_count:
-                            modified_lines += 1
-
-                        data['conversations'] = cleaned_conversations
-
-                    outfile.write(json.dumps(data, ensure_ascii=False) + '\n')
-                    processed_lines += 1
-                except json.JSONDecodeError as e:
-                    print(f"Warning: Skipping malformed JSON line {line_num}: {e}")
+        with jsonio.JsonlWriter(output_file) as outfile:
+            for line_num, (_, raw, data) in enumerate(jsonio.iter_jsonl(input_file), 1):
+                if data is None:
+                    print(f"Warning: Skipping malformed JSON line {line_num}: {jsonio.decode_line(raw).strip()}")
                     skipped_lines += 1
+                    continue
+
+                data, changed = remove_standalone_names_record(data, stats)
+
+                outfile.write_record(data, raw, changed)
+                processed_lines += 1
 
         print(f"\nProcessing complete!")
         print(f"Lines processed: {processed_lines}")
-        print(f"Lines modified (had turns removed): {modified_lines}")
+        print(f"Lines modified (had turns removed): {stats['modified_lines']}")
         if skipped_lines > 0:
             print(f"Lines skipped due to errors: {skipped_lines}")
 
@@ -1,7 +1,10 @@
 # tools/remove_system_prompt.py
 
-import json
 from pathlib import Path
+try:
+    from tools import jsonio
+except ImportError:  # run as a standalone script from the tools folder
+    import jsonio
 
 def remove_system_prompt_from_jsonl(input_file: str, output_file: str, system_role: str):
     """
@@ -30,24 +33,24 @@ def remove_system_prompt_from_jsonl(input_file: str, output_file: str, system_ro
     lines_processed = 0
     system_prompts_removed = 0
 
-    with open(input_path, 'r', encoding='utf-8') as infile, \
-         open(output_path, 'w', encoding='utf-8') as outfile:
+    with jsonio.JsonlWriter(output_path) as outfile:
         
-        for i, line in enumerate(infile, 1):
+        for i, (_, raw, data) in enumerate(jsonio.iter_jsonl(input_path), 1):
+            if data is None:
+                print(f"Warning: Could not decode JSON on line {i}. Skipping.")
+                continue
             try:
-                data = json.loads(line)
-                
+                changed = False
                 if 'conversations' in data and isinstance(data['conversations'], list) and data['conversations']:
                     first_message = data['conversations'][0]
                     if first_message.get('from') == system_role:
                         data['conversations'] = data['conversations'][1:]
                         system_prompts_removed += 1
+                        changed = True
                 
-                outfile.write(json.dumps(data) + '\n')
+                outfile.write_record(data, raw, changed)
                 lines_processed += 1
                 
-            except json.JSONDecodeError:
-                print(f"Warning: Could not decode JSON on line {i}. Skipping.")
             except Exception as e:
                 print(f"An error occurred on line {i}: {e}")
 
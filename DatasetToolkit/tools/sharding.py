@@ -0,0 +1,54 @@
+# tools/sharding.py
+"""
+Helpers for splitting a JSONL file into byte-range shards on line boundaries
+and stitching per-shard output files back together in order.
+"""
+import os
+import shutil
+
+COPY_BUFFER_SIZE = 16 * 1024 * 1024
+
+
+def find_shard_boundaries(file_path, num_shards):
+    """
+    Splits a file into at most num_shards (start, end) byte ranges. Every range
+    starts at the beginning of a line and ends right after a newline (or at EOF).
+    """
+    file_size = os.path.getsize(file_path)
+    if file_size == 0:
+        return []
+    num_shards = max(1, min(num_shards, file_size))
+
+    boundaries = [0]
+    with open(file_path, 'rb') as f:
+        for i in range(1, num_shards):
+            target = file_size * i // num_shards
+            if target <= boundaries[-1]:
+                continue
+            position = next_line_start(f, target)
+            if position >= file_size:
+                break
+            if position > boundaries[-1]:
+                boundaries.append(position)
+    boundaries.append(file_size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def next_line_start(f, target):
+    """Returns the offset of the first line starting at or after target in a binary file object."""
+    if target <= 0:
+        return 0
+    f.seek(target - 1)
+    # Finish the line the target offset falls into.
+    f.readline()
+    return f.tell()
+
+
+def concatenate_files(part_paths, output_path, remove_parts=True):
+    """Concatenates part files into output_path in the given order."""
+    with open(output_path, 'wb') as outfile:
+        for part_path in part_paths:
+            with open(part_path, 'rb') as infile:
+                shutil.copyfileobj(infile, outfile, COPY_BUFFER_SIZE)
+            if remove_parts:
+                os.remove(part_path)
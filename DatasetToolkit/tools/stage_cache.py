@@ -0,0 +1,312 @@
+# tools/stage_cache.py
+"""
+Content-addressed cache for pipeline stage outputs.
+
+A stage output is stored under a key built from the SHA-256 of its input file,
+the step name, the step version and the step parameters. Re-running the
+pipeline with an unchanged prefix of steps restores those outputs instead of
+recomputing them, so only the changed step and the steps after it run.
+
+Entries are stored and restored as copies (reflinks where the filesystem
+supports them, so a copy costs no extra space or time there). An entry never
+shares an inode with a pipeline output, so writing to one can't change the
+other.
+
+Usage (from the DatasetToolkit folder):
+    python -m tools.stage_cache list
+    python -m tools.stage_cache prune --max-size-gb 200 --max-age-days 14
+    python -m tools.stage_cache clear
+"""
+import argparse
+import atexit
+import hashlib
+import json
+import os
+import shutil
+import stat
+import sys
+import time
+from pathlib import Path
+
+HASH_BUFFER_SIZE = 8 * 1024 * 1024
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "dataset_toolkit" / "stages"
+DEFAULT_MAX_SIZE_GB = 100.0
+DEFAULT_MAX_AGE_DAYS = 30.0
+FICLONE = 0x40049409  # Linux ioctl that reflinks a whole file
+MAX_DIGEST_MEMO_ENTRIES = 10000  # Most recently hashed files kept in digests.json
+
+# digests.json of each cache folder as this process sees it: {memo path: {"memo": ..., "pending": ...}}.
+# New digests collect in "pending" and are written together by flush_digests.
+_digest_memos = {}
+
+
+def get_cache_dir(cache_dir=None):
+    """Returns the cache folder: the argument, $DATASET_TOOLKIT_CACHE_DIR or ~/.cache/dataset_toolkit/stages."""
+    return Path(cache_dir or os.environ.get("DATASET_TOOLKIT_CACHE_DIR") or DEFAULT_CACHE_DIR)
+
+
+def _entries_dir(cache_dir):
+    return get_cache_dir(cache_dir) / "entries"
+
+
+def _digest_memo_path(cache_dir):
+    return get_cache_dir(cache_dir) / "digests.json"
+
+
+def _load_json(path, default):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return default
+
+
+def _write_json_atomic(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _stat_signature(path):
+    st = os.stat(path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def _digest_memo(cache_dir):
+    memo_path = _digest_memo_path(cache_dir)
+    state = _digest_memos.get(memo_path)
+    if state is None:
+        if not _digest_memos:
+            atexit.register(_flush_all_digests)
+        state = _digest_memos[memo_path] = {"memo": _load_json(memo_path, {}), "pending": {}}
+    return state
+
+
+def file_digest(path, cache_dir=None):
+    """
+    Returns the SHA-256 hex digest of a file. Digests are remembered by
+    (path, size, mtime) so an unchanged file is only hashed once.
+    """
+    path = str(Path(path).resolve())
+    signature = _stat_signature(path)
+    known = _digest_memo(cache_dir)["memo"].get(path)
+    if known and known.get("stat") == signature:
+        return known["sha256"]
+
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BUFFER_SIZE), b''):
+            h.update(block)
+    digest = h.hexdigest()
+    remember_digest(path, digest, cache_dir)
+    return digest
+
+
+def remember_digest(path, digest, cache_dir=None):
+    """
+    Records the digest of a file whose content is already known (e.g.
+    restored from the cache). It is written to digests.json by the next
+    flush_digests, or when the process exits.
+    """
+    path = str(Path(path).resolve())
+    state = _digest_memo(cache_dir)
+    entry = {"stat": _stat_signature(path), "sha256": digest}
+    state["memo"][path] = state["pending"][path] = entry
+
+
+def flush_digests(cache_dir=None, drop_missing=False):
+    """
+    Writes the digests remembered since the last flush to digests.json, merged
+    with what other processes wrote there meanwhile. Only the
+    MAX_DIGEST_MEMO_ENTRIES most recently recorded files are kept, and with
+    drop_missing the files that no longer exist are forgotten too.
+    """
+    memo_path = _digest_memo_path(cache_dir)
+    state = _digest_memos.get(memo_path)
+    pending = state["pending"] if state is not None else {}
+    if not pending and not (drop_missing and memo_path.exists()):
+        return
+    memo = _load_json(memo_path, {})
+    for path, entry in pending.items():
+        # Re-inserted, so the dict's order stays oldest first.
+        memo.pop(path, None)
+        memo[path] = entry
+    if drop_missing:
+        memo = {path: entry for path, entry in memo.items() if os.path.exists(path)}
+    if len(memo) > MAX_DIGEST_MEMO_ENTRIES:
+        memo = dict(list(memo.items())[-MAX_DIGEST_MEMO_ENTRIES:])
+    _write_json_atomic(memo_path, memo)
+    _digest_memos[memo_path] = {"memo": memo, "pending": {}}
+
+
+def _flush_all_digests():
+    for memo_path, state in list(_digest_memos.items()):
+        if state["pending"]:
+            flush_digests(memo_path.parent)
+
+
+def stage_key(input_digest, step_name, step_version, params):
+    """Builds the cache key for one stage; params must be JSON-serializable."""
+    payload = json.dumps({"input": input_digest, "step": step_name, "version": step_version, "params": params},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _copy_file(source, destination):
+    """
+    Copies source to destination (replacing it): a reflink on filesystems that
+    support them (btrfs, XFS), a plain copy otherwise.
+    """
+    tmp_path = Path(f"{destination}.tmp")
+    try:
+        import fcntl
+        with open(source, 'rb') as src, open(tmp_path, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    except (ImportError, OSError):
+        shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, destination)
+
+
+def lookup(key, output_path, cache_dir=None):
+    """
+    Restores a cached stage output to output_path.
+    Returns the entry's metadata on a hit, None on a miss.
+    """
+    entries_dir = _entries_dir(cache_dir)
+    data_path = entries_dir / f"{key}.jsonl"
+    meta_path = entries_dir / f"{key}.json"
+    meta = _load_json(meta_path, None)
+    if meta is None or not data_path.is_file():
+        return None
+
+    _copy_file(data_path, output_path)
+    meta["last_used"] = time.time()
+    meta["hits"] = meta.get("hits", 0) + 1
+    _write_json_atomic(meta_path, meta)
+    if meta.get("output_sha256"):
+        remember_digest(output_path, meta["output_sha256"], cache_dir)
+    return meta
+
+
+def store(key, output_path, meta, cache_dir=None, max_size_gb=None, max_age_days=None):
+    """
+    Adds a stage output to the cache and prunes old entries afterwards.
+    meta is a dict describing the stage (step, params, input file, ...).
+    """
+    entries_dir = _entries_dir(cache_dir)
+    entries_dir.mkdir(parents=True, exist_ok=True)
+    data_path = entries_dir / f"{key}.jsonl"
+    _copy_file(output_path, data_path)
+
+    now = time.time()
+    entry = dict(meta)
+    entry.update({"key": key, "size": data_path.stat().st_size, "created": now, "last_used": now, "hits": 0,
+                  "output_sha256": file_digest(output_path, cache_dir)})
+    _write_json_atomic(entries_dir / f"{key}.json", entry)
+    prune(cache_dir, max_size_gb=max_size_gb, max_age_days=max_age_days)
+
+
+def list_entries(cache_dir=None):
+    """Returns the metadata of every cache entry, most recently used first."""
+    entries = []
+    for meta_path in _entries_dir(cache_dir).glob("*.json"):
+        meta = _load_json(meta_path, None)
+        if meta is not None:
+            entries.append(meta)
+    entries.sort(key=lambda e: e.get("last_used", 0), reverse=True)
+    return entries
+
+
+def _remove_entry(key, cache_dir):
+    entries_dir = _entries_dir(cache_dir)
+    for path in (entries_dir / f"{key}.jsonl", entries_dir / f"{key}.json"):
+        if path.exists():
+            if os.name == 'nt':
+                os.chmod(path, stat.S_IWRITE)
+            path.unlink()
+
+
+def prune(cache_dir=None, max_size_gb=None, max_age_days=None):
+    """
+    Evicts entries unused for more than max_age_days, then the least recently
+    used ones until the cache fits in max_size_gb. Unset limits fall back to
+    $DATASET_TOOLKIT_CACHE_MAX_GB / $DATASET_TOOLKIT_CACHE_MAX_AGE_DAYS or the defaults.
+    Remembered digests of files that no longer exist are dropped as well.
+    Returns (entries_removed, bytes_freed).
+    """
+    flush_digests(cache_dir, drop_missing=True)
+    if max_size_gb is None:
+        max_size_gb = float(os.environ.get("DATASET_TOOLKIT_CACHE_MAX_GB", DEFAULT_MAX_SIZE_GB))
+    if max_age_days is None:
+        max_age_days = float(os.environ.get("DATASET_TOOLKIT_CACHE_MAX_AGE_DAYS", DEFAULT_MAX_AGE_DAYS))
+
+    entries = list_entries(cache_dir)
+    oldest_allowed = time.time() - max_age_days * 86400
+    max_size = max_size_gb * 1024 ** 3
+    total_size = sum(e.get("size", 0) for e in entries)
+    removed, freed = 0, 0
+
+    # Oldest entries are at the end of the list.
+    for entry in reversed(entries):
+        if entry.get("last_used", 0) >= oldest_allowed and total_size <= max_size:
+            break
+        _remove_entry(entry["key"], cache_dir)
+        total_size -= entry.get("size", 0)
+        freed += entry.get("size", 0)
+        removed += 1
+    return removed, freed
+
+
+def clear(cache_dir=None):
+    """Removes every cache entry and the remembered file digests. Returns the number of entries removed."""
+    entries = list_entries(cache_dir)
+    for entry in entries:
+        _remove_entry(entry["key"], cache_dir)
+    memo_path = _digest_memo_path(cache_dir)
+    _digest_memos.pop(memo_path, None)
+    if memo_path.exists():
+        memo_path.unlink()
+    return len(entries)
+
+
+def _format_size(num_bytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if num_bytes < 1024:
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} TB"
+
+
+def main():
+    """Command-line interface to inspect and clear the stage cache."""
+    parser = argparse.ArgumentParser(description="Inspect and clear the pipeline stage cache.")
+    parser.add_argument("--cache-dir", default=None, help="Cache folder (default: $DATASET_TOOLKIT_CACHE_DIR or ~/.cache/dataset_toolkit/stages).")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="List cached stage outputs, most recently used first.")
+    prune_parser = subparsers.add_parser("prune", help="Evict entries by age and total size.")
+    prune_parser.add_argument("--max-size-gb", type=float, default=None, help="Maximum total cache size in GB.")
+    prune_parser.add_argument("--max-age-days", type=float, default=None, help="Evict entries unused for this many days.")
+    subparsers.add_parser("clear", help="Remove every cached stage output.")
+    args = parser.parse_args()
+
+    cache_dir = get_cache_dir(args.cache_dir)
+    if args.command == "list":
+        entries = list_entries(cache_dir)
+        print(f"Stage cache: {cache_dir}")
+        for entry in entries:
+            last_used = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.get("last_used", 0)))
+            print(f"  {entry['key'][:12]}  {_format_size(entry.get('size', 0)):>10}  last used {last_used}  "
+                  f"hits {entry.get('hits', 0):<4} {entry.get('step', '?')}  <- {entry.get('input_file', '?')}")
+        print(f"{len(entries)} entries, {_format_size(sum(e.get('size', 0) for e in entries))} total")
+    elif args.command == "prune":
+        removed, freed = prune(cache_dir, max_size_gb=args.max_size_gb, max_age_days=args.max_age_days)
+        print(f"Removed {removed} entries, freed {_format_size(freed)}.")
+    elif args.command == "clear":
+        removed = clear(cache_dir)
+        print(f"Removed {removed} entries from {cache_dir}.")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+# tools/token_cache.py
+"""
+Persistent cache of token counts, shared by the token counting tools.
+
+Counts are stored in a SQLite database under (tokenizer fingerprint, hash of
+the text), so re-counting a dataset after a small edit only tokenizes the
+texts that changed. The fingerprint covers everything that changes a count
+(the tokenizer's vocabulary, merges, normalizer, added and special tokens),
+so two tokenizers never share counts.
+
+Every entry remembers the last session that used it. When the database grows
+past max_entries, the least recently used entries are evicted when a session
+closes. Several processes can share one database; a pool that gives each
+worker its own session registers close_at_exit in the worker and calls
+evict_cache in the parent once the pool is done.
+
+Usage (from the DatasetToolkit folder):
+    python -m tools.token_cache stats
+    python -m tools.token_cache prune --max-entries 10000000
+    python -m tools.token_cache clear
+"""
+import argparse
+import hashlib
+import multiprocessing.util
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+DEFAULT_CACHE_PATH = Path.home() / ".cache" / "dataset_toolkit" / "token_counts.sqlite"
+DEFAULT_MAX_ENTRIES = 20_000_000  # About 1 GB on disk
+# Hashes per SQL statement; stays under SQLite's limit on bound parameters.
+QUERY_CHUNK = 500
+
+
+def get_cache_path(cache_path=None):
+    """Returns the database path: the argument, $DATASET_TOOLKIT_TOKEN_CACHE or ~/.cache/dataset_toolkit/token_counts.sqlite."""
+    return Path(cache_path or os.environ.get("DATASET_TOOLKIT_TOKEN_CACHE") or DEFAULT_CACHE_PATH)
+
+
+def get_max_entries(max_entries=None):
+    """Returns the eviction limit: the argument, $DATASET_TOOLKIT_TOKEN_CACHE_MAX_ENTRIES or DEFAULT_MAX_ENTRIES."""
+    if max_entries is None:
+        max_entries = int(os.environ.get("DATASET_TOOLKIT_TOKEN_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+    return max_entries
+
+
+def text_hash(text):
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+
+def tokenizer_fingerprint(tokenizer):
+    """
+    Identifies a tokenizer by its full definition: the serialized fast
+    tokenizer for transformers tokenizers, the encoding name for tiktoken.
+    """
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        # Holds the vocabulary, merges, normalizer, added tokens and the post-processor that adds BOS/EOS.
+        return "hf:" + hashlib.sha256(backend.to_str().encode('utf-8')).hexdigest()
+    if type(tokenizer).__module__.startswith("tiktoken"):
+        return f"tiktoken:{tokenizer.name}"
+    # Slow tokenizers: their class, vocabulary and added tokens.
+    vocab = sorted(tokenizer.get_vocab().items())
+    return f"{type(tokenizer).__name__}:" + hashlib.sha256(repr(vocab).encode('utf-8')).hexdigest()
+
+
+class TokenCountCache:
+    """
+    Token counts of one tokenizer, backed by a shared SQLite database.
+    Use as a context manager, or call close() to commit and evict.
+    """
+
+    def __init__(self, fingerprint, cache_path=None, max_entries=None):
+        self.path = get_cache_path(cache_path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = get_max_entries(max_entries)
+        self.hits = 0
+        self.misses = 0
+        # Sessions are numbered by their start time; an entry's last_used is the last session that read or wrote it.
+        self.session = int(time.time())
+        self._connection = sqlite3.connect(self.path, timeout=60)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS tokenizers (id INTEGER PRIMARY KEY, fingerprint TEXT UNIQUE NOT NULL);
+            CREATE TABLE IF NOT EXISTS counts (
+                tokenizer INTEGER NOT NULL, text_hash BLOB NOT NULL, tokens INTEGER NOT NULL, last_used INTEGER NOT NULL,
+                PRIMARY KEY (tokenizer, text_hash)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS counts_last_used ON counts (last_used);
+        """)
+        with self._connection:
+            self._connection.execute("INSERT OR IGNORE INTO tokenizers (fingerprint) VALUES (?)", (fingerprint,))
+        self._tokenizer_id = self._connection.execute(
+            "SELECT id FROM tokenizers WHERE fingerprint = ?", (fingerprint,)).fetchone()[0]
+
+    @classmethod
+    def for_tokenizer(cls, tokenizer, cache_path=None, max_entries=None):
+        return cls(tokenizer_fingerprint(tokenizer), cache_path, max_entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get_many(self, texts):
+        """Cached counts of texts, None for the ones that aren't cached."""
+        hashes = [text_hash(text) for text in texts]
+        found = {}
+        for start in range(0, len(hashes), QUERY_CHUNK):
+            chunk = hashes[start:start + QUERY_CHUNK]
+            rows = self._connection.execute(
+                f"SELECT text_hash, tokens FROM counts WHERE tokenizer = ? AND text_hash IN ({','.join('?' * len(chunk))})",
+                [self._tokenizer_id, *chunk]).fetchall()
+            found.update(rows)
+        if found:
+            with self._connection:
+                self._connection.executemany(
+                    "UPDATE counts SET last_used = ? WHERE tokenizer = ? AND text_hash = ? AND last_used < ?",
+                    [(self.session, self._tokenizer_id, h, self.session) for h in found])
+        counts = [found.get(h) for h in hashes]
+        self.hits += len(texts) - counts.count(None)
+        self.misses += counts.count(None)
+        return counts
+
+    def put_many(self, texts, counts):
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO counts (tokenizer, text_hash, tokens, last_used) VALUES (?, ?, ?, ?)",
+                [(self._tokenizer_id, text_hash(text), count, self.session) for text, count in zip(texts, counts)])
+
+    def count_many(self, texts, encode_batch):
+        """
+        Token counts of texts. Only the texts that aren't cached are passed to
+        encode_batch (a function from a list of texts to their counts), and
+        their counts are stored.
+        """
+        counts = self.get_many(texts)
+        missing = [i for i, count in enumerate(counts) if count is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            new_counts = encode_batch(missing_texts)
+            self.put_many(missing_texts, new_counts)
+            for i, count in zip(missing, new_counts):
+                counts[i] = count
+        return counts
+
+    def close(self):
+        if self._connection is None:
+            return
+        evict(self._connection, self.max_entries)
+        self._connection.close()
+        self._connection = None
+
+
+def evict(connection, max_entries):
+    """Deletes the least recently used entries until at most max_entries are left. Returns the number deleted."""
+    # Counted inside the DELETE, so processes evicting at the same time don't each remove the same excess.
+    with connection:
+        deleted = connection.execute(
+            "DELETE FROM counts WHERE (tokenizer, text_hash) IN (SELECT tokenizer, text_hash FROM counts "
+            "ORDER BY last_used LIMIT max(0, (SELECT COUNT(*) FROM counts) - ?))", (max_entries,)).rowcount
+    return deleted
+
+
+def open_cache(tokenizer, token_cache):
+    """
+    The cache the tools use for a token_cache option: None or False disables
+    it, True uses the default database and a string is the database path.
+    """
+    if not token_cache:
+        return None
+    return TokenCountCache.for_tokenizer(tokenizer, None if token_cache is True else token_cache)
+
+
+def close_at_exit(cache):
+    """
+    Closes cache (committing and evicting) when the current pool worker
+    process exits. Pool workers leave through multiprocessing's own exit
+    path, which skips atexit handlers under fork and forkserver.
+    """
+    if cache is not None:
+        multiprocessing.util.Finalize(None, cache.close, exitpriority=10)
+    return cache
+
+
+def evict_cache(token_cache, max_entries=None):
+    """
+    Enforces the size limit of the database behind a token_cache option (see
+    open_cache) once several processes have used it. Returns the number of
+    entries deleted.
+    """
+    if not token_cache:
+        return 0
+    cache_path = get_cache_path(None if token_cache is True else token_cache)
+    if not cache_path.exists():
+        return 0
+    connection = sqlite3.connect(cache_path, timeout=60)
+    try:
+        return evict(connection, get_max_entries(max_entries))
+    finally:
+        connection.close()
+
+
+def main():
+    """Command-line interface to inspect and clear the token count cache."""
+    parser = argparse.ArgumentParser(description="Inspect and clear the token count cache.")
+    parser.add_argument("--cache-path", default=None, help="Database file (default: $DATASET_TOOLKIT_TOKEN_CACHE or ~/.cache/dataset_toolkit/token_counts.sqlite).")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="Show the number of cached counts per tokenizer.")
+    prune_parser = subparsers.add_parser("prune", help="Evict the least recently used counts.")
+    prune_parser.add_argument("--max-entries", type=int, required=True, help="Number of counts to keep.")
+    subparsers.add_parser("clear", help="Delete the cache database.")
+    args = parser.parse_args()
+
+    cache_path = get_cache_path(args.cache_path)
+    if args.command == "clear":
+        for path in (cache_path, Path(f"{cache_path}-wal"), Path(f"{cache_path}-shm")):
+            if path.exists():
+                path.unlink()
+        print(f"Removed {cache_path}.")
+        return
+    if not cache_path.exists():
+        print(f"No token count cache at {cache_path}.")
+        return
+    connection = sqlite3.connect(cache_path, timeout=60)
+    try:
+        if args.command == "stats":
+            print(f"Token count cache: {cache_path} ({cache_path.stat().st_size / 1024 ** 2:.1f} MB)")
+            rows = connection.execute("SELECT t.fingerprint, COUNT(c.text_hash), MAX(c.last_used) FROM tokenizers t "
+                                      "LEFT JOIN counts c ON c.tokenizer = t.id GROUP BY t.id ORDER BY 2 DESC").fetchall()
+            for fingerprint, entries, last_used in rows:
+                used = time.strftime("%Y-%m-%d %H:%M", time.localtime(last_used)) if last_used else "never"
+                print(f"  {entries:>12,}  last used {used}  {fingerprint[:40]}")
+        elif args.command == "prune":
+            print(f"Removed {evict(connection, args.max_entries):,} counts.")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
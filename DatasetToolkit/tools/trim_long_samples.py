@@ -0,0 +1,418 @@
+# tools/trim_long_samples.py
+"""
+Trims ShareGPT conversations that are longer than the training sequence length.
+
+A conversation that doesn't fit in max_length tokens (rendered with the
+tokenizer's chat template) loses (human, gpt) pairs from its start, after the
+system turn and before the final pair, until it fits; conversations that still
+don't fit are dropped.
+
+Records are rendered and encoded in batches through the tokenizer's batch API.
+The number of pairs to drop is estimated from per-turn token counts with
+prefix sums and a binary search, then confirmed with the full template.
+
+With workers > 1 the input is split into byte-range shards on line boundaries
+that a process pool trims in parallel; each worker loads the tokenizer once
+and the shard outputs are merged back in the original order.
+
+With a token cache (see tools.token_cache), conversation lengths are looked
+up by the hash of the rendered text first, so a re-run only encodes the
+conversations that changed or still need trimming.
+
+Usage:
+    python trim_long_samples.py input.jsonl output.jsonl --model meta-llama/Llama-3.3-70B-Instruct
+        [--max-length 8192] [--workers 8] [--report lengths.json] [--token-cache]
+"""
+import argparse
+import csv
+import os
+import sys
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+try:
+    from tools import jsonio
+    from tools.sharding import find_shard_boundaries, concatenate_files
+    from tools.token_cache import close_at_exit, evict_cache, open_cache
+except ImportError:  # run as a standalone script from the tools folder
+    import jsonio
+    from sharding import find_shard_boundaries, concatenate_files
+    from token_cache import close_at_exit, evict_cache, open_cache
+
+try:
+    from transformers import AutoTokenizer
+except ImportError:  # only needed when the tool runs (pip install transformers)
+    AutoTokenizer = None
+
+DEFAULT_MODEL_PATH = "meta-llama/Llama-3.3-70B-Instruct"
+DEFAULT_MAX_LENGTH = 8192  # Your Axolotl max_seq_length
+BATCH_SIZE = 256  # Records tokenized together; the fast tokenizer spreads a batch over its threads
+SPECIAL_TOKENS = ["<thinking>", "</thinking>", "<choices>", "</choices>"]
+# Dropped rows that get a message of their own; the rest are only counted.
+MAX_DROP_MESSAGES = 20
+
+
+def load_tokenizer(model_path):
+    """Loads the model's tokenizer and adds the dataset's special tokens."""
+    if AutoTokenizer is None:
+        raise ImportError("Trimming long samples requires transformers (pip install transformers).")
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    tokenizer.add_special_tokens({"additional_special_tokens": SPECIAL_TOKENS})
+    return tokenizer
+
+
+def to_chat_messages(conversation):
+    """Converts ShareGPT turns to the format the tokenizer's chat template expects."""
+    messages = []
+    for turn in conversation:
+        if turn['from'] == 'human':
+            role = 'user'
+        elif turn['from'] == 'gpt':
+            role = 'assistant'
+        else:
+            role = turn['from'] # Handles 'system'
+        messages.append({'role': role, 'content': turn['value']})
+    return messages
+
+
+def render(conversation, tk):
+    return tk.apply_chat_template(to_chat_messages(conversation), tokenize=False)
+
+
+def count_tokens(conversation, tk, cache=None):
+    """Exact token count of a conversation: the full template, rendered and encoded."""
+    rendered = render(conversation, tk)
+    if cache is None:
+        return len(tk.encode(rendered))
+    return cache.count_many([rendered], lambda texts: [len(tk.encode(text)) for text in texts])[0]
+
+
+def turn_token_counts(conversation, rendered, offsets):
+    """
+    Splits the tokens of a rendered conversation into one block per turn.
+
+    A turn's block runs from the start of its content to the start of the next
+    turn's content, so it holds the content plus the template tokens that close
+    it and open the next turn. Dropping a run of turns then removes exactly
+    their blocks: the header before the run now opens the turn after it.
+    Everything before the first content (BOS, default system prompt, first
+    header) is fixed overhead. Returns None if a turn's content can't be found
+    in the rendered text (a template that rewrites content).
+    """
+    starts = []
+    position = 0
+    for turn in conversation:
+        if not isinstance(turn['value'], str):
+            return None
+        # Templates commonly trim the content, so look for the trimmed text.
+        content = turn['value'].strip()
+        start = rendered.find(content, position)
+        if start < 0:
+            return None
+        starts.append(start)
+        position = start + len(content)
+
+    counts = [0] * len(conversation)
+    for token_start, token_end in offsets:
+        if token_start == token_end:
+            continue  # Added special tokens (BOS) have an empty span
+        block = bisect_right(starts, token_start) - 1
+        if block >= 0:
+            counts[block] += 1
+    return counts
+
+
+def trim_conversation(conversation, max_len, tk, rendered=None, initial_tokens=None, offsets=None, cache=None):
+    """
+    Drops (human, gpt) pairs from the start of the conversation, after the
+    system turn and before the final pair, until it fits in max_len tokens.
+    Returns (conversation, tokens), or (None, tokens) if it can't be trimmed.
+
+    The number of pairs to drop is estimated from per-turn token counts with
+    prefix sums and a binary search, then confirmed with the full template:
+    the result is the smallest number of pairs for which the real count fits.
+    rendered, initial_tokens and offsets come from the batch encoding; without
+    offsets (a slow tokenizer) pairs are dropped one at a time. cache is an
+    optional TokenCountCache for the full-template counts.
+    """
+    if rendered is None:
+        rendered = render(conversation, tk)
+    if initial_tokens is None:
+        initial_tokens = len(tk.encode(rendered))
+
+    if initial_tokens <= max_len:
+        return conversation, initial_tokens # No changes needed
+
+    system_turn = conversation[0] if conversation[0]['from'] == 'system' else None
+    start_index = 1 if system_turn else 0
+    middle_turns = conversation[start_index:-2]
+    last_two_turns = conversation[-2:]
+
+    if len(last_two_turns) < 2 or not (last_two_turns[0]['from'] == 'human' and last_two_turns[1]['from'] == 'gpt'):
+        print(f"  [WARNING] Row does not end in a human/gpt pair. Cannot trim safely. Original tokens: {initial_tokens}")
+        return None, 0
+
+    def trimmed(pairs):
+        # Remove turns in pairs (human and gpt) to keep context logical
+        return ([system_turn] if system_turn else []) + middle_turns[2 * pairs:] + last_two_turns
+
+    max_pairs = (len(middle_turns) + 1) // 2
+    counts = turn_token_counts(conversation, rendered, offsets) if offsets is not None else None
+
+    if counts is None:
+        pairs, current_tokens = 0, initial_tokens
+        while current_tokens > max_len and pairs < max_pairs:
+            pairs += 1
+            current_tokens = count_tokens(trimmed(pairs), tk, cache)
+    else:
+        # prefix[n] is the estimated number of tokens saved by dropping the first n middle turns.
+        prefix = [0]
+        for count in counts[start_index:start_index + len(middle_turns)]:
+            prefix.append(prefix[-1] + count)
+        dropped_turns = bisect_left(prefix, initial_tokens - max_len)
+        pairs = min((dropped_turns + 1) // 2, max_pairs)
+
+        # Confirm the estimate with the full template, moving to the right pair count if it was off.
+        current_tokens = count_tokens(trimmed(pairs), tk, cache)
+        while current_tokens > max_len and pairs < max_pairs:
+            pairs += 1
+            current_tokens = count_tokens(trimmed(pairs), tk, cache)
+        while current_tokens <= max_len and pairs > 1:
+            fewer_tokens = count_tokens(trimmed(pairs - 1), tk, cache)
+            if fewer_tokens > max_len:
+                break
+            pairs, current_tokens = pairs - 1, fewer_tokens
+
+    if current_tokens > max_len:
+        return None, current_tokens
+
+    return trimmed(pairs), current_tokens
+
+
+def trim_batch(conversations, renders, max_len, tk, cache=None):
+    """
+    Trims a batch of conversations, encoding all of their full renders in one
+    tokenizer call. Returns one (conversation_or_None, tokens, initial_tokens)
+    per conversation. With a cache, only the renders that aren't cached or are
+    too long (their offsets are needed for trimming) are encoded.
+    """
+    initial_lengths = cache.get_many(renders) if cache is not None else [None] * len(renders)
+    offsets = [None] * len(renders)
+    to_encode = [i for i, length in enumerate(initial_lengths) if length is None or length > max_len]
+    if to_encode:
+        encoding = tk([renders[i] for i in to_encode], return_offsets_mapping=tk.is_fast)
+        new_lengths = []
+        for position, i in enumerate(to_encode):
+            if initial_lengths[i] is None:
+                initial_lengths[i] = len(encoding['input_ids'][position])
+                new_lengths.append(i)
+            if tk.is_fast:
+                offsets[i] = encoding['offset_mapping'][position]
+        if cache is not None and new_lengths:
+            cache.put_many([renders[i] for i in new_lengths], [initial_lengths[i] for i in new_lengths])
+
+    results = []
+    for conversation, rendered, initial_len, token_offsets in zip(conversations, renders, initial_lengths, offsets):
+        trimmed_convo, final_len = trim_conversation(conversation, max_len, tk, rendered, initial_len, token_offsets, cache)
+        results.append((trimmed_convo, final_len, initial_len))
+    return results
+
+
+def _new_result(bin_size):
+    # before/after map a histogram bin (tokens // bin_size) to its number of conversations.
+    return {"stats": Counter(), "before": Counter(), "after": Counter(), "messages": [], "bin_size": bin_size}
+
+
+def _trim_range(tokenizer, input_file, start, end, outfile, max_length, batch_size, result, cache=None):
+    """Trims the records of one byte range of input_file into outfile, adding to result."""
+    stats, bin_size = result["stats"], result["bin_size"]
+
+    def flush(batch):
+        results = trim_batch([data["conversations"] for _, _, data, _ in batch],
+                             [rendered for _, _, _, rendered in batch], max_length, tokenizer, cache)
+        for (offset, raw, data, _), (trimmed_convo, final_len, initial_len) in zip(batch, results):
+            result["before"][initial_len // bin_size] += 1
+            if trimmed_convo:
+                changed = trimmed_convo is not data["conversations"]
+                data["conversations"] = trimmed_convo
+                outfile.write_record(data, raw, changed)
+                result["after"][final_len // bin_size] += 1
+                stats["written"] += 1
+                stats["trimmed"] += changed
+            else:
+                stats["dropped"] += 1
+                if len(result["messages"]) < MAX_DROP_MESSAGES:
+                    result["messages"].append(f"  - Line at byte offset {offset}: Dropped. "
+                                              f"Still too long ({final_len} tokens) even after trimming.")
+
+    batch = []
+    for offset, raw, data in jsonio.iter_jsonl(input_file, start, end):
+        stats["rows"] += 1
+        if data is None:
+            stats["malformed"] += 1
+            continue
+        try:
+            if not isinstance(data, dict) or not data.get("conversations"):
+                raise KeyError("conversations")
+            batch.append((offset, raw, data, render(data["conversations"], tokenizer)))
+        except KeyError:
+            stats["malformed"] += 1
+            continue
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+
+# Tokenizer and token cache of a pool worker, opened once by _init_worker.
+_worker_tokenizer = None
+_worker_cache = None
+
+
+def _init_worker(model_path, token_cache):
+    global _worker_tokenizer, _worker_cache
+    # The pool already keeps every core busy; the Rust tokenizer's own threads would only compete with it.
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    _worker_tokenizer = load_tokenizer(model_path)
+    _worker_cache = close_at_exit(open_cache(_worker_tokenizer, token_cache))
+
+
+def _trim_shard(input_file, start, end, part_path, max_length, batch_size, bin_size):
+    """Worker: trims one byte range into its part file and returns its counters and histograms."""
+    result = _new_result(bin_size)
+    with jsonio.JsonlWriter(part_path) as outfile:
+        _trim_range(_worker_tokenizer, input_file, start, end, outfile, max_length, batch_size, result, _worker_cache)
+        outfile.flush()
+        os.fsync(outfile.fileno())
+    if _worker_cache is not None:
+        result["stats"]["cache_hits"] += _worker_cache.hits
+        result["stats"]["cache_misses"] += _worker_cache.misses
+        _worker_cache.hits = _worker_cache.misses = 0
+    return result
+
+
+def _merge_results(results, bin_size):
+    merged = _new_result(bin_size)
+    for result in results:
+        for key in ("stats", "before", "after"):
+            merged[key].update(result[key])
+        merged["messages"].extend(result["messages"])
+    del merged["messages"][MAX_DROP_MESSAGES:]
+    return merged
+
+
+def length_histogram(result):
+    """Rows of (from_tokens, to_tokens, conversations_before, conversations_after), one per non-empty bin."""
+    bin_size = result["bin_size"]
+    bins = sorted(set(result["before"]) | set(result["after"]))
+    return [(b * bin_size, (b + 1) * bin_size - 1, result["before"][b], result["after"][b]) for b in bins]
+
+
+def print_histogram(result, max_length):
+    rows = length_histogram(result)
+    if not rows:
+        return
+    print(f"\nToken lengths (max length {max_length}):")
+    print(f"  {'tokens':>19}  {'before':>10}  {'after':>10}")
+    for low, high, before, after in rows:
+        marker = "  > max" if low > max_length else ""
+        print(f"  {low:>8} - {high:>8}  {before:>10}  {after:>10}{marker}")
+
+
+def write_length_report(report_file, result, max_length):
+    """Writes the histogram as CSV if report_file ends in .csv, as JSON otherwise."""
+    rows = length_histogram(result)
+    Path(report_file).parent.mkdir(parents=True, exist_ok=True)
+    if str(report_file).lower().endswith(".csv"):
+        with open(report_file, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["from_tokens", "to_tokens", "before", "after"])
+            writer.writerows(rows)
+    else:
+        with open(report_file, 'w', encoding='utf-8') as f:
+            jsonio.dump({"max_length": max_length, "bin_size": result["bin_size"], "stats": dict(result["stats"]),
+                         "histogram": [{"from_tokens": low, "to_tokens": high, "before": before, "after": after}
+                                       for low, high, before, after in rows]}, f, indent=2)
+
+
+def trim_long_samples(input_file, output_file, model_path=DEFAULT_MODEL_PATH, max_length=DEFAULT_MAX_LENGTH,
+                      batch_size=BATCH_SIZE, workers=1, report_file=None, bin_size=None, shards_per_worker=4,
+                      token_cache=None):
+    """
+    Trims every conversation of input_file to max_length tokens and writes the
+    ones that fit to output_file. Lines that aren't valid JSON or have no
+    conversations are dropped. Prints a token-length histogram before and
+    after trimming and writes it to report_file (.json or .csv) if given.
+    bin_size is the histogram bin width in tokens (default max_length / 8).
+    token_cache is True for the default token count cache, a database path,
+    or None to tokenize everything (see tools.token_cache).
+    """
+    bin_size = bin_size or max(1, max_length // 8)
+    workers = max(1, int(workers or 1))
+    print(f"Processing {input_file} (max length {max_length} tokens)...")
+
+    if workers == 1:
+        print("Loading tokenizer...")
+        tokenizer = load_tokenizer(model_path)
+        result = _new_result(bin_size)
+        cache = open_cache(tokenizer, token_cache)
+        try:
+            with jsonio.JsonlWriter(output_file) as outfile:
+                _trim_range(tokenizer, input_file, 0, os.path.getsize(input_file), outfile, max_length, batch_size,
+                            result, cache)
+        finally:
+            if cache is not None:
+                result["stats"].update(cache_hits=cache.hits, cache_misses=cache.misses)
+                cache.close()
+    else:
+        shards = find_shard_boundaries(input_file, workers * shards_per_worker)
+        part_paths = [f"{output_file}.part{i:05d}" for i in range(len(shards))]
+        print(f"Processing {len(shards)} shard(s) with {workers} worker process(es)...")
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_path, token_cache)) as executor:
+            futures = [executor.submit(_trim_shard, input_file, start, end, part_path, max_length, batch_size, bin_size)
+                       for (start, end), part_path in zip(shards, part_paths)]
+            # Collected in shard order, so the drop messages come out in file order too.
+            result = _merge_results([future.result() for future in futures], bin_size)
+        # The workers have closed their sessions by now; this applies the limit to everything they added together.
+        evict_cache(token_cache)
+        concatenate_files(part_paths, output_file)
+
+    stats = result["stats"]
+    for message in result["messages"]:
+        print(message)
+    print_histogram(result, max_length)
+    print(f"\nDone. Processed {stats['rows']} rows.")
+    print(f"Wrote {stats['written']} valid rows to {output_file} ({stats['trimmed']} trimmed).")
+    print(f"Dropped {stats['dropped'] + stats['malformed']} rows "
+          f"({stats['dropped']} too long, {stats['malformed']} invalid JSON or without conversations).")
+    if token_cache:
+        print(f"Token cache: {stats['cache_hits']} hits, {stats['cache_misses']} misses.")
+    if report_file:
+        write_length_report(report_file, result, max_length)
+        print(f"Length report written to: {report_file}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trim ShareGPT conversations to the training sequence length.")
+    parser.add_argument("input_file", help="Input .jsonl file.")
+    parser.add_argument("output_file", help="Output .jsonl file.")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="Path or hub name of the model whose tokenizer and chat template are used.")
+    parser.add_argument("--max-length", type=int, default=DEFAULT_MAX_LENGTH, help="Maximum tokens per conversation (your max_seq_length).")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Records encoded per tokenizer call.")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes; each loads its own tokenizer.")
+    parser.add_argument("--report", default=None, help="Write the token-length histogram to this .json or .csv file.")
+    parser.add_argument("--bin-size", type=int, default=None, help="Histogram bin width in tokens (default: max length / 8).")
+    parser.add_argument("--token-cache", nargs="?", const=True, default=None, metavar="PATH",
+                        help="Reuse token counts from the token cache (default database, or the one at PATH).")
+    args = parser.parse_args()
+
+    trim_long_samples(args.input_file, args.output_file, model_path=args.model, max_length=args.max_length,
+                      batch_size=args.batch_size, workers=args.workers, report_file=args.report, bin_size=args.bin_size,
+                      token_cache=args.token_cache)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
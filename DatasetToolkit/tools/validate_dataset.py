@@ -1,6 +1,9 @@
 # tools/validate_dataset.py
-import json
 import sys
+try:
+    from tools import jsonio
+except ImportError:  # run as a standalone script from the tools folder
+    import jsonio
 
 def validate_and_clean_jsonl(input_file, output_file):
     print(f"[*] Starting validation and cleaning of {input_file}...")
@@ -8,22 +11,19 @@ def validate_and_clean_jsonl(input_file, output_file):
     lines_skipped = 0
     
     try:
-        with open(input_file, 'r', encoding='utf-8') as infile, \
-             open(output_file, 'w', encoding='utf-8') as outfile:
-            for i, line in enumerate(infile, 1):
-                line = line.strip()
-                if not line:
+        with jsonio.JsonlWriter(output_file) as outfile:
+            for i, (_, raw, data) in enumerate(jsonio.iter_jsonl(input_file), 1):
+                if not raw.strip():
                     continue
-                try:
-                    data = json.loads(line)
-                    if isinstance(data, dict) and 'text' in data and isinstance(data['text'], str):
-                        outfile.write(json.dumps(data) + '\n')
-                        lines_written += 1
-                    else:
-                        print(f"Warning: Skipping line {i} due to incorrect structure: {line}", file=sys.stderr)
-                        lines_skipped += 1
-                except json.JSONDecodeError:
-                    print(f"Warning: Skipping line {i} due to invalid JSON format: {line}", file=sys.stderr)
+                if data is None:
+                    print(f"Warning: Skipping line {i} due to invalid JSON format: {jsonio.decode_line(raw).strip()}", file=sys.stderr)
+                    lines_skipped += 1
+                elif isinstance(data, dict) and 'text' in data and isinstance(data['text'], str):
+                    # Re-serialized so every output line is compact, single-line JSON.
+                    outfile.write(data)
+                    lines_written += 1
+                else:
+                    print(f"Warning: Skipping line {i} due to incorrect structure: {jsonio.decode_line(raw).strip()}", file=sys.stderr)
                     lines_skipped += 1
     except FileNotFoundError:
         raise Exception(f"Input file not found at '{input_file}'")
@@ -0,0 +1,150 @@
+# bench_merge_kernel.py
+"""
+Compares the row-block LoRA merge kernel with the original full-tensor expression on CPU: results, time and peak memory.
+
+The reference is the expression the merge scripts used:
+    (weight.to(float32) + (lora_B.to(float32) @ lora_A.to(float32)) * scaling).to(weight.dtype)
+which holds three float32 copies of the weight at once. merge_lora_weight
+(safetensors_stream) merges float32 row blocks into a preallocated output
+instead. Both must agree to within two rounding steps of the weight's dtype:
+the kernel scales B @ A inside addmm_, so its float32 sum can differ from
+the reference's in the last bit, and the cast back to the weight's dtype
+can then round the two either way.
+
+Each kernel runs in its own process, so its peak RSS is measured on its own.
+
+Usage:
+    python bench_merge_kernel.py --rows 28672 --cols 8192 --rank 64 --dtype bfloat16
+"""
+import argparse
+import multiprocessing
+import resource
+import sys
+import time
+
+import torch
+
+from safetensors_stream import merge_lora_weight
+
+
+def reference_merge(weight, lora_A, lora_B, scaling):
+    """The original merge: full float32 copies of the weight and of the delta."""
+    return (weight.to(torch.float32) + (lora_B.to(torch.float32) @ lora_A.to(torch.float32)) * scaling).to(weight.dtype)
+
+
+def make_inputs(rows, cols, rank, dtype, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    # Filled in row blocks, so generating the weight doesn't leave a float32 copy's worth of peak RSS behind.
+    weight = torch.empty(rows, cols, dtype=dtype)
+    for start in range(0, rows, 1024):
+        stop = min(start + 1024, rows)
+        weight[start:stop] = torch.randn(stop - start, cols, generator=generator) * 0.02
+    lora_A = (torch.randn(rank, cols, generator=generator) * 0.01).to(dtype)
+    lora_B = (torch.randn(rows, rank, generator=generator) * 0.01).to(dtype)
+    return weight, lora_A, lora_B
+
+
+def peak_rss_bytes():
+    """Peak RSS since the last reset_peak_rss(), or since the process started."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def reset_peak_rss():
+    """Resets the peak to the current RSS where the OS allows it (Linux); elsewhere the peak keeps the setup's."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def run_kernel(kernel, rows, cols, rank, dtype_name, scaling, repeat, queue):
+    """Child process: times one kernel and reports (best seconds, extra peak RSS in bytes)."""
+    dtype = getattr(torch, dtype_name)
+    weight, lora_A, lora_B = make_inputs(rows, cols, rank, dtype)
+    merge = merge_lora_weight if kernel == "block" else reference_merge
+    reset_peak_rss()
+    baseline = peak_rss_bytes()
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        merged = merge(weight, lora_A, lora_B, scaling)
+        best = min(best, time.perf_counter() - start)
+        del merged
+    # The merged result itself is the same size for both kernels; everything above it is temporaries.
+    queue.put((best, peak_rss_bytes() - baseline - weight.numel() * weight.element_size()))
+
+
+def timed(kernel, args):
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=run_kernel, args=(kernel, args.rows, args.cols, args.rank, args.dtype,
+                                                       args.scaling, args.repeat, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def check_equivalence(rows, cols, rank, dtype, scaling, block_bytes):
+    """
+    Fails if the kernel differs from the reference by more than two rounding
+    steps of dtype anywhere. Returns the fraction of elements that differ.
+    """
+    weight, lora_A, lora_B = make_inputs(rows, cols, rank, dtype, seed=1)
+    merged = merge_lora_weight(weight, lora_A, lora_B, scaling, block_bytes=block_bytes)
+    if merged.dtype != weight.dtype or merged.shape != weight.shape:
+        raise SystemExit("The kernel's output has the wrong dtype or shape.")
+    expected = reference_merge(weight, lora_A, lora_B, scaling).to(torch.float32)
+    merged = merged.to(torch.float32)
+    # Rounding steps at the magnitude of the operands, so cancellations near zero don't count as errors. The
+    # product's terms count too: a row block's matmul may sum the rank dimension in a different order.
+    magnitude = (weight.to(torch.float32).abs() + expected.abs()
+                 + abs(scaling) * (lora_B.to(torch.float32).abs() @ lora_A.to(torch.float32).abs()))
+    tolerance = 2 * torch.finfo(dtype).eps * magnitude + torch.finfo(dtype).tiny
+    if ((merged - expected).abs() > tolerance).any():
+        worst = (merged - expected).abs().max().item()
+        raise SystemExit(f"The kernel differs from the reference by up to {worst:.3g} ({rows}x{cols}, rank {rank}).")
+    return (merged != expected).float().mean().item()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=28672, help="Output features of the benchmarked weight.")
+    parser.add_argument("--cols", type=int, default=8192, help="Input features of the benchmarked weight.")
+    parser.add_argument("--rank", type=int, default=64, help="LoRA rank.")
+    parser.add_argument("--dtype", default="bfloat16", choices=["bfloat16", "float16", "float32"], help="Weight dtype.")
+    parser.add_argument("--scaling", type=float, default=2.0, help="lora_alpha / r.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per kernel; the best is reported.")
+    args = parser.parse_args()
+
+    dtype = getattr(torch, args.dtype)
+    # Odd shapes and tiny blocks exercise the partial last block and single-row blocks.
+    for rows, cols, rank, block_bytes in ((97, 61, 8, 4 * 61 * 10), (1, 33, 4, 1), (300, 128, 16, 4 * 128 * 7),
+                                          (1024, 512, 64, 1 << 20)):
+        check_equivalence(rows, cols, rank, dtype, args.scaling, block_bytes)
+    differing = check_equivalence(2048, 1024, args.rank, dtype, args.scaling, 4 * 1024 * 100)
+    print(f"Kernel matches the reference within two rounding steps ({differing:.4%} of elements round differently).")
+
+    size_mb = args.rows * args.cols * torch.empty(0, dtype=dtype).element_size() / 1024 ** 2
+    print(f"\nWeight {args.rows}x{args.cols} {args.dtype} ({size_mb:,.0f} MB), rank {args.rank}, torch threads {torch.get_num_threads()}:")
+    print(f"  {'kernel':<12} {'seconds':>9} {'extra peak MB':>14}")
+    results = {}
+    for kernel, label in (("reference", "full fp32"), ("block", "row blocks")):
+        seconds, extra = timed(kernel, args)
+        results[kernel] = seconds
+        print(f"  {label:<12} {seconds:>9.3f} {max(extra, 0) / 1024 ** 2:>14,.0f}")
+    print(f"Speedup: {results['reference'] / results['block']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
 import sys
 import argparse
+from pathlib import Path
 import tiktoken
 
-def count_tokens(text: str, encoding_name: str) -> int:
+sys.path.insert(0, str(Path(__file__).resolve().parent / "DatasetToolkit"))
+from tools.token_cache import open_cache
+
+def count_tokens(text: str, encoding_name: str, token_cache=None) -> int:
     """Counts the number of tokens in a text string using the specified encoding."""
     try:
         encoding = tiktoken.get_encoding(encoding_name)
@@ -10,9 +14,12 @@ def count_tokens(text: str, encoding_name: str) -> int:
         print(f"Error: Encoding '{encoding_name}' not found.")
         print("Available encodings: ", tiktoken.list_encoding_names())
         sys.exit(1)
-        
-    token_integers = encoding.encode(text)
-    return len(token_integers)
+
+    cache = open_cache(encoding, token_cache)
+    if cache is None:
+        return len(encoding.encode(text))
+    with cache:
+        return cache.count_many([text], lambda texts: [len(ids) for ids in encoding.encode_batch(texts)])[0]
 
 def main():
     """Main function to parse arguments and count tokens."""
@@ -36,6 +43,14 @@ def main():
             "'p50k_base' is used by older models like text-davinci-003."
         )
     )
+    parser.add_argument(
+        "--token-cache",
+        nargs="?",
+        const=True,
+        default=None,
+        metavar="PATH",
+        help="Reuse the count from the token cache (default database, or the one at PATH)."
+    )
 
     args = parser.parse_args()
 
@@ -51,7 +66,7 @@ def main():
             args.file.close()
 
     # Calculate and print the number of tokens
-    token_count = count_tokens(content, args.encoding)
+    token_count = count_tokens(content, args.encoding, args.token_cache)
     print(f"Encoding: {args.encoding}")
     print(f"Token count: {token_count:,}")
 
@@ -8,6 +8,7 @@ from tqdm import tqdm
 import json
 import sys
 import argparse
+from safetensors_stream import LoraIndex, default_memory_budget, load_tensor, stream_lora_merge_shards
 
 # ===================================================================================
 # ---                           CONFIGURATION                                     ---
@@ -146,19 +147,16 @@ def get_base_model_vocab_tensors(base_model_path):
     embed_shard = weight_map.get("model.embed_tokens.weight")
     lm_head_shard = weight_map.get("lm_head.weight")
 
+    # Only the two tensors are read, not their whole shards.
     if embed_shard:
         shard_path = os.path.join(base_model_path, embed_shard)
-        shard = safetensors.torch.load_file(shard_path, device="cpu")
-        embed_tensor = shard.get("model.embed_tokens.weight")
-        if embed_tensor is not None:
-            print(f"Loaded base embed tensor, shape: {embed_tensor.shape}")
+        embed_tensor = load_tensor(shard_path, "model.embed_tokens.weight")
+        print(f"Loaded base embed tensor, shape: {embed_tensor.shape}")
 
     if lm_head_shard:
         shard_path = os.path.join(base_model_path, lm_head_shard)
-        shard = safetensors.torch.load_file(shard_path, device="cpu")
-        lm_head_tensor = shard.get("lm_head.weight")
-        if lm_head_tensor is not None:
-            print(f"Loaded base lm_head tensor, shape: {lm_head_tensor.shape}")
+        lm_head_tensor = load_tensor(shard_path, "lm_head.weight")
+        print(f"Loaded base lm_head tensor, shape: {lm_head_tensor.shape}")
 
     return embed_tensor, lm_head_tensor
 
@@ -190,8 +188,12 @@ def expand_vocab_tensor(tensor, current_vocab_size, new_vocab_size, tensor_name)
     print(f"Expanded {tensor_name} to shape: {expanded_tensor.shape}")
     return expanded_tensor
 
-def do_merge(base_model_path, lora_path, final_lora_path, output_path):
-    """Performs the full, robust, hybrid merge."""
+def do_merge(base_model_path, lora_path, final_lora_path, output_path, workers=1, memory_budget=None):
+    """
+    Performs the full, robust, hybrid merge. workers shards are merged at
+    once, as long as their estimated memory fits in memory_budget bytes
+    (default: half of the free memory).
+    """
     print("Starting HYBRID LoRA merge process (v-FINAL - with vocab expansion fix)...")
     os.makedirs(output_path, exist_ok=True)
 
@@ -317,26 +319,37 @@ def do_merge(base_model_path, lora_path, final_lora_path, output_path):
     if "model.embed_tokens.weight" in weight_map: vocab_shards.add(weight_map["model.embed_tokens.weight"])
     if "lm_head.weight" in weight_map: vocab_shards.add(weight_map["lm_head.weight"])
 
-    for shard_name in tqdm(base_model_shards, desc="Merging LoRA into shards"):
-        shard_path = os.path.join(base_model_path, shard_name)
-        shard = safetensors.torch.load_file(shard_path, device="cpu")
-        new_shard = {}
-
-        for key, tensor in shard.items():
-            if key not in ["model.embed_tokens.weight", "lm_head.weight"]:
-                new_shard[key] = tensor
-
-        keys_to_merge = [k for k in new_shard.keys() if f"base_model.model.{k}.lora_A.weight" in lora_state_dict]
-        for key in keys_to_merge:
-            lora_A = lora_state_dict[f"base_model.model.{key}.lora_A.weight"]
-            lora_B = lora_state_dict[f"base_model.model.{key}.lora_B.weight"]
-            scaling = lora_config.lora_alpha / lora_config.r
-            original_tensor = new_shard[key]
-            new_shard[key] = (original_tensor.to(torch.float32) + (lora_B.to(torch.float32) @ lora_A.to(torch.float32)) * scaling).to(original_tensor.dtype)
-
-        if new_shard:
-            output_shard_path = os.path.join(output_path, shard_name)
-            safetensors.torch.save_file(new_shard, output_shard_path, metadata={'format': 'pt'})
+    # Each shard is streamed one tensor at a time (see safetensors_stream): merged weights are written as they
+    # are computed and the rest is copied as is, so memory stays bounded by the largest tensor. The vocabulary
+    # tensors are left out and saved to their own shard below; a shard left empty isn't written.
+    # With several workers, shards overlap: one is read or written while another one's matmuls run.
+    vocab_keys = ("model.embed_tokens.weight", "lm_head.weight")
+    lora_index = LoraIndex.from_state_dict(lora_state_dict, lora_config)
+    shards_to_merge, passthrough_shards, missing_targets = lora_index.plan_shards(weight_map, skip=vocab_keys)
+    print(f"{len(lora_index)} LoRA weights to merge into {len(shards_to_merge)} shard(s); "
+          f"{len(passthrough_shards)} shard(s) are copied unchanged.")
+    if missing_targets:
+        print(f"WARNING: {len(missing_targets)} LoRA weights have no base tensor and are ignored, e.g. '{missing_targets[0]}'.")
+    if lora_index.module_form:
+        # Earlier versions of this script only matched '<weight>.lora_A.weight' keys and copied these weights unmerged.
+        print(f"Note: {lora_index.module_form} LoRA weights use PEFT's module-form keys ('q_proj.lora_A.weight') and are "
+              f"merged; versions before the streaming merge skipped them silently.")
+    if memory_budget is None:
+        memory_budget = default_memory_budget()
+    if workers > 1:
+        # The shards share the cores; each worker's matmuls get their slice of them.
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // workers))
+        budget_text = f"{memory_budget / 1024 ** 3:.1f} GB" if memory_budget else "no limit"
+        print(f"Merging with {workers} workers (memory budget: {budget_text}).")
+    # Merged shards first: they take the longest, the pass-through ones fill in around them.
+    shards = [(os.path.join(base_model_path, shard_name), os.path.join(output_path, shard_name))
+              for shard_name in base_model_shards if shard_name in shards_to_merge]
+    shards += [(os.path.join(base_model_path, shard_name), os.path.join(output_path, shard_name))
+               for shard_name in base_model_shards if shard_name not in shards_to_merge]
+    merged_shards = stream_lora_merge_shards(shards, lora_index, skip=vocab_keys, metadata={'format': 'pt'},
+                                             workers=workers, memory_budget=memory_budget)
+    for _ in tqdm(merged_shards, total=len(shards), desc="Merging LoRA into shards"):
+        pass
 
     # 7. Handle Vocab Expansion
     print("\n--- 7. Saving Vocabulary Tensors ---")
@@ -446,6 +459,12 @@ if __name__ == "__main__":
                         help="Optional: Path to the LoRA adapter with the final vocab/tokenizer. "
                              "If not provided, a standard merge is performed using the base model's vocabulary.")
 
+    # Merge performance
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Shards merged at the same time, so disk reads/writes and matmuls overlap (default: 1).")
+    parser.add_argument("--memory-budget", type=float, default=None,
+                        help="GB of RAM the shards in flight may use together (default: half of the free memory).")
+
     # Parse the arguments provided by the user
     args = parser.parse_args()
 
@@ -454,7 +473,9 @@ if __name__ == "__main__":
         base_model_path=args.base,
         lora_path=args.lora,
         final_lora_path=args.final,  # This will be None if the arg is not passed
-        output_path=args.out
+        output_path=args.out,
+        workers=args.workers,
+        memory_budget=int(args.memory_budget * 1024 ** 3) if args.memory_budget else None
     )
     
     # Call the verification function with the output path
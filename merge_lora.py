@@ -6,6 +6,7 @@ import os
 import shutil
 from tqdm import tqdm
 import json
+from safetensors_stream import LoraIndex, stream_lora_merge
 
 # --- Configuration ---
 # You can point this script at either type of LoRA adapter
@@ -97,26 +98,23 @@ weight_map = base_model_index["weight_map"]
 print("Loaded base model weight map.")
 
 # 5. Merge LoRA weights into base model shards
+# Shards are streamed one tensor at a time (see safetensors_stream), so memory stays bounded by the largest tensor.
 print("\n--- 5. Merging LoRA Deltas into Shards ---")
 base_model_shards = set(weight_map.values())
-for shard_name in tqdm(base_model_shards, desc="Merging LoRA into shards"):
+lora_index = LoraIndex.from_state_dict(lora_state_dict, lora_config)
+shards_to_merge, passthrough_shards, missing_targets = lora_index.plan_shards(weight_map)
+print(f"{len(lora_index)} LoRA weights to merge into {len(shards_to_merge)} shard(s); "
+      f"{len(passthrough_shards)} shard(s) are copied unchanged.")
+if missing_targets:
+    print(f"[WARNING] {len(missing_targets)} LoRA weights have no base tensor and are ignored, e.g. '{missing_targets[0]}'.")
+if lora_index.module_form:
+    # Earlier versions of this script only matched '<weight>.lora_A.weight' keys and copied these weights unmerged.
+    print(f"Note: {lora_index.module_form} LoRA weights use PEFT's module-form keys ('q_proj.lora_A.weight') and are "
+          f"merged; versions before the streaming merge skipped them silently.")
+for shard_name in tqdm(shards_to_merge + passthrough_shards, desc="Merging LoRA into shards"):
     shard_path = os.path.join(base_model_path, shard_name)
-    shard = safetensors.torch.load_file(shard_path, device="cpu")
-    new_shard = shard.copy()
-
-    keys_to_merge = [k for k in shard.keys() if f"base_model.model.{k}.lora_A.weight" in lora_state_dict]
-
-    for key in keys_to_merge:
-        original_tensor = shard[key]
-        lora_A = lora_state_dict[f"base_model.model.{key}.lora_A.weight"]
-        lora_B = lora_state_dict[f"base_model.model.{key}.lora_B.weight"]
-        scaling = lora_config.lora_alpha / lora_config.r
-        
-        merged_tensor = original_tensor.to(torch.float32) + (lora_B.to(torch.float32) @ lora_A.to(torch.float32)) * scaling
-        new_shard[key] = merged_tensor.to(original_tensor.dtype)
-
     output_shard_path = os.path.join(output_path, shard_name)
-    safetensors.torch.save_file(new_shard, output_shard_path, metadata={'format': 'pt'})
+    stream_lora_merge(shard_path, output_shard_path, lora_index, metadata={'format': 'pt'})
 
 # 6. Handle the full tensors (embed and lm_head) by saving to a new shard
 print("\n--- 6. Handling Full Tensors (e.g., Vocab Expansion) ---")
@@ -0,0 +1,500 @@
+# safetensors_stream.py
+"""
+Streams safetensors shards one tensor at a time.
+
+safetensors.torch.load_file / save_file hold a whole shard in memory, plus
+the merged copies, which costs several GB per shard on 70B models. Here the
+output file's header is written first, from the names, dtypes and shapes of
+the source shard, and the tensors follow one by one:
+- tensors that are merged are read with safe_open, passed through the merge
+  function and written straight to the output;
+- all other tensors are copied byte for byte from the source file, without
+  being deserialized: with os.copy_file_range (or sendfile) the bytes never
+  leave the kernel, and on a copy-on-write filesystem they aren't copied at
+  all.
+
+A shard with no tensor to merge or leave out is reflinked, hardlinked or
+copied whole, in that order of preference, instead of being rewritten.
+
+Peak memory is set by the largest single tensor, not by the size of the
+shard: merge_lora_weight works in float32 row blocks and never holds a full
+float32 copy of a weight.
+
+LoraIndex normalizes an adapter once (key variants, per-module scales) and
+tells which shards need merging before any of them is read.
+
+The header functions only need the standard library; torch and safetensors
+are needed once tensors are merged.
+"""
+import errno
+import json
+import math
+import os
+import re
+import shutil
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
+
+try:
+    import torch
+except ImportError:  # only needed to merge tensors (pip install torch)
+    torch = None
+
+try:
+    from safetensors import safe_open
+except ImportError:  # only needed to merge tensors (pip install safetensors)
+    safe_open = None
+
+COPY_CHUNK = 64 * 1024 * 1024  # Bytes per copy call for tensors that aren't merged
+MERGE_BLOCK_BYTES = 64 * 1024 * 1024  # float32 rows merged at a time (see merge_lora_weight)
+FICLONE = 0x40049409  # Linux ioctl that reflinks a whole file (btrfs, XFS, bcachefs)
+# errnos that mean "this copy method isn't supported here", as opposed to a real I/O error.
+_UNSUPPORTED_COPY_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP,
+                            errno.EBADF, errno.ENOTSOCK}
+DTYPE_SIZES = {
+    "BOOL": 1, "U8": 1, "I8": 1, "F8_E4M3": 1, "F8_E5M2": 1,
+    "I16": 2, "U16": 2, "F16": 2, "BF16": 2,
+    "I32": 4, "U32": 4, "F32": 4,
+    "I64": 8, "U64": 8, "F64": 8,
+}
+# safetensors dtype names of the torch dtypes (the float8 types only exist in recent torch versions).
+_TORCH_DTYPE_NAMES = {
+    "bool": "BOOL", "uint8": "U8", "int8": "I8", "float8_e4m3fn": "F8_E4M3", "float8_e5m2": "F8_E5M2",
+    "int16": "I16", "float16": "F16", "bfloat16": "BF16", "int32": "I32", "float32": "F32",
+    "int64": "I64", "float64": "F64",
+}
+
+
+def read_header(path):
+    """
+    Returns (tensors, metadata, data_start) for a safetensors file. tensors
+    maps each name to {"dtype", "shape", "data_offsets"}, in file order;
+    offsets are relative to data_start.
+    """
+    with open(path, 'rb') as f:
+        header_size = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(header_size))
+    metadata = header.pop("__metadata__", None)
+    tensors = dict(sorted(header.items(), key=lambda item: item[1]["data_offsets"][0]))
+    return tensors, metadata, 8 + header_size
+
+
+def _tensor_nbytes(dtype, shape):
+    count = 1
+    for dim in shape:
+        count *= dim
+    return count * DTYPE_SIZES[dtype]
+
+
+def _torch_dtype_name(tensor):
+    return _TORCH_DTYPE_NAMES.get(str(tensor.dtype).replace("torch.", ""))
+
+
+def _copy_range(source, dest, offset, size):
+    """
+    Copies size bytes at offset of file source to the current position of
+    file dest (both unbuffered or flushed), inside the kernel when the OS
+    supports it: os.copy_file_range, then os.sendfile, then read/write.
+    """
+    source_fd, dest_fd = source.fileno(), dest.fileno()
+    methods = [name for name in ("copy_file_range", "sendfile") if hasattr(os, name)]
+    while size:
+        count = min(COPY_CHUNK, size)
+        if methods:
+            try:
+                if methods[0] == "copy_file_range":
+                    copied = os.copy_file_range(source_fd, dest_fd, count, offset)
+                else:
+                    copied = os.sendfile(dest_fd, source_fd, offset, count)
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED_COPY_ERRNOS:
+                    raise
+                methods.pop(0)
+                continue
+        else:
+            source.seek(offset)
+            chunk = source.read(count)
+            _write_all(dest, chunk)
+            copied = len(chunk)
+        if not copied:
+            raise ValueError("Source file ends in the middle of a tensor.")
+        offset += copied
+        size -= copied
+
+
+def _write_all(file, data):
+    # An unbuffered write can stop short; Linux writes at most about 2 GB per call.
+    view = memoryview(data).cast('B')
+    while view:
+        view = view[file.write(view):]
+
+
+def _tensor_buffer(tensor):
+    """The raw little-endian bytes of a CPU tensor, as a buffer that shares the tensor's memory."""
+    return tensor.detach().contiguous().reshape(-1).view(torch.uint8).numpy()
+
+
+class SafetensorsWriter:
+    """
+    Writes a safetensors file tensor by tensor. The header is built up front
+    from entries, a list of (name, dtype, shape) with safetensors dtype names;
+    the tensors must then be written in that order. The file is written under
+    a temporary name and only renamed into place by close(), so an
+    interrupted write never leaves a truncated shard behind.
+    """
+
+    def __init__(self, path, entries, metadata=None):
+        self.path = str(path)
+        self._entries = list(entries)
+        header = {}
+        offset = 0
+        for name, dtype, shape in self._entries:
+            size = _tensor_nbytes(dtype, shape)
+            header[name] = {"dtype": dtype, "shape": list(shape), "data_offsets": [offset, offset + size]}
+            offset += size
+        if metadata:
+            header["__metadata__"] = {str(key): str(value) for key, value in metadata.items()}
+        header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+        # The data has to start on an 8-byte boundary; the header is padded with spaces like safetensors does.
+        header_bytes += b' ' * (-len(header_bytes) % 8)
+        self._sizes = [_tensor_nbytes(dtype, shape) for _, dtype, shape in self._entries]
+        self._next = 0
+        self._tmp_path = self.path + ".tmp"
+        # Unbuffered, so copy_tensor's kernel copies and the regular writes share one file position.
+        self._file = open(self._tmp_path, 'wb', buffering=0)
+        _write_all(self._file, struct.pack('<Q', len(header_bytes)) + header_bytes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _start(self, name):
+        """Checks that name is the next tensor of the header; returns its index."""
+        if self._next >= len(self._entries) or self._entries[self._next][0] != name:
+            expected = self._entries[self._next][0] if self._next < len(self._entries) else None
+            raise ValueError(f"Tensor '{name}' written out of order (expected '{expected}').")
+        self._next += 1
+        return self._next - 1
+
+    def write_tensor(self, name, tensor):
+        """Writes the next tensor; its dtype and shape must match its header entry."""
+        index = self._start(name)
+        _, dtype, shape = self._entries[index]
+        if _torch_dtype_name(tensor) != dtype or list(tensor.shape) != list(shape):
+            raise ValueError(f"Tensor '{name}' is {tensor.dtype} {list(tensor.shape)}, "
+                             f"but the header declares {dtype} {list(shape)}.")
+        if self._sizes[index]:
+            _write_all(self._file, _tensor_buffer(tensor))
+
+    def copy_tensor(self, name, source, offset):
+        """Writes the next tensor by copying its bytes from source (an open binary file) at offset."""
+        size = self._sizes[self._start(name)]
+        try:
+            _copy_range(source, self._file, offset, size)
+        except ValueError:
+            raise ValueError(f"Source file ends in the middle of tensor '{name}'.") from None
+
+    def close(self):
+        if self._file is None:
+            return
+        if self._next != len(self._entries):
+            self.abort()
+            raise ValueError(f"Only {self._next} of {len(self._entries)} tensors were written to {self.path}.")
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        """Closes and deletes the incomplete file."""
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+def load_tensor(path, name):
+    """Loads one tensor from a safetensors file without reading the rest of it."""
+    if safe_open is None:
+        raise ImportError("Reading tensors requires safetensors (pip install safetensors).")
+    with safe_open(path, framework="pt", device="cpu") as f:
+        return f.get_tensor(name)
+
+
+def link_or_copy(src, dst):
+    """
+    Puts a copy of file src at dst: a reflink if the filesystem supports
+    them, else a hardlink, else a plain copy. Returns the method used.
+    """
+    tmp_path = str(dst) + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        import fcntl
+        with open(src, 'rb') as source, open(tmp_path, 'wb') as dest:
+            fcntl.ioctl(dest.fileno(), FICLONE, source.fileno())
+        method = "reflink"
+    except (ImportError, OSError):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            # A hardlink shares the base model's inode; the tools here only ever replace shards, never edit them.
+            os.link(src, tmp_path)
+            method = "hardlink"
+        except OSError:
+            shutil.copyfile(src, tmp_path)
+            method = "copy"
+    os.replace(tmp_path, dst)
+    if os.path.lexists(tmp_path):
+        # dst was already a hardlink to src (a re-run into the same folder): rename() leaves both names in place.
+        os.remove(tmp_path)
+    return method
+
+
+def stream_shard(src, dst, transform=None, transformed=(), skip=(), metadata=None, link_untouched=True):
+    """
+    Writes safetensors file src to dst one tensor at a time, in src's order.
+    Tensors named in transformed are loaded and replaced by
+    transform(name, tensor), which must keep their dtype and shape; the
+    others are copied byte for byte. Tensors named in skip are left out, and
+    nothing is written if no tensor is left. metadata replaces src's header
+    metadata if given. If no tensor is transformed or skipped and the
+    metadata is unchanged, dst is linked to src (see link_or_copy) unless
+    link_untouched is False. Returns the names written to dst.
+    """
+    tensors, source_metadata, data_start = read_header(src)
+    names = [name for name in tensors if name not in skip]
+    if not names:
+        return []
+    to_transform = [name for name in names if name in transformed]
+    if (link_untouched and not to_transform and len(names) == len(tensors)
+            and (metadata is None or metadata == source_metadata)):
+        link_or_copy(src, dst)
+        return names
+    if to_transform and (safe_open is None or torch is None):
+        raise ImportError("Merging tensors requires torch and safetensors (pip install torch safetensors).")
+
+    entries = [(name, tensors[name]["dtype"], tensors[name]["shape"]) for name in names]
+    reader_context = safe_open(src, framework="pt", device="cpu") if to_transform else nullcontext()
+    with reader_context as reader, open(src, 'rb', buffering=0) as source, \
+            SafetensorsWriter(dst, entries, metadata or source_metadata) as writer:
+        for name in names:
+            if name in transformed:
+                writer.write_tensor(name, transform(name, reader.get_tensor(name)))
+            else:
+                writer.copy_tensor(name, source, data_start + tensors[name]["data_offsets"][0])
+    return names
+
+
+def merge_lora_weight(weight, lora_A, lora_B, scaling, out=None, block_bytes=MERGE_BLOCK_BYTES):
+    """
+    weight + scaling * (lora_B @ lora_A), computed in float32 and returned in
+    weight's dtype, one block of rows at a time: each block is upcast into a
+    float32 buffer, the rank-r product of its rows of lora_B with lora_A is
+    added with addmm_ and the result is cast back into out (a new tensor
+    like weight by default; out=weight merges in place). Besides out, memory
+    use is one block_bytes buffer instead of three float32 copies of weight.
+    """
+    if out is None:
+        out = torch.empty(weight.shape, dtype=weight.dtype)
+    rows = weight.shape[0]
+    weight_rows = weight.reshape(rows, -1)
+    out_rows = out.view(rows, -1)
+    cols = weight_rows.shape[1]
+    lora_A = lora_A.to(torch.float32).reshape(lora_A.shape[0], -1)
+    lora_B = lora_B.to(torch.float32).reshape(rows, -1)
+    if lora_A.shape[1] != cols or lora_B.shape[1] != lora_A.shape[0]:
+        raise ValueError(f"LoRA shapes {list(lora_B.shape)} @ {list(lora_A.shape)} don't match weight {list(weight.shape)}.")
+    block_rows = max(1, min(rows, block_bytes // (4 * max(cols, 1))))
+    buffer = torch.empty(block_rows, cols, dtype=torch.float32)
+    for start in range(0, rows, block_rows):
+        end = min(start + block_rows, rows)
+        block = buffer[:end - start]
+        block.copy_(weight_rows[start:end])
+        block.addmm_(lora_B[start:end], lora_A, alpha=scaling)
+        out_rows[start:end].copy_(block)
+    return out
+
+
+# PEFT adapter keys: an optional base_model.model. prefix, the module path, lora_A or lora_B, an optional adapter
+# name (".default") and .weight. Older adapters put the base weight's full name (ending in .weight) before lora_A.
+LORA_KEY_PATTERN = re.compile(r"^(?:base_model\.model\.)?(?P<module>.+?)\.lora_(?P<part>[AB])(?:\.(?P<adapter>[^.]+))?\.weight$")
+
+
+def _config_value(lora_config, key, default=None):
+    # LoraConfig.from_json_file returns the plain dict; LoraConfig objects have attributes.
+    if isinstance(lora_config, dict):
+        value = lora_config.get(key)
+    else:
+        value = getattr(lora_config, key, None)
+    return default if value is None else value
+
+
+def _pattern_value(patterns, module, default):
+    """PEFT's rank_pattern/alpha_pattern lookup: a key matches the module's full name or a dotted suffix of it."""
+    for key, value in patterns.items():
+        if module == key or re.match(rf"(?:.*\.)?{key}$", module):
+            return value
+    return default
+
+
+class LoraIndex:
+    """
+    A LoRA adapter normalized once, before any shard is read: maps each base
+    weight name to (lora_A, lora_B, scale). Key prefixes, adapter names and
+    PEFT's rank_pattern, alpha_pattern and use_rslora are resolved here.
+    module_form counts the weights whose keys name the module
+    ("...q_proj.lora_A.weight", PEFT's layout) rather than the base weight
+    ("...q_proj.weight.lora_A.weight"); the merge scripts only looked up the
+    latter before, and left module-form weights unmerged.
+    """
+
+    def __init__(self, entries, module_form=0):
+        self.entries = entries
+        self.module_form = module_form
+
+    @classmethod
+    def from_state_dict(cls, lora_state_dict, lora_config, adapter_name="default"):
+        pairs = {}
+        for key, tensor in lora_state_dict.items():
+            match = LORA_KEY_PATTERN.match(key)
+            if match is None or match["adapter"] not in (None, adapter_name):
+                continue
+            pairs.setdefault(match["module"], {})[match["part"]] = tensor
+
+        r = _config_value(lora_config, "r", 8)
+        alpha = _config_value(lora_config, "lora_alpha", 8)
+        rank_pattern = _config_value(lora_config, "rank_pattern", {})
+        alpha_pattern = _config_value(lora_config, "alpha_pattern", {})
+        use_rslora = _config_value(lora_config, "use_rslora", False)
+        entries = {}
+        module_form = 0
+        for module, pair in pairs.items():
+            if "A" not in pair or "B" not in pair:
+                raise ValueError(f"LoRA module '{module}' has lora_{'A' if 'A' not in pair else 'B'} missing.")
+            name = module if module.endswith(".weight") else module + ".weight"
+            module_form += name != module
+            module = name[:-len(".weight")]
+            rank = _pattern_value(rank_pattern, module, r)
+            module_alpha = _pattern_value(alpha_pattern, module, alpha)
+            scale = module_alpha / math.sqrt(rank) if use_rslora else module_alpha / rank
+            entries[name] = (pair["A"], pair["B"], scale)
+        return cls(entries, module_form)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def merge(self, name, weight):
+        """The merged weight of base tensor name."""
+        lora_A, lora_B, scale = self.entries[name]
+        return merge_lora_weight(weight, lora_A, lora_B, scale)
+
+    def plan_shards(self, weight_map, skip=()):
+        """
+        Splits the shards of an index's weight_map before any is read:
+        returns (shards to merge, shards passed through unchanged, base
+        weights the adapter targets that no shard holds).
+        """
+        to_merge = {weight_map[name] for name in self.entries if name in weight_map}
+        # A shard that loses a skipped tensor is rewritten too, but without merging anything.
+        rewritten = {weight_map[name] for name in skip if name in weight_map}
+        passthrough = set(weight_map.values()) - to_merge - rewritten
+        missing = sorted(name for name in self.entries if name not in weight_map)
+        return sorted(to_merge), sorted(passthrough), missing
+
+
+def stream_lora_merge(src, dst, lora_index, skip=(), metadata=None):
+    """
+    Streams base shard src to dst, merging the deltas of lora_index (a
+    LoraIndex) into their weights one tensor at a time. Returns (names
+    written, names merged).
+    """
+    names = stream_shard(src, dst, lora_index.merge, lora_index, skip, metadata)
+    return names, [name for name in names if name in lora_index]
+
+
+def merge_memory_estimate(src, lora_index):
+    """
+    Peak bytes stream_lora_merge needs for shard src: its largest merged
+    tensor as loaded and merged, plus merge_lora_weight's float32 block.
+    Copied tensors cost next to nothing.
+    """
+    tensors, _, _ = read_header(src)
+    peak = 0
+    for name, info in tensors.items():
+        if name in lora_index:
+            peak = max(peak, 2 * _tensor_nbytes(info["dtype"], info["shape"]) + MERGE_BLOCK_BYTES)
+    return peak
+
+
+def default_memory_budget():
+    """Half of the physical memory that is free right now, or None where that can't be read."""
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // 2
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+class MemoryBudget:
+    """
+    Admits work while the memory estimates of everything in flight add up
+    to at most budget bytes. A job larger than the whole budget waits until
+    nothing else runs, then runs alone.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.in_use = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def reserve(self, nbytes):
+        nbytes = min(nbytes, self.budget)
+        with self._condition:
+            self._condition.wait_for(lambda: self.in_use + nbytes <= self.budget)
+            self.in_use += nbytes
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.in_use -= nbytes
+                self._condition.notify_all()
+
+
+def stream_lora_merge_shards(shards, lora_index, skip=(), metadata=None, workers=1, memory_budget=None):
+    """
+    Runs stream_lora_merge over shards, a list of (src, dst), on a pool of
+    worker threads, so reading, merging and writing overlap across shards:
+    torch's matmuls and the file copies release the GIL. A shard only starts
+    when its merge_memory_estimate fits in memory_budget (bytes, None for no
+    limit) next to the shards in flight. Yields (src, names written, names
+    merged) as shards finish.
+    """
+    budget = MemoryBudget(memory_budget) if memory_budget else None
+
+    def merge_shard(src, dst):
+        reservation = budget.reserve(merge_memory_estimate(src, lora_index)) if budget else nullcontext()
+        with reservation:
+            names, merged = stream_lora_merge(src, dst, lora_index, skip, metadata)
+        return src, names, merged
+
+    if workers <= 1:
+        for src, dst in shards:
+            yield merge_shard(src, dst)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(merge_shard, src, dst) for src, dst in shards]
+        for future in as_completed(futures):
+            yield future.result()